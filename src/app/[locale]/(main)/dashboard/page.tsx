@@ -9,7 +9,9 @@ import ArrowExpand from '@/components/Icons/ArrowExpand';
 import Info from '@/components/Icons/Info';
 import { useTranslations } from 'next-intl';
 import { useDashboardStore } from '@/app/stores/dashboardStore';
-import jsonData from '@/python-server/german_credit_umap_with_counterfactuals.json';
+// Per-run delta with the user and counterfactual points; the training layer it references
+// is not shown, but the filter ranges cover it
+import { fetchRunDelta, fetchTrainingLayer } from '@/utils/runData';
 import { GRAPH_COLORS } from '@/utils/colors';
 
 // Helper to map categorical values to numbers
@@ -73,6 +75,7 @@ const DashboardPage = () => {
 	const setFilterRanges = useDashboardStore((state) => state.setFilterRanges);
 	const resetFilters = useDashboardStore((state) => state.resetFilters);
 	const onlyImproved = useDashboardStore((state) => state.onlyImproved);
+	const runId = useDashboardStore((state) => state.runId);
 
 	useEffect(() => {
 		const loadDashboardData = async () => {
@@ -81,10 +84,17 @@ const DashboardPage = () => {
 
 				// Try to load the dynamically generated UMAP data (with counterfactuals and user data)
 				let rawData: CreditData[];
+				let trainingData: CreditData[];
 				let hasUserData = false;
 
 				try {
-					const dynamicData = (await jsonData) as CreditData[];
+					if (!runId) {
+						throw new Error('No pipeline run - user must submit an application first');
+					}
+					const delta = await fetchRunDelta(runId);
+					const dynamicData = delta.points;
+					// Immutable and shared by all runs of the same model, so fetched once per session
+					trainingData = await fetchTrainingLayer(delta.training);
 
 					// Check if there's actual user data in the dynamic file
 					hasUserData = dynamicData.some(
@@ -213,8 +223,8 @@ const DashboardPage = () => {
 				dataRef.current = transformedData;
 				setData(transformedData);
 
-				// Calculate min/max for each numerical filter
-				const features = rawData.map((item) => item.features);
+				// Calculate min/max for each numerical filter over the training and the run's points
+				const features = [...trainingData, ...rawData].map((item) => item.features);
 				const getMinMax = (key: keyof (typeof features)[0]) => {
 					const values = features
 						.map((f) => f[key])
@@ -236,7 +246,7 @@ const DashboardPage = () => {
 		};
 
 		loadDashboardData();
-	}, [setFilterRanges, resetFilters]);
+	}, [runId, setFilterRanges, resetFilters]);
 
 	//#region functions
 	const handleScenarioSelect = useCallback((scenario: CreditData) => {
@@ -17,6 +17,15 @@ export interface CreditData {
 	risk: number | 'good' | 'bad'; // Probability (0-1)
 	counterfactual?: boolean; // Accept both for compatibility
 	data_type?: string; // Optional, for user/counterfactual identification
+	diff?: CounterfactualDiff; // Counterfactual points only: comparison with the user's profile
+}
+
+// Precomputed by the pipeline (src/python-server/counterfactual_diff.py)
+export interface CounterfactualDiff {
+	changed: (keyof CreditData['features'])[];
+	deltas: Partial<Record<'age' | 'credit_amount' | 'duration' | 'job', number>>;
+	feature_distance?: number; // In the preprocessed feature space UMAP was fitted in
+	embedding_distance: number; // In the UMAP space
 }
 
 export interface LikedScenario {
@@ -1,9 +1,9 @@
 'use client';
 
-import React, { ButtonHTMLAttributes, DetailedHTMLProps, FC } from 'react';
+import React, { ButtonHTMLAttributes, DetailedHTMLProps, FC, useEffect, useState } from 'react';
 import LikedScenarioCard from '@/components/LikedScenarioCard';
 import { CreditData, LikedScenario } from '@/app/[locale]/(main)/dashboard/types';
-import jsonData from '@/python-server/german_credit_umap_with_counterfactuals.json';
+import { fetchRunDelta } from '@/utils/runData';
 import { useDashboardStore } from '@/app/stores/dashboardStore';
 import Slider, { Settings } from 'react-slick';
 import 'slick-carousel/slick/slick.css';
@@ -75,10 +75,18 @@ const SavedScenariosPage: React.FC = () => {
 	const t = useTranslations('saved-scenarios-page');
 	const likedScenarios = useDashboardStore((state) => state.likedScenarios);
 	const removeLikedScenario = useDashboardStore((state) => state.removeLikedScenario);
-	const userProfile = jsonData.find((item) => item.data_type === 'user') as CreditData;
+	const runId = useDashboardStore((state) => state.runId);
+	const [userProfile, setUserProfile] = useState<CreditData | null>(null);
+
+	useEffect(() => {
+		if (!runId) return;
+		fetchRunDelta(runId)
+			.then((delta) => setUserProfile(delta.points.find((item) => item.data_type === 'user') ?? null))
+			.catch((error) => console.error('Failed to load the user profile:', error));
+	}, [runId]);
 
 	const renderSavedScenarios = () => {
-		if (likedScenarios.length === 0) {
+		if (likedScenarios.length === 0 || !userProfile) {
 			return (
 				<div className="flex size-full items-center justify-center">
 					<p>{t('no_saved_scenarios', { default: 'You have not saved any scenarios!' })}</p>
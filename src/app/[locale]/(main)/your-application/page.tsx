@@ -5,6 +5,7 @@ import { useForm, SubmitHandler, FieldValues } from 'react-hook-form';
 import LockClosed from '@/components/Icons/LockClosed';
 import LockOpen from '@/components/Icons/LockOpen';
 import { useTranslations } from 'next-intl';
+import { useDashboardStore } from '@/app/stores/dashboardStore';
 
 interface Field {
 	key: string;
@@ -16,6 +17,7 @@ interface Field {
 
 const YourApplicationPage = () => {
 	const router = useRouter();
+	const setRunId = useDashboardStore((state) => state.setRunId);
 	const t = useTranslations('your_application_page');
 
 	// Field definitions using t for labels
@@ -195,6 +197,11 @@ const YourApplicationPage = () => {
 				console.log('First counterfactual example:', result.result[0]);
 			}
 
+			// The dashboard loads this run's points
+			if (result.success && result.runId) {
+				setRunId(result.runId);
+			}
+
 			// Redirect to dashboard after successful completion
 			console.log('Redirecting to dashboard...');
 			router.push('/dashboard');
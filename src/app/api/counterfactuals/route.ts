@@ -1,7 +1,10 @@
 import { NextRequest, NextResponse } from 'next/server';
 import { spawn } from 'child_process';
+import { createHash, randomUUID } from 'crypto';
 import fs from 'fs';
 import path from 'path';
+import readline from 'readline';
+import { embeddingWorker, PipelineEvent, PipelineRunOptions, WorkerJobError } from '@/lib/embeddingWorker';
 
 // Helper function for visible logging (updated to force recompilation)
 const log = (message: string, data?: unknown) => {
@@ -35,6 +38,177 @@ function flattenObject(
 	return res;
 }
 
+type StreamMessage = PipelineEvent | { event: 'counterfactuals_generated' | 'result'; [field: string]: unknown };
+
+// Fallback: run the UMAP pipeline as a one-shot Python process
+async function runOneShotPipeline(
+	{ runId, counterfactuals, user, engine }: PipelineRunOptions,
+	onEvent?: (event: PipelineEvent) => void,
+) {
+	try {
+		const pythonScriptPath = path.resolve('src/python-server/run_umap_pipeline.py');
+		const pythonArgs = [pythonScriptPath];
+		if (runId) pythonArgs.push('--run-id', runId);
+		if (counterfactuals) pythonArgs.push('--counterfactuals', counterfactuals);
+		if (user) pythonArgs.push('--user', user);
+		if (engine) pythonArgs.push('--engine', engine);
+		// With --stream stdout carries only NDJSON events; the logs go to stderr
+		if (onEvent) pythonArgs.push('--stream');
+		const pythonResult = await new Promise((resolve, reject) => {
+			const pythonProc = spawn('python3', pythonArgs);
+			let pythonStdout = '';
+			let pythonStderr = '';
+
+			if (onEvent) {
+				readline.createInterface({ input: pythonProc.stdout }).on('line', (line) => {
+					try {
+						onEvent(JSON.parse(line));
+					} catch {
+						log('Python pipeline wrote a line that is not an event', { line });
+					}
+				});
+			} else {
+				pythonProc.stdout.on('data', (data) => {
+					const output = data.toString();
+					log('Python pipeline stdout', { output });
+					pythonStdout += output;
+				});
+			}
+
+			pythonProc.stderr.on('data', (data) => {
+				const error = data.toString();
+				log('Python pipeline stderr', { error });
+				pythonStderr += error;
+			});
+
+			pythonProc.on('close', (code) => {
+				log('Python pipeline process exited', { code });
+				if (code === 0) {
+					resolve(pythonStdout);
+				} else {
+					reject(pythonStderr || 'Python pipeline failed');
+				}
+			});
+		});
+
+		log('UMAP pipeline completed successfully', { pythonResult });
+	} catch (pythonError) {
+		log('Warning: UMAP pipeline failed, but counterfactuals were generated successfully', {
+			error: pythonError?.toString(),
+		});
+		// Don't fail the entire request if UMAP generation fails
+	}
+}
+
+// Generates the counterfactuals with the R script and places them in the UMAP space.
+// onEvent receives the progress events of the run, including the points as they are projected.
+async function generateCounterfactuals(
+	csvHeader: string,
+	csvRow: string,
+	locked: string[],
+	onEvent?: (message: StreamMessage) => void,
+) {
+	// Every request gets its own run id so concurrent requests never share files
+	const runId = randomUUID();
+	const runResultsDir = path.resolve('src/r-server/results/runs', runId);
+	const tempInputPath = path.join('/tmp', `input_${runId}.csv`);
+	fs.writeFileSync(tempInputPath, `${csvHeader}\n${csvRow}\n`);
+	log('Created temporary input file', { path: tempInputPath });
+
+	// Write locked features to a temp file
+	const tempLockedPath = path.join('/tmp', `locked_${runId}.txt`);
+	fs.writeFileSync(tempLockedPath, locked.join(','));
+	log('Created temporary locked features file', { path: tempLockedPath });
+
+	// Call the R script with the input and locked files as arguments
+	const rScriptPath = path.resolve('src/r-server/scripts/german_credit_application.R');
+	const args = [rScriptPath, tempInputPath, tempLockedPath, runResultsDir];
+	log('Executing R script', { script: rScriptPath, args });
+
+	const result = await new Promise((resolve, reject) => {
+		const proc = spawn('Rscript', args);
+		let stdout = '';
+		let stderr = '';
+
+		proc.stdout.on('data', (data) => {
+			const output = data.toString();
+			log('R script stdout', { output });
+			stdout += output;
+		});
+
+		proc.stderr.on('data', (data) => {
+			const error = data.toString();
+			log('R script stderr', { error });
+			stderr += error;
+		});
+
+		proc.on('close', (code) => {
+			log('R script process exited', { code });
+			if (code === 0) {
+				resolve(stdout);
+			} else {
+				reject(stderr || 'R script failed');
+			}
+		});
+	});
+
+	// Clean up temp files
+	fs.unlinkSync(tempInputPath);
+	fs.unlinkSync(tempLockedPath);
+	log('Cleaned up temporary files');
+	onEvent?.({ event: 'counterfactuals_generated', runId });
+
+	// After successful counterfactual generation, run the UMAP pipeline
+	log('Starting UMAP data generation pipeline');
+	const pipelineRun: PipelineRunOptions = {
+		runId,
+		counterfactuals: path.join(runResultsDir, 'results.csv'),
+		user: path.join(runResultsDir, 'user.csv'),
+		// Same features and locked set: identical in-flight submissions share one run
+		key: createHash('sha256').update(JSON.stringify({ csvRow, locked })).digest('hex'),
+		// PROJECTION_ENGINE=surrogate trades placement accuracy for speed (see surrogate_projector.py)
+		engine: process.env.PROJECTION_ENGINE === 'surrogate' ? 'surrogate' : 'umap',
+	};
+	// Run whose directory holds the output (served by /api/runs/<runId>)
+	let outputRunId = runId;
+	// Once the client has events of this run, a one-shot rerun would send its points again
+	let eventsSent = false;
+	let runEnded = false;
+	const onPipelineEvent =
+		onEvent &&
+		((event: PipelineEvent) => {
+			eventsSent = true;
+			if (event.event === 'done' || event.event === 'error') runEnded = true;
+			onEvent(event);
+		});
+	try {
+		const workerResult = await embeddingWorker.runPipeline(pipelineRun, onPipelineEvent);
+		log('UMAP pipeline completed in embedding worker', { workerResult });
+		// A coalesced submission shares the output of the run it was merged into
+		if (typeof workerResult.run_id === 'string') outputRunId = workerResult.run_id;
+	} catch (workerError) {
+		if (eventsSent) {
+			log('UMAP pipeline failed after streaming its first events', { error: workerError?.toString() });
+			if (!runEnded) onEvent?.({ event: 'error', run_id: runId, error: String(workerError) });
+		} else if (workerError instanceof WorkerJobError && workerError.status) {
+			// The worker is overloaded or gave up; a one-shot process would only add load
+			log('UMAP pipeline skipped by the embedding worker queue', {
+				status: workerError.status,
+				error: workerError.message,
+			});
+		} else {
+			log('Embedding worker unavailable, falling back to one-shot pipeline', {
+				error: workerError?.toString(),
+			});
+			await runOneShotPipeline(pipelineRun, onEvent);
+		}
+	}
+	// The pipeline has consumed this run's R results
+	fs.rmSync(runResultsDir, { recursive: true, force: true });
+
+	return { result, runId: outputRunId };
+}
+
 export async function POST(req: NextRequest) {
 	try {
 		log('Received counterfactuals API request');
@@ -97,93 +271,34 @@ export async function POST(req: NextRequest) {
 		const csvRow = csvRowArr.join(',');
 		log('CSV header:', csvHeader);
 		log('CSV row:', csvRow);
-		const tempInputPath = path.join('/tmp', `input_${Date.now()}.csv`);
-		fs.writeFileSync(tempInputPath, `${csvHeader}\n${csvRow}\n`);
-		log('Created temporary input file', { path: tempInputPath });
-
-		// Write locked features to a temp file
-		const tempLockedPath = path.join('/tmp', `locked_${Date.now()}.txt`);
-		fs.writeFileSync(tempLockedPath, locked.join(','));
-		log('Created temporary locked features file', { path: tempLockedPath });
-
-		// Call the R script with the input and locked files as arguments
-		const rScriptPath = path.resolve('src/r-server/scripts/german_credit_application.R');
-		const args = [rScriptPath, tempInputPath, tempLockedPath];
-		log('Executing R script', { script: rScriptPath, args });
-
-		const result = await new Promise((resolve, reject) => {
-			const proc = spawn('Rscript', args);
-			let stdout = '';
-			let stderr = '';
-
-			proc.stdout.on('data', (data) => {
-				const output = data.toString();
-				log('R script stdout', { output });
-				stdout += output;
-			});
-
-			proc.stderr.on('data', (data) => {
-				const error = data.toString();
-				log('R script stderr', { error });
-				stderr += error;
-			});
-
-			proc.on('close', (code) => {
-				log('R script process exited', { code });
-				if (code === 0) {
-					resolve(stdout);
-				} else {
-					reject(stderr || 'R script failed');
-				}
-			});
-		});
-
-		// Clean up temp files
-		fs.unlinkSync(tempInputPath);
-		fs.unlinkSync(tempLockedPath);
-		log('Cleaned up temporary files');
-
-		// After successful counterfactual generation, run the UMAP pipeline
-		log('Starting UMAP data generation pipeline');
-		try {
-			const pythonScriptPath = path.resolve('src/python-server/run_umap_pipeline.py');
-			const pythonResult = await new Promise((resolve, reject) => {
-				const pythonProc = spawn('python3', [pythonScriptPath]);
-				let pythonStdout = '';
-				let pythonStderr = '';
-
-				pythonProc.stdout.on('data', (data) => {
-					const output = data.toString();
-					log('Python pipeline stdout', { output });
-					pythonStdout += output;
-				});
-
-				pythonProc.stderr.on('data', (data) => {
-					const error = data.toString();
-					log('Python pipeline stderr', { error });
-					pythonStderr += error;
-				});
-
-				pythonProc.on('close', (code) => {
-					log('Python pipeline process exited', { code });
-					if (code === 0) {
-						resolve(pythonStdout);
-					} else {
-						reject(pythonStderr || 'Python pipeline failed');
+		// Streaming clients (body.stream or Accept: application/x-ndjson) get the run as NDJSON:
+		// progress events and points as they are projected, then a final 'result' message
+		const streaming = body.stream === true || req.headers.get('accept')?.includes('application/x-ndjson');
+		if (streaming) {
+			const encoder = new TextEncoder();
+			const stream = new ReadableStream({
+				async start(controller) {
+					const send = (message: StreamMessage) =>
+						controller.enqueue(encoder.encode(JSON.stringify(message) + '\n'));
+					try {
+						const { result, runId } = await generateCounterfactuals(csvHeader, csvRow, locked, send);
+						log('Counterfactuals generation completed successfully', { result });
+						send({ event: 'result', success: true, result, runId });
+					} catch (error) {
+						log('Error in counterfactuals API', { error: error?.toString() });
+						send({ event: 'result', success: false, error: error?.toString() });
 					}
-				});
+					controller.close();
+				},
 			});
-
-			log('UMAP pipeline completed successfully', { pythonResult });
-		} catch (pythonError) {
-			log('Warning: UMAP pipeline failed, but counterfactuals were generated successfully', {
-				error: pythonError?.toString(),
+			return new Response(stream, {
+				headers: { 'Content-Type': 'application/x-ndjson', 'Cache-Control': 'no-cache' },
 			});
-			// Don't fail the entire request if UMAP generation fails
 		}
 
+		const { result, runId } = await generateCounterfactuals(csvHeader, csvRow, locked);
 		log('Counterfactuals generation completed successfully', { result });
-		return NextResponse.json({ success: true, result });
+		return NextResponse.json({ success: true, result, runId });
 	} catch (error) {
 		log('Error in counterfactuals API', { error: error?.toString() });
 		return NextResponse.json({ success: false, error: error?.toString() });
@@ -0,0 +1,30 @@
+import { NextRequest, NextResponse } from 'next/server';
+import fs from 'fs/promises';
+import path from 'path';
+
+// Serves the user and counterfactual points of one pipeline run: the delta written to
+// src/python-server/runs/<runId>/ (see generate_umap_with_counterfactuals.write_delta),
+// so every user sees their own result instead of the last published one.
+
+const RUNS_DIR = path.resolve('src/python-server/runs');
+const DELTA_FILENAME = 'german_credit_umap_delta.json';
+// Same rule as pipeline_runs.get_run_dir, so the id cannot point outside the runs directory
+const RUN_ID_PATTERN = /^[A-Za-z0-9_-]{1,64}$/;
+
+export async function GET(_req: NextRequest, { params }: { params: Promise<{ runId: string }> }) {
+	const { runId } = await params;
+	if (!RUN_ID_PATTERN.test(runId)) {
+		return NextResponse.json({ success: false, error: 'Invalid run id' }, { status: 400 });
+	}
+
+	try {
+		const delta = await fs.readFile(path.join(RUNS_DIR, runId, DELTA_FILENAME), 'utf-8');
+		// A run's delta never changes once written
+		return new NextResponse(delta, {
+			headers: { 'Content-Type': 'application/json', 'Cache-Control': 'private, max-age=3600' },
+		});
+	} catch {
+		// Unknown run, or its directory was cleaned up as stale
+		return NextResponse.json({ success: false, error: 'Run not found' }, { status: 404 });
+	}
+}
@@ -0,0 +1,31 @@
+import { NextRequest, NextResponse } from 'next/server';
+import fs from 'fs/promises';
+import path from 'path';
+
+// Serves a training layer referenced by a run delta: the content-hashed training points
+// written to src/python-server/ (see generate_umap_with_counterfactuals.write_training_layer).
+
+const LAYER_DIR = path.resolve('src/python-server');
+// <TRAINING_LAYER_NAME>.<16 hex digits>.json, so the name cannot point at any other file
+const LAYER_PATTERN = /^german_credit_training\.[0-9a-f]{16}\.json$/;
+
+export async function GET(_req: NextRequest, { params }: { params: Promise<{ layer: string }> }) {
+	const { layer } = await params;
+	if (!LAYER_PATTERN.test(layer)) {
+		return NextResponse.json({ success: false, error: 'Invalid training layer' }, { status: 400 });
+	}
+
+	try {
+		const points = await fs.readFile(path.join(LAYER_DIR, layer), 'utf-8');
+		// The name is the hash of the content, so the response can be cached forever
+		return new NextResponse(points, {
+			headers: {
+				'Content-Type': 'application/json',
+				'Cache-Control': 'public, max-age=31536000, immutable',
+			},
+		});
+	} catch {
+		// No longer referenced by any kept run and pruned
+		return NextResponse.json({ success: false, error: 'Training layer not found' }, { status: 404 });
+	}
+}
@@ -1,7 +1,11 @@
 import { create } from 'zustand';
+import { createJSONStorage, persist } from 'zustand/middleware';
 import { CreditData, DashboardData, FilterValue } from '../[locale]/(main)/dashboard/types';
 
 interface DashboardState {
+	// Pipeline run of the last submitted application; its points are served by /api/runs/<runId>
+	runId: string | null;
+	setRunId: (runId: string) => void;
 	data: DashboardData | null;
 	setData: (data: DashboardData) => void;
 	isUMAPextended: boolean;
@@ -23,33 +27,47 @@ interface DashboardState {
 	toggleOnlyImproved: () => void;
 }
 
-export const useDashboardStore = create<DashboardState>((set) => ({
-	data: null,
-	setData: (data) => set({ data }),
-	isUMAPextended: false,
-	toggleUMAP: () => set((state) => ({ isUMAPextended: !state.isUMAPextended })),
-	selectedScenario: null,
-	selectScenario: (scenario) => set({ selectedScenario: scenario }),
-	filters: {},
-	setFilter: (filterKey, filterValue) =>
-		set((state) => ({ filters: { ...state.filters, [filterKey]: filterValue } })),
-	resetFilters: () => set({ filters: {}, onlyImproved: false }),
-	filterRanges: {},
-	setFilterRanges: (ranges) => set({ filterRanges: ranges }),
-	likedScenarios: [],
-	resetLikedScenarios: () => set(() => ({ likedScenarios: [] })),
-	addLikedScenario: (scenario) =>
-		set((state) => {
-			const exists = state.likedScenarios.some((s) => s.id === scenario.id);
-			if (!exists) {
-				return {
-					likedScenarios: [...state.likedScenarios, scenario],
-				};
-			}
-			return state;
+export const useDashboardStore = create<DashboardState>()(
+	persist(
+		(set) => ({
+			runId: null,
+			setRunId: (runId) => set({ runId }),
+			data: null,
+			setData: (data) => set({ data }),
+			isUMAPextended: false,
+			toggleUMAP: () => set((state) => ({ isUMAPextended: !state.isUMAPextended })),
+			selectedScenario: null,
+			selectScenario: (scenario) => set({ selectedScenario: scenario }),
+			filters: {},
+			setFilter: (filterKey, filterValue) =>
+				set((state) => ({ filters: { ...state.filters, [filterKey]: filterValue } })),
+			resetFilters: () => set({ filters: {}, onlyImproved: false }),
+			filterRanges: {},
+			setFilterRanges: (ranges) => set({ filterRanges: ranges }),
+			likedScenarios: [],
+			resetLikedScenarios: () => set(() => ({ likedScenarios: [] })),
+			addLikedScenario: (scenario) =>
+				set((state) => {
+					const exists = state.likedScenarios.some((s) => s.id === scenario.id);
+					if (!exists) {
+						return {
+							likedScenarios: [...state.likedScenarios, scenario],
+						};
+					}
+					return state;
+				}),
+			removeLikedScenario: (id) =>
+				set((state) => ({
+					likedScenarios: state.likedScenarios.filter((value) => value.id !== id),
+				})),
+			onlyImproved: false,
+			toggleOnlyImproved: () => set((state) => ({ onlyImproved: !state.onlyImproved })),
 		}),
-	removeLikedScenario: (id) =>
-		set((state) => ({ likedScenarios: state.likedScenarios.filter((value) => value.id !== id) })),
-	onlyImproved: false,
-	toggleOnlyImproved: () => set((state) => ({ onlyImproved: !state.onlyImproved })),
-}));
+		{
+			// Keep the run across reloads of the tab
+			name: 'dashboard-run',
+			storage: createJSONStorage(() => sessionStorage),
+			partialize: (state) => ({ runId: state.runId }),
+		},
+	),
+);
@@ -119,6 +119,15 @@ const ActionablesFrame: FC<ActionablesFrameProps> = ({ profile, chosenScenario }
 			return [];
 		}
 
+		// Counterfactuals from the pipeline carry their changed features
+		if (c.diff) {
+			return c.diff.changed.map((feature) => ({
+				field: feature,
+				currentValue: p.features[feature],
+				updatedValue: c.features[feature],
+			}));
+		}
+
 		return (Object.keys(p.features) as FeatureKey[]).flatMap((feature) => {
 			if (p.features[feature] === c.features[feature]) {
 				return [];
@@ -0,0 +1,215 @@
+import { ChildProcessWithoutNullStreams, spawn } from 'child_process';
+import path from 'path';
+import readline from 'readline';
+
+// Client for the long-lived Python embedding worker (src/python-server/embedding_worker.py).
+// The worker is started once per server process and reused across requests.
+
+const WORKER_SCRIPT = path.resolve('src/python-server/embedding_worker.py');
+const READY_TIMEOUT_MS = 60_000;
+// Sent with every job as its "timeout", so the worker's queue answers with status 'timeout'
+const JOB_TIMEOUT_MS = 120_000;
+// The local timer only fires if the worker did not answer its own timeout by then
+const RESPONSE_GRACE_MS = 5_000;
+
+export type WorkerHealth = {
+	status: string;
+	pid: number;
+	models_loaded: boolean;
+	uptime_seconds: number;
+	startup_seconds: number;
+	jobs_done: number;
+	jobs_failed: number;
+};
+
+export type PipelineRunOptions = {
+	runId?: string;
+	counterfactuals?: string;
+	user?: string;
+	// Identical in-flight submissions with the same key share one pipeline run
+	key?: string;
+	// 'surrogate' places the new rows with the fast kNN surrogate instead of UMAP.transform
+	engine?: 'umap' | 'surrogate';
+};
+
+// Progress event of a streaming pipeline run (see src/python-server/pipeline_events.py):
+// stage_started / stage_finished, then 'points' batches (the user point first)
+export type PipelineEvent = {
+	event: 'stage_started' | 'stage_finished' | 'points' | 'done' | 'error';
+	[field: string]: unknown;
+};
+
+type WorkerResponse = {
+	id: string | null;
+	ok: boolean;
+	result?: Record<string, unknown>;
+	error?: string;
+	// Set when the worker's job queue refused, timed out or cancelled the job
+	status?: 'rejected' | 'timeout' | 'cancelled';
+	coalesced?: boolean;
+	seconds?: number;
+	total_seconds?: number;
+};
+
+// A job the worker answered with an error; `status` tells queue refusals apart from failures
+export class WorkerJobError extends Error {
+	constructor(
+		message: string,
+		readonly status?: WorkerResponse['status'],
+	) {
+		super(message);
+	}
+}
+
+type PendingJob = {
+	resolve: (response: WorkerResponse) => void;
+	reject: (error: Error) => void;
+	timer: NodeJS.Timeout;
+	onEvent?: (event: PipelineEvent) => void;
+};
+
+class EmbeddingWorker {
+	private proc: ChildProcessWithoutNullStreams | null = null;
+	private ready: Promise<WorkerHealth> | null = null;
+	private pending = new Map<string, PendingJob>();
+	private nextId = 0;
+
+	// Starts the worker if needed and resolves once it reports readiness
+	start(): Promise<WorkerHealth> {
+		if (this.ready) return this.ready;
+
+		this.ready = new Promise<WorkerHealth>((resolve, reject) => {
+			const proc = spawn('python3', [WORKER_SCRIPT]);
+			this.proc = proc;
+
+			const timer = setTimeout(() => {
+				reject(new Error('Embedding worker did not become ready in time'));
+				this.stop();
+			}, READY_TIMEOUT_MS);
+
+			readline.createInterface({ input: proc.stdout }).on('line', (line) => {
+				let message: Record<string, unknown>;
+				try {
+					message = JSON.parse(line);
+				} catch {
+					return;
+				}
+
+				if (message.event === 'ready') {
+					clearTimeout(timer);
+					resolve(message as unknown as WorkerHealth);
+				} else if (message.event === 'failed') {
+					clearTimeout(timer);
+					reject(new Error(`Embedding worker failed to start: ${message.error}`));
+				} else if (message.event !== undefined) {
+					this.forwardEvent(message as unknown as PipelineEvent & { id: string });
+				} else {
+					this.settle(message as unknown as WorkerResponse);
+				}
+			});
+
+			proc.stderr.on('data', (data) => {
+				process.stderr.write(`[embedding-worker] ${data}`);
+			});
+
+			proc.on('error', (error) => {
+				clearTimeout(timer);
+				reject(error);
+				this.reset(error);
+			});
+
+			proc.on('close', (code) => {
+				clearTimeout(timer);
+				const error = new Error(`Embedding worker exited with code ${code}`);
+				reject(error);
+				this.reset(error);
+			});
+		});
+
+		return this.ready;
+	}
+
+	async health(): Promise<WorkerHealth> {
+		const response = await this.send({ cmd: 'health' });
+		return response.result as unknown as WorkerHealth;
+	}
+
+	// With onEvent the run streams its progress events and points before the result
+	async runPipeline(
+		options: PipelineRunOptions = {},
+		onEvent?: (event: PipelineEvent) => void,
+	): Promise<Record<string, unknown>> {
+		const response = await this.send(
+			{
+				cmd: 'run_pipeline',
+				run_id: options.runId,
+				counterfactuals: options.counterfactuals,
+				user: options.user,
+				key: options.key,
+				engine: options.engine,
+				stream: onEvent !== undefined,
+			},
+			onEvent,
+		);
+		if (!response.ok) {
+			throw new WorkerJobError(response.error || 'Embedding worker job failed', response.status);
+		}
+		return { ...response.result, coalesced: response.coalesced ?? false };
+	}
+
+	stop() {
+		this.proc?.kill();
+	}
+
+	private async send(
+		job: Record<string, unknown>,
+		onEvent?: (event: PipelineEvent) => void,
+	): Promise<WorkerResponse> {
+		await this.start();
+		const id = String(++this.nextId);
+
+		return new Promise<WorkerResponse>((resolve, reject) => {
+			const timer = setTimeout(() => {
+				this.pending.delete(id);
+				// Frees the worker's slot: a queued job is dropped, a running pipeline stops at its next stage
+				this.proc?.stdin.write(JSON.stringify({ id: `cancel-${id}`, cmd: 'cancel', target: id }) + '\n');
+				reject(new WorkerJobError(`Embedding worker job ${id} timed out`, 'timeout'));
+			}, JOB_TIMEOUT_MS + RESPONSE_GRACE_MS);
+
+			this.pending.set(id, { resolve, reject, timer, onEvent });
+			this.proc?.stdin.write(JSON.stringify({ ...job, id, timeout: JOB_TIMEOUT_MS / 1000 }) + '\n');
+		});
+	}
+
+	private settle(response: WorkerResponse) {
+		if (response.id === null) return;
+		const job = this.pending.get(response.id);
+		if (!job) return;
+		clearTimeout(job.timer);
+		this.pending.delete(response.id);
+		job.resolve(response);
+	}
+
+	// Events arrive before the job's final response and leave it pending
+	private forwardEvent(message: PipelineEvent & { id: string }) {
+		const { id, ...event } = message;
+		this.pending.get(id)?.onEvent?.(event as PipelineEvent);
+	}
+
+	// Fails all in-flight jobs so the next request starts a fresh worker
+	private reset(error: Error) {
+		for (const job of this.pending.values()) {
+			clearTimeout(job.timer);
+			job.reject(error);
+		}
+		this.pending.clear();
+		this.proc = null;
+		this.ready = null;
+	}
+}
+
+// Keep a single worker across hot reloads in development
+const globalForWorker = globalThis as unknown as { embeddingWorker?: EmbeddingWorker };
+
+export const embeddingWorker = globalForWorker.embeddingWorker ?? new EmbeddingWorker();
+globalForWorker.embeddingWorker = embeddingWorker;
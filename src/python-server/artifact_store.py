@@ -0,0 +1,292 @@
+"""
+Versioned store for the model and embedding artifacts.
+
+generate_umap_embeddings.py writes every training run into its own bundle
+directory, artifacts/<version>/, and then points artifacts/CURRENT at it:
+
+    artifacts/
+        CURRENT                  version of the bundle in use
+        <version>/
+            manifest.json        format, version, training-data hash, UMAP
+                                 parameters, size and sha256 of every file,
+                                 optional metadata (e.g. the surrogate
+                                 projector's placement error)
+            umap_model.joblib    pickled objects (model, preprocessor,
+            preprocessor.joblib  feature encoder, neighbour index,
+                                 surrogate projector)
+            ...
+            umap_embedding.npy   large arrays as plain .npy files, opened with
+            processed_training.npy   mmap_mode='r' so processes share one copy
+            graph_*.npy          (the UMAP kNN graph as CSR arrays)
+
+The pickled UMAP model leaves out its training matrix and kNN graph
+(detach_umap_arrays); they are only stored as processed_training.npy and
+graph_*.npy, and attach_umap_arrays puts them back memory-mapped on load.
+
+The version is derived from the file hashes, so identical training runs give
+the same version. Loaders resolve file names through artifact_path(): with a
+version they only ever read that bundle and raise ArtifactVersionError if it
+is missing or a file's size differs from the manifest, so artifacts of
+different training runs are never mixed. Hashing every file on every load
+would cost seconds for large bundles, so the sha256 check is opt-in
+(verify=True, or verify_bundle for a whole bundle, which cold_start.py --warm
+runs once per deployment). Without a store (older checkouts) the flat
+files in the model directory are used as before.
+"""
+
+import copy
+import hashlib
+import json
+import os
+import shutil
+import tempfile
+import time
+
+import numpy as np
+
+from pipeline_runs import atomic_write
+
+FORMAT_VERSION = 1
+ARTIFACTS_DIRNAME = 'artifacts'
+MANIFEST_NAME = 'manifest.json'
+CURRENT_NAME = 'CURRENT'
+
+# Bundles kept by prune_bundles besides the current one
+DEFAULT_KEEP_BUNDLES = 3
+
+
+class ArtifactVersionError(RuntimeError):
+    """The requested artifacts are missing or belong to a different version."""
+
+
+def _sha256(path):
+    digest = hashlib.sha256()
+    with open(path, 'rb') as f:
+        for block in iter(lambda: f.read(1 << 20), b''):
+            digest.update(block)
+    return digest.hexdigest()
+
+
+def store_dir(model_dir='.'):
+    return os.path.join(model_dir, ARTIFACTS_DIRNAME)
+
+
+def current_version(model_dir='.'):
+    """Version the store points at, or None if there is no store."""
+    try:
+        with open(os.path.join(store_dir(model_dir), CURRENT_NAME)) as f:
+            return f.read().strip() or None
+    except FileNotFoundError:
+        return None
+
+
+def load_manifest(model_dir='.', version=None):
+    """
+    Read the manifest of a bundle (the current one by default).
+
+    Raises:
+        ArtifactVersionError: if the bundle does not exist or has another format
+    """
+    version = version or current_version(model_dir)
+    if version is None:
+        raise ArtifactVersionError(f"No artifact store in {os.path.abspath(model_dir)}")
+    path = os.path.join(store_dir(model_dir), version, MANIFEST_NAME)
+    try:
+        with open(path) as f:
+            manifest = json.load(f)
+    except FileNotFoundError:
+        raise ArtifactVersionError(f"Artifact bundle {version} does not exist") from None
+    if manifest.get('format_version') != FORMAT_VERSION or manifest.get('version') != version:
+        raise ArtifactVersionError(f"Artifact bundle {version} has an incompatible manifest")
+    return manifest
+
+
+def artifact_path(name, model_dir='.', version=None, verify=False):
+    """
+    Path of an artifact file.
+
+    Args:
+        name: File name ('umap_model.joblib', 'umap_embedding.npy', ...)
+        model_dir: Directory holding the store (or the legacy flat files)
+        version: Bundle version to read; the current one if None
+        verify: Also compare the file's sha256 with the manifest
+
+    Raises:
+        ArtifactVersionError: if the file is not part of the bundle or does not
+            match its manifest entry
+    """
+    if version is None and current_version(model_dir) is None:
+        return os.path.join(model_dir, name)
+
+    manifest = load_manifest(model_dir, version)
+    entry = manifest['files'].get(name)
+    if entry is None:
+        raise ArtifactVersionError(f"{name} is not part of artifact bundle {manifest['version']}")
+
+    path = os.path.join(store_dir(model_dir), manifest['version'], name)
+    if not os.path.exists(path) or os.path.getsize(path) != entry['bytes']:
+        raise ArtifactVersionError(f"{name} does not match artifact bundle {manifest['version']}")
+    if verify and _sha256(path) != entry['sha256']:
+        raise ArtifactVersionError(f"{name} does not match the hash in bundle {manifest['version']}")
+    return path
+
+
+def resolve_version(model_dir='.'):
+    """
+    Version identifying the artifacts a process is about to load.
+
+    The bundle version if there is a store, else a hash of the legacy flat files.
+    """
+    version = current_version(model_dir)
+    if version is not None:
+        return version
+    digest = hashlib.sha256()
+    for name in ['umap_model.joblib', 'preprocessor.joblib', 'feature_encoder.joblib']:
+        path = os.path.join(model_dir, name)
+        if os.path.exists(path):
+            digest.update(_sha256(path).encode())
+    return digest.hexdigest()[:16]
+
+
+def load_array(name, model_dir='.', version=None, mmap_mode='r', verify=False):
+    """Open an .npy artifact, memory-mapped by default."""
+    return np.load(artifact_path(name, model_dir, version, verify), mmap_mode=mmap_mode)
+
+
+def detach_umap_arrays(reducer):
+    """
+    Split a fitted UMAP model into a picklable shell and its large arrays.
+
+    Returns:
+        (shallow copy of reducer without _raw_data and graph_, {file name: array}
+        for save_bundle); reducer itself is left unchanged
+    """
+    graph = reducer.graph_.tocsr()
+    arrays = {
+        'processed_training.npy': reducer._raw_data,
+        'graph_data.npy': graph.data,
+        'graph_indices.npy': graph.indices,
+        'graph_indptr.npy': graph.indptr,
+    }
+    shell = copy.copy(reducer)
+    shell._raw_data = None
+    shell.graph_ = None
+    return shell, arrays
+
+
+def attach_umap_arrays(reducer, model_dir='.', version=None, verify=False):
+    """
+    Put the arrays removed by detach_umap_arrays back, memory-mapped.
+
+    Models pickled whole (legacy flat files, older bundles) are returned as they are.
+    """
+    if getattr(reducer, '_raw_data', None) is None:
+        reducer._raw_data = load_array('processed_training.npy', model_dir, version, verify=verify)
+    if getattr(reducer, 'graph_', None) is None:
+        import scipy.sparse
+
+        data, indices, indptr = (
+            load_array(name, model_dir, version, verify=verify)
+            for name in ['graph_data.npy', 'graph_indices.npy', 'graph_indptr.npy']
+        )
+        size = len(indptr) - 1
+        reducer.graph_ = scipy.sparse.csr_matrix((data, indices, indptr), shape=(size, size))
+    return reducer
+
+
+def verify_bundle(model_dir='.', version=None):
+    """
+    Compare the size and sha256 of every file of a bundle with its manifest.
+
+    Returns:
+        Version of the verified bundle
+
+    Raises:
+        ArtifactVersionError: if a file is missing or does not match
+    """
+    manifest = load_manifest(model_dir, version)
+    for name in manifest['files']:
+        artifact_path(name, model_dir, manifest['version'], verify=True)
+    return manifest['version']
+
+
+def save_bundle(objects, arrays, training_data_path, umap_params, model_dir='.', metadata=None):
+    """
+    Write a new bundle and make it the current one.
+
+    Args:
+        objects: {file name: object} saved with joblib
+        arrays: {file name: numpy array} saved as .npy
+        training_data_path: CSV the model was trained on (hashed into the manifest)
+        umap_params: Parameters of the fitted UMAP model
+        model_dir: Directory holding the store
+        metadata: Optional JSON-serializable dict stored in the manifest as 'metadata'
+
+    Returns:
+        Version of the new bundle
+    """
+    import joblib
+
+    root = store_dir(model_dir)
+    os.makedirs(root, exist_ok=True)
+    staging = tempfile.mkdtemp(dir=root, prefix='.staging-')
+    try:
+        for name, obj in objects.items():
+            joblib.dump(obj, os.path.join(staging, name))
+        for name, array in arrays.items():
+            np.save(os.path.join(staging, name), np.ascontiguousarray(array))
+
+        files = {
+            name: {'sha256': _sha256(os.path.join(staging, name)),
+                   'bytes': os.path.getsize(os.path.join(staging, name))}
+            for name in sorted(os.listdir(staging))
+        }
+        version = hashlib.sha256(
+            json.dumps({name: entry['sha256'] for name, entry in files.items()}, sort_keys=True).encode()
+        ).hexdigest()[:16]
+
+        manifest = {
+            'format_version': FORMAT_VERSION,
+            'version': version,
+            'created': time.strftime('%Y-%m-%dT%H:%M:%S%z'),
+            'training_data_sha256': _sha256(training_data_path),
+            'umap_params': umap_params,
+            'arrays': {name: {'shape': list(np.shape(array)), 'dtype': str(np.asarray(array).dtype)}
+                       for name, array in arrays.items()},
+            'files': files,
+        }
+        if metadata:
+            manifest['metadata'] = metadata
+        with open(os.path.join(staging, MANIFEST_NAME), 'w') as f:
+            json.dump(manifest, f, indent=2)
+
+        bundle_dir = os.path.join(root, version)
+        if os.path.isdir(bundle_dir):
+            # Same content as an existing bundle
+            shutil.rmtree(staging)
+        else:
+            os.chmod(staging, 0o755)
+            os.rename(staging, bundle_dir)
+    except BaseException:
+        shutil.rmtree(staging, ignore_errors=True)
+        raise
+
+    with atomic_write(os.path.join(root, CURRENT_NAME)) as f:
+        f.write(version + '\n')
+    return version
+
+
+def prune_bundles(model_dir='.', keep=DEFAULT_KEEP_BUNDLES):
+    """Remove all but the current and the `keep` most recent other bundles."""
+    root = store_dir(model_dir)
+    current = current_version(model_dir)
+    bundles = sorted(
+        (entry for entry in os.listdir(root)
+         if entry != current and not entry.startswith('.') and os.path.isdir(os.path.join(root, entry))),
+        key=lambda entry: os.path.getmtime(os.path.join(root, entry)),
+        reverse=True,
+    )
+    removed = bundles[keep:]
+    for entry in removed:
+        shutil.rmtree(os.path.join(root, entry), ignore_errors=True)
+    return removed
@@ -0,0 +1,181 @@
+#!/usr/bin/env python3
+"""
+Benchmark the vectorized JSON export (json_export.py) against the previous
+row-by-row iterrows exporters.
+
+For every size it builds a synthetic German-credit-shaped DataFrame, checks that
+both implementations produce identical records for all three exporter shapes
+and reports the build and dump times.
+
+Usage:
+    python3 benchmark_json_export.py
+    python3 benchmark_json_export.py --sizes 1000 100000
+"""
+
+import argparse
+import io
+import json
+import time
+
+import numpy as np
+import pandas as pd
+
+from json_export import build_point_columns, build_point_records
+
+
+def make_synthetic_frame(n_rows, seed=0):
+    """Random rows with the columns and category levels of the German credit data."""
+    rng = np.random.default_rng(seed)
+    return pd.DataFrame({
+        'age': rng.integers(19, 76, n_rows),
+        'sex': rng.choice(['male', 'female'], n_rows),
+        'job': rng.integers(0, 4, n_rows),
+        'housing': rng.choice(['own', 'free', 'rent'], n_rows),
+        'saving accounts': rng.choice(['little', 'moderate', 'rich'], n_rows),
+        'checking account': rng.choice(['little', 'moderate', 'rich'], n_rows),
+        'credit amount': rng.integers(250, 18425, n_rows),
+        'duration': rng.integers(4, 73, n_rows),
+        'purpose': rng.choice(['car', 'radio/TV', 'furniture', 'others'], n_rows),
+        'risk': rng.choice(['good', 'bad', 'unknown'], n_rows),
+        'counterfactual': rng.choice([0, 1, 2], n_rows, p=[0.9, 0.09, 0.01]),
+        'pred': np.where(rng.random(n_rows) < 0.1, np.nan, rng.random(n_rows)),
+        'UMAP1': rng.normal(size=n_rows),
+        'UMAP2': rng.normal(size=n_rows),
+    })
+
+
+def _legacy_features(row):
+    return {
+        'age': float(row['age']),
+        'credit_amount': float(row['credit amount']),
+        'duration': float(row['duration']),
+        'job': int(row['job']),
+        'sex': str(row['sex']),
+        'housing': str(row['housing']),
+        'saving_accounts': str(row['saving accounts']),
+        'checking_account': str(row['checking account']),
+        'purpose': str(row['purpose'])
+    }
+
+
+def legacy_embedding_records(combined_df):
+    """Previous exporter of generate_umap_embeddings.py"""
+    json_data = []
+    for idx, row in combined_df.iterrows():
+        json_data.append({
+            'id': int(idx),
+            'x': float(row['UMAP1']),
+            'y': float(row['UMAP2']),
+            'risk': str(row['risk']),
+            'features': _legacy_features(row)
+        })
+    return json_data
+
+
+def legacy_counterfactual_records(combined_df):
+    """Previous exporter of generate_umap_with_counterfactuals.py"""
+    json_data = []
+    for idx, row in combined_df.iterrows():
+        data_type_map = {0: 'training', 1: 'counterfactual', 2: 'user'}
+        point_data = {
+            'id': int(idx),
+            'x': float(row['UMAP1']),
+            'y': float(row['UMAP2']),
+            'risk': str(row['risk']),
+            'counterfactual': bool(row['counterfactual']),
+            'data_type': data_type_map.get(row['counterfactual'], 'unknown'),
+            'features': _legacy_features(row)
+        }
+        if 'pred' in row and pd.notna(row['pred']):
+            point_data['pred'] = float(row['pred'])
+        json_data.append(point_data)
+    return json_data
+
+
+def legacy_mapped_records(new_df, new_embedding):
+    """Previous exporter of map_to_umap_embeddings.py (on a frame with a clean index)"""
+    json_data = []
+    for idx, row in new_df.iterrows():
+        json_data.append({
+            'id': int(idx),
+            'x': float(new_embedding[idx][0]),
+            'y': float(new_embedding[idx][1]),
+            'risk': str(row['risk']) if 'risk' in row else 'unknown',
+            'features': _legacy_features(row)
+        })
+    return json_data
+
+
+def timed(func, *args, **kwargs):
+    start = time.perf_counter()
+    result = func(*args, **kwargs)
+    return result, time.perf_counter() - start
+
+
+def dump_seconds(data, **json_kwargs):
+    """Time json.dump into memory; returns (seconds, bytes)."""
+    buffer = io.StringIO()
+    _, seconds = timed(json.dump, data, buffer, **json_kwargs)
+    return seconds, len(buffer.getvalue())
+
+
+def benchmark_size(n_rows, run_legacy=True):
+    df = make_synthetic_frame(n_rows)
+    embedding_df = df.drop(columns=['counterfactual', 'pred'])
+    mapped_df = df.drop(columns=['counterfactual', 'pred', 'UMAP1', 'UMAP2'])
+    mapped_embedding = df[['UMAP1', 'UMAP2']].to_numpy()
+
+    shapes = {
+        'embeddings': (
+            lambda: legacy_embedding_records(embedding_df),
+            lambda: build_point_records(embedding_df, embedding_df['UMAP1'], embedding_df['UMAP2']),
+        ),
+        'counterfactuals': (
+            lambda: legacy_counterfactual_records(df),
+            lambda: build_point_records(df, df['UMAP1'], df['UMAP2'], include_counterfactual=True),
+        ),
+        'mapped': (
+            lambda: legacy_mapped_records(mapped_df, mapped_embedding),
+            lambda: build_point_records(mapped_df, mapped_embedding[:, 0], mapped_embedding[:, 1],
+                                        ids=mapped_df.index),
+        ),
+    }
+
+    print(f"\n{n_rows:,} rows")
+    for name, (legacy, vectorized) in shapes.items():
+        records, vectorized_seconds = timed(vectorized)
+        line = f"  {name:<16} vectorized {vectorized_seconds:8.3f}s"
+
+        if run_legacy:
+            legacy_records, legacy_seconds = timed(legacy)
+            if legacy_records != records:
+                raise AssertionError(f"{name}: vectorized records differ from the iterrows output")
+            line += f"  iterrows {legacy_seconds:8.3f}s  speedup {legacy_seconds / vectorized_seconds:6.1f}x  identical"
+        print(line)
+
+    # Serialization cost of the different layouts, using the largest record shape
+    columns = build_point_columns(df, df['UMAP1'], df['UMAP2'], include_counterfactual=True)
+    records = build_point_records(df, df['UMAP1'], df['UMAP2'], include_counterfactual=True)
+    for label, data, kwargs in [
+        ('records indent=2', records, {'indent': 2}),
+        ('records compact', records, {'separators': (',', ':')}),
+        ('columnar compact', columns, {'separators': (',', ':')}),
+    ]:
+        seconds, size = dump_seconds(data, **kwargs)
+        print(f"  dump {label:<17} {seconds:8.3f}s  {size / 1e6:8.2f} MB")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--sizes', type=int, nargs='+', default=[1_000, 100_000, 1_000_000])
+    parser.add_argument('--skip-legacy-above', type=int, default=None,
+                        help='Only time the iterrows exporters up to this many rows')
+    args = parser.parse_args()
+
+    for n_rows in args.sizes:
+        run_legacy = args.skip_legacy_above is None or n_rows <= args.skip_legacy_above
+        benchmark_size(n_rows, run_legacy=run_legacy)
+
+
+if __name__ == "__main__":
+    main()
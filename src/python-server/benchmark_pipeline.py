@@ -0,0 +1,299 @@
+#!/usr/bin/env python3
+"""
+Benchmark the UMAP pipeline stages on synthetic German-credit-shaped data.
+
+Stages:
+    joint_dataset          create_joint_dataset.build_joint_dataset (n training rows,
+                           n/10 counterfactuals, one user row)
+    preprocess_fit         ColumnTransformer fit (preprocessing.build_preprocessor)
+    preprocess_transform   ColumnTransformer transform
+    umap_fit               UMAP fit on n rows (generate_umap_embeddings.fit_umap)
+    umap_transform         reducer.transform of n rows, as in map_new_data, with a model
+                           fitted on --reference-rows rows
+    json_export            json_export.build_point_records + write_points_json
+    parallel_map           map_to_umap_embeddings.map_new_data_streaming of an n-row CSV
+                           with each of --workers processes (includes pool start-up and
+                           the per-worker numba compile, which large sizes amortize)
+
+Every (stage, size) runs in a fresh process so peak RSS belongs to that stage
+alone (it includes generating the synthetic input). numba functions are
+compiled before timing. Results are written as JSON:
+
+    {"meta": {...}, "results": [{"stage", "rows", "seconds", "rows_per_second",
+                                 "peak_rss_mb", "status"}, ...]}
+
+Usage:
+    python3 benchmark_pipeline.py --output bench.json
+    python3 benchmark_pipeline.py --sizes 1000 10000 --stages umap_transform json_export
+    python3 benchmark_pipeline.py --stages parallel_map --workers 1 2 4 8
+    python3 benchmark_pipeline.py --compare baseline.json bench.json --threshold 0.1
+"""
+
+import argparse
+import concurrent.futures
+import contextlib
+import json
+import multiprocessing
+import os
+import platform
+import subprocess
+import sys
+import tempfile
+import time
+
+from pipeline_metrics import peak_rss_mb
+from pipeline_runs import atomic_write
+
+STAGES = ['joint_dataset', 'preprocess_fit', 'preprocess_transform', 'umap_fit',
+          'umap_transform', 'json_export', 'parallel_map']
+DEFAULT_SIZES = [1_000, 10_000, 100_000, 1_000_000]
+
+# UMAP fit is super-linear; larger sizes are recorded as skipped unless raised
+DEFAULT_MAX_FIT_ROWS = 100_000
+DEFAULT_REFERENCE_ROWS = 1_000
+
+
+def _processed(n_rows, seed=0):
+    """Synthetic rows, grouped by the feature encoder, and a preprocessor fitted on them."""
+    from benchmark_json_export import make_synthetic_frame
+    from feature_encoder import FeatureEncoder
+    from preprocessing import build_preprocessor
+
+    df = FeatureEncoder().fit_transform(make_synthetic_frame(n_rows, seed))
+    preprocessor = build_preprocessor().fit(df)
+    return df, preprocessor
+
+
+def _parallel_chunk_size(n_rows):
+    # Same chunking for every worker count, so outputs are identical and times comparable
+    return max(1_000, n_rows // 64)
+
+
+def _save_reference_model(model_dir, reference_rows):
+    """Fit and save the artifacts map_new_data_streaming loads from model_dir."""
+    import joblib
+    from feature_encoder import FEATURE_ENCODER_PATH, FeatureEncoder
+    from generate_umap_embeddings import fit_umap
+
+    reference, preprocessor = _processed(reference_rows)
+    reducer, _ = fit_umap(preprocessor.transform(reference))
+    joblib.dump(reducer, os.path.join(model_dir, 'umap_model.joblib'))
+    joblib.dump(preprocessor, os.path.join(model_dir, 'preprocessor.joblib'))
+    FeatureEncoder().fit(reference).save(os.path.join(model_dir, FEATURE_ENCODER_PATH))
+
+
+def _setup_stage(stage, n_rows, reference_rows, workers=1):
+    """Prepare the inputs of a stage; returns the zero-argument callable to time."""
+    from benchmark_json_export import make_synthetic_frame
+
+    if stage == 'joint_dataset':
+        from create_joint_dataset import build_joint_dataset
+        frame = make_synthetic_frame(n_rows).drop(columns=['counterfactual', 'UMAP1', 'UMAP2'])
+        counterfactuals = frame.head(max(n_rows // 10, 1))
+        user = frame.head(1).drop(columns=['pred'])
+        return lambda: build_joint_dataset(frame, counterfactuals, user)
+
+    if stage == 'preprocess_fit':
+        from feature_encoder import FeatureEncoder
+        from preprocessing import build_preprocessor
+        df = FeatureEncoder().fit_transform(make_synthetic_frame(n_rows))
+        return lambda: build_preprocessor().fit(df)
+
+    if stage == 'preprocess_transform':
+        df, preprocessor = _processed(n_rows)
+        return lambda: preprocessor.transform(df)
+
+    if stage == 'umap_fit':
+        from generate_umap_embeddings import fit_umap
+        df, preprocessor = _processed(n_rows)
+        X = preprocessor.transform(df)
+        fit_umap(X[:min(n_rows, 200)])  # compile the numba functions first
+        return lambda: fit_umap(X)
+
+    if stage == 'umap_transform':
+        from generate_umap_embeddings import fit_umap
+        reference, preprocessor = _processed(reference_rows)
+        reducer, _ = fit_umap(preprocessor.transform(reference))
+        X = preprocessor.transform(_processed(n_rows, seed=1)[0])
+        reducer.transform(X[:10])  # compile the numba functions first
+        return lambda: reducer.transform(X)
+
+    if stage == 'json_export':
+        from json_export import build_point_records, write_points_json
+        df = make_synthetic_frame(n_rows)
+        output_dir = tempfile.mkdtemp(prefix='benchmark_')
+        output_path = os.path.join(output_dir, 'points.json')
+
+        def export():
+            records = build_point_records(df, df['UMAP1'], df['UMAP2'], include_counterfactual=True)
+            write_points_json(records, output_path, compact=True)
+            os.remove(output_path)
+        return export
+
+    if stage == 'parallel_map':
+        from map_to_umap_embeddings import map_new_data_streaming
+
+        # Fit the reference model in a separate process: a process that ran UMAP fit
+        # and then started the projection pool was seen to hang on exit
+        model_dir = tempfile.mkdtemp(prefix='benchmark_')
+        with concurrent.futures.ProcessPoolExecutor(1, mp_context=multiprocessing.get_context('spawn')) as pool:
+            pool.submit(_save_reference_model, model_dir, reference_rows).result()
+
+        input_path = os.path.join(model_dir, 'input.csv')
+        make_synthetic_frame(n_rows, seed=1).drop(columns=['counterfactual', 'pred', 'UMAP1', 'UMAP2']) \
+            .to_csv(input_path, index=False)
+        output_path = os.path.join(model_dir, 'points.ndjson')
+        return lambda: map_new_data_streaming(input_path, output_path, _parallel_chunk_size(n_rows),
+                                              workers=workers, model_dir=model_dir)
+
+    raise ValueError(f"Unknown stage: {stage}")
+
+
+def run_stage(stage, n_rows, reference_rows=DEFAULT_REFERENCE_ROWS, workers=1):
+    """Time one stage in this process; returns its result entry."""
+    # The pipeline functions print progress; keep stdout for the result line
+    with contextlib.redirect_stdout(sys.stderr):
+        func = _setup_stage(stage, n_rows, reference_rows, workers)
+        start = time.perf_counter()
+        func()
+        seconds = time.perf_counter() - start
+
+    return {
+        'stage': stage,
+        'rows': n_rows,
+        'workers': workers,
+        'seconds': seconds,
+        'rows_per_second': n_rows / seconds if seconds > 0 else None,
+        'peak_rss_mb': peak_rss_mb(),
+        'status': 'ok',
+    }
+
+
+def run_stage_subprocess(stage, n_rows, reference_rows, workers=1):
+    """Run one stage in a fresh interpreter and return its result entry.
+
+    Peak RSS is that of the stage process; pool workers of parallel_map are not included.
+    """
+    script = os.path.abspath(__file__)
+    command = [sys.executable, script, '--worker', stage, str(n_rows),
+               '--reference-rows', str(reference_rows), '--workers', str(workers)]
+    result = subprocess.run(command, capture_output=True, text=True, cwd=os.path.dirname(script))
+    if result.returncode != 0:
+        error = result.stderr.strip().splitlines()[-1:] or ['unknown error']
+        return {'stage': stage, 'rows': n_rows, 'workers': workers, 'status': 'failed', 'error': error[0]}
+    return json.loads(result.stdout.strip().splitlines()[-1])
+
+
+def run_benchmarks(sizes, stages, max_fit_rows=DEFAULT_MAX_FIT_ROWS,
+                   reference_rows=DEFAULT_REFERENCE_ROWS, worker_counts=(1,)):
+    """
+    Run every stage at every size.
+
+    Returns:
+        Benchmark document with 'meta' and 'results'
+    """
+    results = []
+    for n_rows in sizes:
+        for stage in stages:
+            for workers in (worker_counts if stage == 'parallel_map' else [1]):
+                if stage == 'umap_fit' and n_rows > max_fit_rows:
+                    entry = {'stage': stage, 'rows': n_rows, 'workers': workers, 'status': 'skipped'}
+                else:
+                    entry = run_stage_subprocess(stage, n_rows, reference_rows, workers)
+                results.append(entry)
+                print(format_entry(entry), flush=True)
+
+    meta = {
+        'created': time.strftime('%Y-%m-%dT%H:%M:%S%z'),
+        'python': platform.python_version(),
+        'platform': platform.platform(),
+        'cpu_count': os.cpu_count(),
+        'reference_rows': reference_rows,
+    }
+    return {'meta': meta, 'results': results}
+
+
+def format_entry(entry):
+    label = f"{entry['stage']:<22} {entry['rows']:>10,}  x{entry.get('workers', 1):<3}"
+    if entry['status'] != 'ok':
+        return f"{label}  {entry['status']} {entry.get('error', '')}".rstrip()
+    return (f"{label}  {entry['seconds']:9.3f}s  {entry['rows_per_second']:12,.0f} rows/s"
+            f"  peak RSS {entry['peak_rss_mb']:8.1f} MB")
+
+
+def compare_results(baseline, current, threshold=0.1):
+    """
+    Compare two benchmark documents.
+
+    A stage regresses when its time or peak RSS grows by more than threshold
+    (a fraction of the baseline value).
+
+    Returns:
+        List of (stage, rows, workers, metric, baseline value, current value, is regression)
+    """
+    def key(entry):
+        return entry['stage'], entry['rows'], entry.get('workers', 1)
+
+    baseline_entries = {key(e): e for e in baseline['results'] if e['status'] == 'ok'}
+    rows = []
+    for entry in current['results']:
+        before = baseline_entries.get(key(entry))
+        if entry['status'] != 'ok' or before is None:
+            continue
+        for metric in ['seconds', 'peak_rss_mb']:
+            old, new = before[metric], entry[metric]
+            rows.append((*key(entry), metric, old, new, new > old * (1 + threshold)))
+    return rows
+
+
+def print_comparison(comparison):
+    for stage, n_rows, workers, metric, old, new, regressed in comparison:
+        change = (new - old) / old * 100 if old else 0.0
+        flag = 'REGRESSION' if regressed else ''
+        print(f"{stage:<22} {n_rows:>10,}  x{workers:<3} {metric:<12} {old:10.3f} -> {new:10.3f}  {change:+7.1f}%  {flag}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--sizes', type=int, nargs='+', default=DEFAULT_SIZES)
+    parser.add_argument('--stages', nargs='+', choices=STAGES, default=STAGES)
+    parser.add_argument('--max-fit-rows', type=int, default=DEFAULT_MAX_FIT_ROWS,
+                        help='Skip umap_fit above this many rows')
+    parser.add_argument('--reference-rows', type=int, default=DEFAULT_REFERENCE_ROWS,
+                        help='Training rows of the model used by umap_transform')
+    parser.add_argument('--workers', type=int, nargs='+', default=[1],
+                        help='Worker counts for parallel_map')
+    parser.add_argument('--output', default='benchmark_results.json', help='Results file to write')
+    parser.add_argument('--compare', nargs=2, metavar=('BASELINE', 'CURRENT'),
+                        help='Compare two results files instead of running')
+    parser.add_argument('--threshold', type=float, default=0.1,
+                        help='Relative slowdown/growth that counts as a regression')
+    parser.add_argument('--worker', nargs=2, metavar=('STAGE', 'ROWS'), help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.worker:
+        stage, n_rows = args.worker
+        print(json.dumps(run_stage(stage, int(n_rows), args.reference_rows, args.workers[0])))
+        return
+
+    if args.compare:
+        with open(args.compare[0]) as f:
+            baseline = json.load(f)
+        with open(args.compare[1]) as f:
+            current = json.load(f)
+        comparison = compare_results(baseline, current, args.threshold)
+        print_comparison(comparison)
+        regressions = sum(1 for row in comparison if row[-1])
+        print(f"\n{regressions} regression(s) above {args.threshold:.0%}")
+        if regressions:
+            sys.exit(1)
+        return
+
+    document = run_benchmarks(args.sizes, args.stages, args.max_fit_rows, args.reference_rows, args.workers)
+    with atomic_write(args.output) as f:
+        json.dump(document, f, indent=2)
+    print(f"\nSaved results to '{args.output}'")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,175 @@
+"""
+Cold-start helpers for the Python scripts.
+
+Most of the time to the first mapped point goes into importing umap/pynndescent
+and JIT-compiling their numba functions. This module:
+
+- points numba at a persistent on-disk cache (.numba_cache next to this script,
+  or NUMBA_CACHE_DIR if set) so functions compiled with cache=True are loaded
+  instead of recompiled in every new process
+- warms that cache at deploy time (python3 cold_start.py --warm)
+- reports where startup time goes, per import and per first call
+  (python3 map_to_umap_embeddings.py <input.csv> --profile-startup)
+
+configure_numba_cache() must run before numba is imported, i.e. before umap is
+imported or a UMAP model is unpickled.
+
+The cache does not make a fresh process fast. Measured on the German credit
+bundle with a warm cache (python3 cold_start.py --profile on the R results
+CSV): importing umap takes about 12 s, nearly all of it pynndescent
+compiling its numba functions at import. Loading the model and preprocessor,
+which includes that import, takes about 10 s. The first reducer.transform
+takes about 12 s, because most of umap's transform kernels are not compiled
+with cache=True; the second takes 0.2 s. A one-shot run therefore spends
+about 22 s before its first mapped point. Only the long-lived embedding
+worker, which pays this once at start-up and warms up, answers in well under
+a second.
+"""
+
+import argparse
+import os
+import subprocess
+import sys
+import time
+
+SCRIPT_DIR = os.path.dirname(os.path.abspath(__file__))
+DEFAULT_NUMBA_CACHE_DIR = os.path.join(SCRIPT_DIR, '.numba_cache')
+
+# Imported one after another, so each entry only counts what it adds on top of the previous ones
+PROFILED_IMPORTS = ['numpy', 'pandas', 'joblib', 'sklearn', 'numba', 'pynndescent', 'umap']
+
+
+def configure_numba_cache(cache_dir=None):
+    """
+    Use a persistent numba cache directory unless NUMBA_CACHE_DIR is already set.
+
+    Returns:
+        The cache directory in effect
+    """
+    already_set = 'NUMBA_CACHE_DIR' in os.environ
+    cache_dir = os.environ.setdefault('NUMBA_CACHE_DIR', cache_dir or DEFAULT_NUMBA_CACHE_DIR)
+    os.makedirs(cache_dir, exist_ok=True)
+    if not already_set and 'numba' in sys.modules:
+        print(f"Warning: numba was imported before its cache was configured, {cache_dir} may be ignored")
+    return cache_dir
+
+
+def profile_imports(modules=PROFILED_IMPORTS):
+    """
+    Measure import times in a fresh interpreter with python -X importtime.
+
+    Returns:
+        List of (module, seconds) in import order
+    """
+    code = '; '.join(f'import {module}' for module in modules)
+    result = subprocess.run([sys.executable, '-X', 'importtime', '-c', code],
+                            capture_output=True, text=True, cwd=SCRIPT_DIR, env=os.environ.copy())
+
+    # Lines look like "import time:  self [us] | cumulative | name"; top-level names are not indented
+    cumulative = {}
+    for line in result.stderr.splitlines():
+        parts = line.split('|')
+        if not line.startswith('import time:') or len(parts) != 3:
+            continue
+        name = parts[2].rstrip()
+        if name.strip() in modules and not name.startswith('  ') and parts[1].strip().isdigit():
+            cumulative[name.strip()] = int(parts[1]) / 1e6
+    return [(module, cumulative.get(module, 0.0)) for module in modules]
+
+
+def _timed(timings, step, func, *args):
+    start = time.perf_counter()
+    result = func(*args)
+    timings.append((step, time.perf_counter() - start))
+    return result
+
+
+def profile_first_calls(input_csv_path):
+    """
+    Time the first calls of a map_new_data run in this process.
+
+    The first reducer.transform includes numba compilation (or loading from the
+    cache); the second one shows the steady-state cost.
+
+    Returns:
+        List of (step, seconds)
+    """
+    from credit_schema import read_credit_csv
+    from feature_encoder import load_feature_encoder
+    from map_to_umap_embeddings import load_original_model, warm_up_transform
+
+    timings = []
+    reducer, preprocessor = _timed(timings, 'load UMAP model and preprocessor', load_original_model)
+    if reducer is None:
+        return timings
+    feature_encoder = _timed(timings, 'load feature encoder', load_feature_encoder)
+
+    # The same schema-checked read and grouping as map_new_data
+    df, _ = _timed(timings, 'read input CSV (read_credit_csv)', read_credit_csv, input_csv_path)
+    df = _timed(timings, 'feature_encoder.transform', feature_encoder.transform, df)
+    X = _timed(timings, 'first preprocessor.transform', preprocessor.transform, df)
+    _timed(timings, 'first reducer.transform', reducer.transform, X)
+    _timed(timings, 'second reducer.transform', reducer.transform, X)
+    return timings
+
+
+def print_startup_report(input_csv_path):
+    """Print import and first-call timings for mapping input_csv_path."""
+    cache_dir = configure_numba_cache()
+    print(f"Numba cache: {cache_dir}")
+
+    print("\nImports (fresh interpreter, incremental):")
+    for module, seconds in profile_imports():
+        print(f"  {module:<40} {seconds:8.3f}s")
+
+    print("\nFirst calls (this process):")
+    for step, seconds in profile_first_calls(input_csv_path):
+        print(f"  {step:<40} {seconds:8.3f}s")
+
+
+def warm_numba_cache():
+    """
+    Compile and cache the numba functions used by reducer.transform.
+
+    Run once per deployment (after generate_umap_embeddings.py) so the first
+    request does not pay for compiling what the cache can hold. It also checks
+    the sha256 of every file of the current bundle, which loaders skip.
+
+    Returns:
+        True if the saved model was found and exercised
+
+    Raises:
+        ArtifactVersionError: if a file of the current bundle does not match its manifest
+    """
+    cache_dir = configure_numba_cache()
+    from artifact_store import current_version, verify_bundle
+    from map_to_umap_embeddings import load_original_model, warm_up_transform
+
+    start = time.perf_counter()
+    if current_version() is not None:
+        print(f"Verified artifact bundle {verify_bundle()}")
+    reducer, _ = load_original_model()
+    if reducer is None:
+        return False
+    # One stored training row exercises the whole transform path
+    if not warm_up_transform(reducer):
+        return False
+    print(f"Warmed numba cache in {cache_dir} ({time.perf_counter() - start:.1f}s)")
+    return True
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description='Warm the numba cache or profile startup')
+    parser.add_argument('--warm', action='store_true', help='Compile and cache the UMAP transform functions')
+    parser.add_argument('--profile', metavar='INPUT_CSV', help='Print the startup report for mapping INPUT_CSV')
+    args = parser.parse_args()
+
+    # Resolve the input before switching to the directory with the model artifacts
+    profile_path = args.profile and os.path.abspath(args.profile)
+    os.chdir(SCRIPT_DIR)
+    if args.warm and not warm_numba_cache():
+        sys.exit(1)
+    if profile_path:
+        print_startup_report(profile_path)
+    if not (args.warm or args.profile):
+        parser.print_help()
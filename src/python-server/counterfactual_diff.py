@@ -0,0 +1,104 @@
+"""
+Differences between each counterfactual and the user's profile.
+
+The dashboard's counterfactual views (actionables, spider plot, feasibility)
+compare every counterfactual with the user row feature by feature on the
+client, on every interaction. The pipeline computes the comparison once
+instead, for all counterfactual rows (counterfactual == 1) against the user
+row (counterfactual == 2), one vectorized operation per feature:
+
+    changed_mask        bit j set if feature j of json_export.FEATURE_FIELDS differs
+    delta_<key>         counterfactual - user for the numeric features (age,
+                        credit_amount, duration, job)
+    feature_distance    Euclidean distance in the preprocessed feature space (the
+                        fitted preprocessor's scaling, the space UMAP was fitted in)
+    embedding_distance  Euclidean distance in the UMAP space
+
+The columns are added to the pipeline's DataFrame; json_export turns them into
+a 'diff' object on the counterfactual points. Rows without a diff (training
+and user rows) hold NaN distances and a zero mask.
+"""
+
+import numpy as np
+
+from json_export import FEATURE_FIELDS
+
+# Bit j of changed_mask stands for FEATURE_KEYS[j]
+FEATURE_KEYS = [key for key, _, _ in FEATURE_FIELDS]
+NUMERIC_FIELDS = [(key, column) for key, column, kind in FEATURE_FIELDS if kind in (int, float)]
+
+DIFF_COLUMNS = (['changed_mask'] + [f'delta_{key}' for key, _ in NUMERIC_FIELDS]
+                + ['feature_distance', 'embedding_distance'])
+
+
+def counterfactual_diffs(rows, coords, user, user_coords, preprocessor=None):
+    """
+    Compare rows with the user row.
+
+    Args:
+        rows: DataFrame with the feature columns
+        coords: UMAP coordinates of rows, shape (len(rows), 2)
+        user: The user row (one-row DataFrame with the feature columns)
+        user_coords: UMAP coordinates of the user row
+        preprocessor: Fitted preprocessor; without one feature_distance is NaN
+
+    Returns:
+        Dict of DIFF_COLUMNS name -> numpy array aligned with rows
+    """
+    mask = np.zeros(len(rows), dtype=np.uint16)
+    for bit, (_, column, _) in enumerate(FEATURE_FIELDS):
+        changed = rows[column].to_numpy(dtype=object) != user[column].iloc[0]
+        mask |= changed.astype(np.uint16) << bit
+
+    diffs = {'changed_mask': mask}
+    for key, column in NUMERIC_FIELDS:
+        diffs[f'delta_{key}'] = rows[column].to_numpy(dtype=float) - float(user[column].iloc[0])
+
+    diffs['feature_distance'] = np.full(len(rows), np.nan)
+    if preprocessor is not None and len(rows):
+        columns = [column for _, column, _ in FEATURE_FIELDS]
+        X = preprocessor.transform(rows[columns])
+        X_user = preprocessor.transform(user[columns])
+        diffs['feature_distance'] = np.linalg.norm(X - X_user, axis=1)
+
+    offsets = np.asarray(coords, dtype=float) - np.asarray(user_coords, dtype=float)
+    diffs['embedding_distance'] = np.linalg.norm(offsets, axis=1)
+    return diffs
+
+
+def add_counterfactual_diffs(df, coords, preprocessor=None, user=None, user_coords=None):
+    """
+    Add the DIFF_COLUMNS to a frame of the joint dataset, in place.
+
+    Args:
+        df: Rows of the joint dataset with their 'counterfactual' labels
+        coords: UMAP coordinates aligned with df, shape (len(df), 2)
+        preprocessor: Fitted preprocessor for feature_distance (NaN if None)
+        user: Reference user row (one-row DataFrame); the first user row of df if None
+        user_coords: UMAP coordinates of user (required with user)
+
+    Returns:
+        df with the diff columns filled in for the counterfactual rows; unchanged
+        if there is no user row to compare with
+    """
+    coords = np.asarray(coords, dtype=float)
+    if user is None:
+        is_user = (df['counterfactual'] == 2).to_numpy()
+        if not is_user.any():
+            return df
+        # One user row per run; the first one is the reference
+        user_position = np.flatnonzero(is_user)[0]
+        user, user_coords = df.iloc[[user_position]], coords[user_position]
+
+    is_counterfactual = (df['counterfactual'] == 1).to_numpy()
+    diffs = counterfactual_diffs(df[is_counterfactual], coords[is_counterfactual], user, user_coords,
+                                 preprocessor)
+
+    for name, values in diffs.items():
+        if name == 'changed_mask':
+            column = np.zeros(len(df), dtype=np.uint16)
+        else:
+            column = np.full(len(df), np.nan)
+        column[is_counterfactual] = values
+        df[name] = column
+    return df
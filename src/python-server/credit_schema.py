@@ -0,0 +1,291 @@
+"""
+Declared schema for the credit-record CSVs.
+
+Every stage used to read its CSVs with default pandas inference, fix the
+column names afterwards and drop incomplete rows with dropna, without saying
+why rows disappeared. read_credit_csv reads them against a declared schema
+instead:
+
+- the header is read first and every known column gets its dtype up front:
+  small fixed-width integers for the numeric features, pandas categoricals for
+  the categorical ones, float64 for the R model outputs; columns the schema
+  does not know keep pandas inference
+- column names are normalized once, from the header (lowercase, R-style
+  dotted names mapped to the training names, see feature_encoder.py), and
+  the R row-name column is never parsed
+- rows that are missing a required column, hold text where a number is
+  expected, a fractional value in an integer column or a value outside the
+  declared range are rejected and counted per reason in an IngestReport,
+  with the line numbers of the first few examples
+
+Integers are parsed as int64 and only narrowed after the range check (the
+parser would silently wrap an out-of-range value in a narrow column). Typed
+parsing is the fast path; a file whose integer columns hold NA or fractions
+is re-read with float64 numeric columns, and one with malformed text in a
+numeric column with text numeric columns that are checked cell by cell.
+"""
+
+import collections
+import json
+
+import numpy as np
+import pandas as pd
+
+from feature_encoder import normalize_column_names
+from pipeline_runs import atomic_write
+
+
+class SchemaError(ValueError):
+    """The CSV cannot be read against the schema (e.g. a required column is missing)."""
+
+
+# Normalized column name -> dtype and, for integers, the accepted range
+# (defaults to the range of the dtype)
+COLUMN_SCHEMA = {
+    'age': {'dtype': 'int16', 'min': 0, 'max': 150},
+    'sex': {'dtype': 'category'},
+    # The preprocessor's OrdinalEncoder only knows the job levels 0-3
+    'job': {'dtype': 'int8', 'min': 0, 'max': 3},
+    'housing': {'dtype': 'category'},
+    'saving accounts': {'dtype': 'category'},
+    'checking account': {'dtype': 'category'},
+    'credit amount': {'dtype': 'int32', 'min': 0},
+    'duration': {'dtype': 'int16', 'min': 0},
+    'purpose': {'dtype': 'category'},
+    'risk': {'dtype': 'category'},
+    'counterfactual': {'dtype': 'int8', 'min': 0, 'max': 2},
+    # Outputs of the R model and counterfactual search
+    'pred': {'dtype': 'float64'},
+    'dist.x.interest': {'dtype': 'float64'},
+    'nr.changed': {'dtype': 'float64'},
+    'dist.train': {'dtype': 'float64'},
+    'dist.target': {'dtype': 'float64'},
+}
+
+FEATURE_COLUMNS = ['age', 'sex', 'job', 'housing', 'saving accounts', 'checking account',
+                   'credit amount', 'duration', 'purpose']
+
+# Rejected rows listed individually in a report
+MAX_REPORT_EXAMPLES = 20
+
+
+def _is_integer(dtype):
+    return dtype.startswith('int')
+
+
+def _is_numeric(dtype):
+    return dtype != 'category'
+
+
+class IngestReport:
+    """Rows read and rejected by read_credit_csv, with the reasons."""
+
+    def __init__(self, path=None):
+        self.path = path
+        self.rows_read = 0
+        self.rows_rejected = 0
+        self.reasons = collections.Counter()
+        self.examples = []
+
+    @property
+    def rows_kept(self):
+        return self.rows_read - self.rows_rejected
+
+    def reject(self, positions, errors):
+        """
+        Record rejected rows.
+
+        Args:
+            positions: Data row positions (0 = first row after the header)
+            errors: List of reasons per row
+        """
+        self.rows_rejected += len(positions)
+        for position, row_errors in zip(positions, errors):
+            self.reasons.update(row_errors)
+            if len(self.examples) < MAX_REPORT_EXAMPLES:
+                # Line numbers count the header as line 1
+                self.examples.append({'line': int(position) + 2, 'errors': row_errors})
+
+    def as_dict(self):
+        return {
+            'path': self.path,
+            'rows_read': self.rows_read,
+            'rows_kept': self.rows_kept,
+            'rows_rejected': self.rows_rejected,
+            'reasons': dict(self.reasons.most_common()),
+            'examples': self.examples,
+        }
+
+    def summary(self):
+        """One line for the logs."""
+        text = f"Read {self.rows_read:,} rows from {self.path}, rejected {self.rows_rejected:,}"
+        if self.reasons:
+            text += ' (' + ', '.join(f'{reason}: {count:,}' for reason, count in self.reasons.most_common(5)) + ')'
+        return text
+
+    def write(self, path):
+        with atomic_write(path) as f:
+            json.dump(self.as_dict(), f, indent=2)
+
+
+def _read_header(path):
+    """Raw and normalized column names, without the R row-name column."""
+    raw = list(pd.read_csv(path, nrows=0).columns)
+    if raw and (raw[0] == '' or raw[0].startswith('Unnamed: 0')):
+        raw = raw[1:]
+    return raw, normalize_column_names(raw)
+
+
+# How numeric columns are parsed, from fastest to most forgiving (see the module docstring)
+_NUMERIC_READ_MODES = ['int64', 'float64', 'string']
+
+
+def _dtypes(raw, normalized, numeric_as):
+    """read_csv dtypes of the known columns; integers are parsed as numeric_as."""
+    dtypes = {}
+    for raw_name, name in zip(raw, normalized):
+        spec = COLUMN_SCHEMA.get(name)
+        if spec is None:
+            continue
+        if not _is_numeric(spec['dtype']):
+            dtypes[raw_name] = spec['dtype']
+        elif numeric_as == 'string':
+            dtypes[raw_name] = 'string'
+        elif _is_integer(spec['dtype']):
+            dtypes[raw_name] = numeric_as
+        else:
+            dtypes[raw_name] = 'float64'
+    return dtypes
+
+
+def _validate(df, required, report):
+    """Reject invalid rows of a chunk and cast the kept ones to the declared dtypes."""
+    errors = collections.defaultdict(list)
+    bad = np.zeros(len(df), dtype=bool)
+
+    def flag(mask, reason):
+        nonlocal bad
+        mask = np.asarray(mask, dtype=bool)
+        for i in np.flatnonzero(mask):
+            errors[i].append(reason)
+        bad |= mask
+
+    for name in df.columns:
+        spec = COLUMN_SCHEMA.get(name)
+        if spec is None:
+            continue
+        column = df[name]
+        missing = column.isna().to_numpy()
+
+        if _is_numeric(spec['dtype']) and not pd.api.types.is_numeric_dtype(column.dtype):
+            # Read as text: find the cells that are not numbers
+            column = pd.to_numeric(column, errors='coerce').astype('float64')
+            flag(column.isna().to_numpy() & ~missing, f'{name}: not a number')
+
+        if _is_integer(spec['dtype']):
+            values = column.to_numpy(dtype=float)
+            present = ~np.isnan(values)
+            flag(present & (values != np.round(values)), f'{name}: not an integer')
+            info = np.iinfo(spec['dtype'])
+            low, high = spec.get('min', info.min), spec.get('max', info.max)
+            flag(present & ((values < low) | (values > high)), f'{name}: outside {low}-{high}')
+
+        if name in required:
+            flag(missing, f'{name}: missing')
+        df[name] = column
+
+    if bad.any():
+        report.reject(df.index[bad], [errors[i] for i in np.flatnonzero(bad)])
+        df = df[~bad]
+
+    # Rows left are in range: narrow the integer columns (optional ones may still hold NA)
+    for name in df.columns:
+        spec = COLUMN_SCHEMA.get(name)
+        if spec is not None and _is_integer(spec['dtype']):
+            column = df[name]
+            df[name] = column.astype(spec['dtype'] if not column.isna().any() else spec['dtype'].capitalize())
+    return df
+
+
+def _chunks(path, raw, normalized, chunksize, numeric_as, skip=0):
+    """Typed chunks with normalized names and the data row position as index."""
+    reader = pd.read_csv(
+        path, usecols=raw, dtype=_dtypes(raw, normalized, numeric_as),
+        skiprows=range(1, skip + 1), chunksize=chunksize or None,
+    )
+    chunks = reader if chunksize else [reader]
+    position = skip
+    for chunk in chunks:
+        # usecols keeps the file's column order; rename in that order
+        chunk.columns = [normalized[raw.index(col)] for col in chunk.columns]
+        chunk.index = pd.RangeIndex(position, position + len(chunk))
+        position += len(chunk)
+        yield chunk
+
+
+def iter_credit_csv(path, chunksize=None, required=FEATURE_COLUMNS, report=None):
+    """
+    Read a credit-record CSV against the schema, chunk by chunk.
+
+    Args:
+        path: CSV file
+        chunksize: Rows per chunk (None reads the file as one chunk)
+        required: Columns that must exist and be filled in; rows missing one are rejected
+        report: IngestReport to add to (a new one if None)
+
+    Yields:
+        (valid rows of the chunk, report); the index is the row position in the
+        file (0 = first data row), so it stays unique across chunks
+
+    Raises:
+        SchemaError: if a required column is not in the file
+    """
+    report = report or IngestReport(path)
+    raw, normalized = _read_header(path)
+    absent = [name for name in required if name not in normalized]
+    if absent:
+        raise SchemaError(f"{path} is missing the columns {absent}")
+
+    position = 0
+    for mode in _NUMERIC_READ_MODES:
+        # A more forgiving mode continues where the previous one failed
+        chunks = _chunks(path, raw, normalized, chunksize, mode, skip=position)
+        while True:
+            # Only parsing falls back; errors of _validate and the consumer propagate
+            try:
+                chunk = next(chunks)
+            except StopIteration:
+                return
+            except (ValueError, TypeError, OverflowError):
+                if mode == _NUMERIC_READ_MODES[-1]:
+                    raise
+                break
+            valid = _validate(chunk, required, report)
+            # Count the chunk once it is done, so a retry never counts it twice
+            report.rows_read += len(chunk)
+            position += len(chunk)
+            yield valid, report
+
+
+def read_credit_csv(path, required=FEATURE_COLUMNS, report_path=None):
+    """
+    Read a whole credit-record CSV against the schema (see iter_credit_csv).
+
+    Args:
+        path: CSV file
+        required: Columns that must exist and be filled in
+        report_path: Optional JSON file for the IngestReport
+
+    Returns:
+        (DataFrame of the valid rows, IngestReport)
+    """
+    chunks = []
+    report = IngestReport(path)
+    for chunk, report in iter_credit_csv(path, required=required, report=report):
+        chunks.append(chunk)
+    df = chunks[0] if len(chunks) == 1 else pd.concat(chunks)
+    if report.rows_rejected:
+        print(report.summary())
+    if report_path:
+        report.write(report_path)
+    return df, report
@@ -0,0 +1,561 @@
+#!/usr/bin/env python3
+"""
+Long-lived embedding worker.
+
+Instead of launching run_umap_pipeline.py for every request, the Node route
+can start this script once and send it jobs over a stdin/stdout line protocol. The heavy imports, the training data and the saved
+preprocessor/UMAP model are loaded a single time and kept warm between jobs.
+
+Protocol (one JSON object per line):
+    -> {"id": "1", "cmd": "health"}
+    -> {"id": "2", "cmd": "run_pipeline", "run_id": "abc", "counterfactuals": "...", "user": "..."}
+    -> {"id": "3", "cmd": "map", "input": "new.csv", "output": "new.json"}
+    -> {"id": "4", "cmd": "neighbors", "rows": [{...credit record...}], "k": 5}
+    -> {"id": "5", "cmd": "cancel", "target": "2"}
+    -> {"id": "6", "cmd": "shutdown"}
+    <- {"id": "2", "ok": true, "result": {...}, "seconds": 0.12, "total_seconds": 0.5}
+    <- {"id": "3", "ok": false, "error": "..."}
+    <- {"id": "4", "ok": false, "error": "...", "status": "rejected" | "timeout" | "cancelled"}
+    <- {"id": "2", "event": "points", "points": [...], "seconds": 0.05}   (streaming run_pipeline)
+
+Jobs are dispatched by an asyncio loop through a JobQueue (see job_queue.py):
+at most --max-concurrency jobs run at once, at most --max-queue wait (more
+are rejected right away), and every job gets a timeout response after
+--job-timeout seconds or its own "timeout". Identical in-flight jobs are
+coalesced onto one computation (see EmbeddingWorker.coalescing_key; a job
+may pass its own "key") and their responses carry "coalesced": true.
+health and cancel are answered immediately; the queue counters are part of
+the health result. A run_pipeline job that nobody waits for any more (timed
+out or cancelled while running) stops before its next stage, so it does not
+hold its slot to the end. On EOF or shutdown the worker waits for running jobs.
+
+run_pipeline and map jobs may pass "engine": "surrogate" to place the new
+rows with the kNN surrogate projector instead of UMAP.transform (see
+surrogate_projector.py); its placement error is part of the health result.
+
+A run_pipeline job with "stream": true also gets the run's progress events
+(see pipeline_events.py) as messages carrying its id and an "event" field:
+stage starts and ends, then the user point and the counterfactual points as
+they are projected, and a "done" or "error" event, followed by the final
+response that ends the stream. Streaming jobs are
+not coalesced, since only the submitting caller would see the events.
+
+Projected rows are cached by content (see projection_cache.py), separately
+per engine; set
+PROJECTION_CACHE_PATH to a SQLite file to keep the cache across restarts. The
+cache counters are part of the health result.
+
+Every run_pipeline job records per-stage metrics (see pipeline_metrics.py).
+They are returned as result["metrics"] and, if PIPELINE_METRICS_FILE /
+PIPELINE_PROMETHEUS_FILE are set, appended as JSON lines and exported in the
+Prometheus text format. Artifact loading at start-up is recorded once as the
+'artifact_load' stage of run_id "startup".
+
+The artifacts are reloaded when generate_umap_embeddings.py makes a new
+bundle current: every job first compares artifacts/CURRENT with the version
+it has loaded (see EmbeddingWorker.current_artifacts).
+
+On startup the worker writes {"event": "ready", ...} once it can accept jobs.
+stdout is reserved for protocol messages; everything the stages print is
+redirected to stderr.
+"""
+
+import argparse
+import asyncio
+import contextlib
+import hashlib
+import json
+import os
+import sys
+import threading
+import time
+
+import pandas as pd
+
+import pipeline_runs
+from job_queue import (
+    DEFAULT_MAX_CONCURRENCY, DEFAULT_MAX_QUEUE, JobAbandonedError, JobCancelledError, JobQueue, JobTimeoutError,
+    QueueFullError
+)
+from pipeline_events import EventStream
+from pipeline_metrics import PipelineMetrics
+from create_joint_dataset import DEFAULT_COUNTERFACTUALS_PATH, DEFAULT_USER_PATH, load_r_output
+
+# Protocol messages go to the real stdout, stage logs go to stderr
+_protocol_out = sys.stdout
+# Streaming jobs send events from their worker threads
+_protocol_lock = threading.Lock()
+
+# Seconds a job may take before its caller gets a timeout response, unless the job
+# passes its own "timeout" (the Node client sends its limit with every job)
+DEFAULT_JOB_TIMEOUT = 110.0
+
+
+def send_message(message):
+    """Write a single protocol message and flush it."""
+    line = json.dumps(message) + "\n"
+    with _protocol_lock:
+        _protocol_out.write(line)
+        _protocol_out.flush()
+
+
+class WorkerArtifacts:
+    """
+    The model artifacts of one bundle, loaded together.
+
+    A job takes the current instance once and only uses that one, so a job
+    still running while a newer bundle is loaded never mixes two versions.
+    """
+
+    def __init__(self, bundle_version=None):
+        self.bundle_version = bundle_version    # artifact_store.current_version() when loaded
+        self.version = None                     # resolved version, part of the cache keys
+        self.feature_encoder = None
+        self.reducer = None
+        self.preprocessor = None
+        self.training_embedding = None
+        self.neighbor_index = None
+        self.projection_cache = None
+        self.surrogate = None
+        self.surrogate_cache = None
+        self.load_seconds = 0.0
+
+    @property
+    def models_loaded(self):
+        return self.reducer is not None and self.preprocessor is not None
+
+    def projector(self, job):
+        """(reducer, projection cache) of the job's 'engine', 'umap' by default."""
+        engine = job.get('engine', 'umap')
+        if engine == 'umap':
+            return self.reducer, self.projection_cache
+        if engine != 'surrogate':
+            raise ValueError(f"Unknown projection engine: {engine}")
+        if self.surrogate is None:
+            raise RuntimeError("The artifact bundle has no surrogate projector. "
+                               "Please run generate_umap_embeddings.py again.")
+        return self.surrogate, self.surrogate_cache
+
+
+class EmbeddingWorker:
+    """Holds the warm libraries and model artifacts between jobs."""
+
+    def __init__(self):
+        self.started_at = time.time()
+        self.jobs_done = 0
+        self.jobs_failed = 0
+        self.job_queue = None
+        self.counter_lock = threading.Lock()
+        self.reload_lock = threading.Lock()
+
+        with contextlib.redirect_stdout(sys.stderr):
+            # Importing the stage modules pulls in sklearn/umap once
+            import artifact_store
+            import create_joint_dataset
+            import generate_umap_with_counterfactuals
+            import map_to_umap_embeddings
+            import run_umap_pipeline
+
+            self.artifact_store = artifact_store
+            self.generate_umap_with_counterfactuals = generate_umap_with_counterfactuals
+            self.map_to_umap_embeddings = map_to_umap_embeddings
+            self.run_umap_pipeline = run_umap_pipeline
+
+            self.training = create_joint_dataset.load_training_data()
+
+            self.artifacts = self.load_artifacts(artifact_store.current_version())
+            PipelineMetrics('startup').add_stage('artifact_load', self.artifacts.load_seconds,
+                                                 artifact_version=self.artifacts.version)
+
+        self.startup_seconds = time.time() - self.started_at
+
+    def load_artifacts(self, bundle_version):
+        """
+        Load every artifact from one bundle and warm the transform up.
+
+        Every artifact comes from bundle_version, even if a new bundle becomes
+        current while loading.
+
+        Returns:
+            WorkerArtifacts (models_loaded is False if the bundle has no model)
+        """
+        import feature_encoder
+        import neighbor_index
+        import projection_cache
+
+        start = time.perf_counter()
+        artifacts = WorkerArtifacts(bundle_version)
+        artifacts.feature_encoder = feature_encoder.load_feature_encoder(version=bundle_version)
+        artifacts.reducer, artifacts.preprocessor = self.map_to_umap_embeddings.load_original_model(
+            version=bundle_version)
+        if artifacts.models_loaded:
+            artifacts.version = bundle_version or self.artifact_store.resolve_version()
+            artifacts.training_embedding = self.map_to_umap_embeddings.load_training_embedding(
+                version=bundle_version)
+            artifacts.neighbor_index = neighbor_index.load_neighbor_index(version=bundle_version)
+            artifacts.projection_cache = projection_cache.ProjectionCache(
+                artifacts.version,
+                disk_path=os.environ.get('PROJECTION_CACHE_PATH'),
+            )
+            artifacts.surrogate = self.load_surrogate(bundle_version)
+            if artifacts.surrogate is not None:
+                # Its coordinates differ from UMAP.transform, so it gets its own cache keys
+                artifacts.surrogate_cache = projection_cache.ProjectionCache(
+                    f'{artifacts.version}+surrogate',
+                    disk_path=os.environ.get('PROJECTION_CACHE_PATH'),
+                )
+        artifacts.load_seconds = time.perf_counter() - start
+        if artifacts.models_loaded:
+            self.warm_up(artifacts)
+        return artifacts
+
+    def current_artifacts(self):
+        """
+        Artifacts of the current bundle, reloaded first if it changed.
+
+        generate_umap_embeddings.py (save_bundle) moves artifacts/CURRENT when it
+        writes a new bundle; the next job notices and loads it. If loading fails
+        the previous artifacts stay in use and the next job tries again.
+        """
+        bundle_version = self.artifact_store.current_version()
+        if bundle_version == self.artifacts.bundle_version:
+            return self.artifacts
+        with self.reload_lock:
+            # Another job may have loaded it while this one waited for the lock
+            if bundle_version != self.artifacts.bundle_version:
+                print(f"Artifact bundle changed from {self.artifacts.bundle_version} to {bundle_version}, reloading")
+                try:
+                    artifacts = self.load_artifacts(bundle_version)
+                except Exception as e:
+                    print(f"Warning: Could not load artifact bundle {bundle_version}: {e}")
+                    return self.artifacts
+                self.artifacts = artifacts
+                PipelineMetrics('reload').add_stage('artifact_load', artifacts.load_seconds,
+                                                    artifact_version=artifacts.version)
+            return self.artifacts
+
+    def load_surrogate(self, version):
+        """Load the bundle's surrogate projector; bundles written before it existed have none."""
+        import joblib
+        from surrogate_projector import SURROGATE_PATH
+
+        try:
+            return joblib.load(self.artifact_store.artifact_path(SURROGATE_PATH, version=version))
+        except (FileNotFoundError, self.artifact_store.ArtifactVersionError):
+            print("Surrogate projector not found, only the 'umap' engine is available")
+            return None
+
+    def warm_up(self, artifacts):
+        """Project one training row so numba compiles the transform kernels before the first job."""
+        print("Warming up UMAP transform...")
+        self.map_to_umap_embeddings.warm_up_transform(artifacts.reducer, version=artifacts.bundle_version)
+
+    @property
+    def models_loaded(self):
+        return self.artifacts.models_loaded
+
+    def health(self):
+        """Readiness and liveness information for the caller."""
+        artifacts = self.artifacts
+        return {
+            'status': 'ready',
+            'pid': os.getpid(),
+            'models_loaded': artifacts.models_loaded,
+            'artifact_version': artifacts.version,
+            'neighbor_index_loaded': artifacts.neighbor_index is not None,
+            'projection_cache': artifacts.projection_cache.stats() if artifacts.projection_cache else None,
+            'surrogate_cache': artifacts.surrogate_cache.stats() if artifacts.surrogate_cache else None,
+            'surrogate_placement_error': artifacts.surrogate.placement_error if artifacts.surrogate else None,
+            'uptime_seconds': round(time.time() - self.started_at, 3),
+            'startup_seconds': round(self.startup_seconds, 3),
+            'artifact_load_seconds': round(artifacts.load_seconds, 3),
+            'jobs_done': self.jobs_done,
+            'jobs_failed': self.jobs_failed,
+            'queue': self.job_queue.stats() if self.job_queue else None,
+        }
+
+    def run_pipeline(self, job, abandoned=None):
+        """
+        Same stages as run_umap_pipeline.py, executed in this process on the
+        warm model and the cached training data.
+
+        With a 'run_id' the run's files are kept in runs/<run_id>/, like
+        run_umap_pipeline.py --run-id. With 'stream': true the progress events
+        are sent while the job runs (see the module docstring). Once the
+        abandoned event is set (nobody waits for the result any more, see
+        job_queue.py) the run stops before its next stage.
+        """
+        output_dir = os.getcwd()
+        run_id = job.get('run_id')
+        if run_id:
+            output_dir = pipeline_runs.get_run_dir(run_id)
+            pipeline_runs.cleanup_stale_runs(keep={run_id})
+            self.generate_umap_with_counterfactuals.prune_training_layers()
+
+        artifacts = self.current_artifacts()
+        reducer, cache = artifacts.projector(job)
+        events = None
+        if job.get('stream'):
+            job_id = job.get('id')
+            events = EventStream(lambda event: send_message({'id': job_id, **event}), run_id)
+
+        def on_stage(event):
+            if abandoned is not None and abandoned.is_set() and event['event'] == 'stage_started':
+                raise JobAbandonedError(f"Stopped before '{event['stage']}': nobody waits for the result")
+            if events:
+                events.stage(event)
+
+        metrics = PipelineMetrics(run_id, listener=on_stage)
+        try:
+            with metrics.stage('load_inputs') as record:
+                counterfactuals, counterfactuals_report = load_r_output(
+                    job.get('counterfactuals') or DEFAULT_COUNTERFACTUALS_PATH)
+                user, user_report = load_r_output(job.get('user') or DEFAULT_USER_PATH)
+                record.rows(rows_out=len(counterfactuals) + len(user))
+                record['rows_rejected'] = counterfactuals_report.rows_rejected + user_report.rows_rejected
+
+            combined_df = self.run_umap_pipeline.run_pipeline(
+                self.training, counterfactuals, user,
+                reducer=reducer, preprocessor=artifacts.preprocessor,
+                training_embedding=artifacts.training_embedding, feature_encoder=artifacts.feature_encoder,
+                projection_cache=cache, metrics=metrics, on_points=events and events.points
+            )
+            output_paths = self.generate_umap_with_counterfactuals.write_outputs(
+                combined_df, output_dir, metrics=metrics)
+        except Exception as e:
+            metrics.finish(ok=False)
+            if events:
+                events.error(f"Pipeline failed: {e}")
+            raise
+        summary = metrics.finish()
+        if events:
+            events.done(outputs=[os.path.basename(path) for path in output_paths], stages=summary['stages'])
+        return {'points': len(combined_df), 'run_id': run_id, 'metrics': metrics.records + [summary]}
+
+    def map(self, job):
+        """
+        Project a CSV of new rows with the warm model.
+
+        With 'stream': true the rows are mapped in chunks of 'chunk_size' and
+        written as NDJSON (see map_to_umap_embeddings.map_new_data_streaming);
+        'workers' > 1 spreads the chunks over a process pool.
+        """
+        artifacts = self.current_artifacts()
+        if not artifacts.models_loaded:
+            raise RuntimeError("Model artifacts are not loaded. Please run generate_umap_embeddings.py first.")
+        if 'input' not in job or 'output' not in job:
+            raise ValueError("'map' jobs need 'input' and 'output' paths")
+        reducer, cache = artifacts.projector(job)
+        if job.get('stream'):
+            points = self.map_to_umap_embeddings.map_new_data_streaming(
+                job['input'], job['output'],
+                chunk_size=job.get('chunk_size', self.map_to_umap_embeddings.DEFAULT_CHUNK_SIZE),
+                columnar=job.get('columnar', False), reducer=reducer,
+                preprocessor=artifacts.preprocessor, feature_encoder=artifacts.feature_encoder,
+                workers=job.get('workers', 1), projection_cache=cache,
+                engine=job.get('engine', 'umap')
+            )
+        else:
+            points = self.map_to_umap_embeddings.map_new_data(
+                job['input'], job['output'], reducer=reducer, preprocessor=artifacts.preprocessor,
+                feature_encoder=artifacts.feature_encoder, projection_cache=cache
+            )
+        if points is None:
+            raise RuntimeError(f"Mapping {job['input']} failed")
+        return {'points': points}
+
+    def neighbors(self, job):
+        """
+        Find the 'k' most similar training applicants (see neighbor_index.py).
+
+        'rows' are credit records, compared in the preprocessed feature space;
+        'points' are [x, y] UMAP coordinates, compared in the 2D embedding.
+        """
+        artifacts = self.current_artifacts()
+        if artifacts.neighbor_index is None:
+            raise RuntimeError("Neighbor index is not loaded. Please run generate_umap_embeddings.py first.")
+        k = job.get('k', 5)
+        if 'points' in job:
+            return {'neighbors': artifacts.neighbor_index.query_records(job['points'], k, space='umap')}
+        if 'rows' not in job:
+            raise ValueError("'neighbors' jobs need 'rows' or 'points'")
+
+        rows = artifacts.feature_encoder.transform(pd.DataFrame(job['rows']))
+        X = artifacts.preprocessor.transform(rows)
+        return {'neighbors': artifacts.neighbor_index.query_records(X, k)}
+
+    def coalescing_key(self, job):
+        """
+        Key under which identical in-flight jobs share one computation, or None.
+
+        A job's own 'key' (e.g. a hash of the submitted features and locked set)
+        wins. Otherwise run_pipeline jobs are keyed by the content of their input
+        files and map jobs by their paths and options. Streaming run_pipeline
+        jobs are never coalesced.
+        """
+        cmd = job.get('cmd')
+        if cmd == 'run_pipeline' and job.get('stream'):
+            return None
+        # The same inputs projected by another engine are a different job
+        prefix = f"{cmd}:{job.get('engine', 'umap')}" if cmd in ('run_pipeline', 'map') else cmd
+        if job.get('key') is not None:
+            return f"{prefix}:{job['key']}"
+        if cmd == 'run_pipeline':
+            digest = hashlib.sha256()
+            try:
+                for path in [job.get('counterfactuals') or DEFAULT_COUNTERFACTUALS_PATH,
+                             job.get('user') or DEFAULT_USER_PATH]:
+                    with open(path, 'rb') as f:
+                        digest.update(hashlib.sha256(f.read()).digest())
+            except OSError:
+                # Let the job itself report the missing input
+                return None
+            return f"{prefix}:{digest.hexdigest()}"
+        if cmd == 'map':
+            options = {name: job.get(name) for name in ['input', 'output', 'stream', 'chunk_size', 'columnar', 'workers']}
+            return f"{prefix}:{json.dumps(options, sort_keys=True)}"
+        return None
+
+    def handle(self, job, abandoned=None):
+        """Dispatch one job and build the response message (abandoned: see JobQueue)."""
+        handlers = {
+            'health': lambda job: self.health(),
+            'run_pipeline': lambda job: self.run_pipeline(job, abandoned),
+            'map': self.map,
+            'neighbors': self.neighbors,
+        }
+        job_id = job.get('id')
+        cmd = job.get('cmd')
+        start = time.time()
+
+        if cmd not in handlers:
+            return {'id': job_id, 'ok': False, 'error': f"Unknown command: {cmd}"}
+
+        try:
+            # Stage output already goes to stderr (see main)
+            result = handlers[cmd](job)
+        except Exception as e:
+            with self.counter_lock:
+                self.jobs_failed += 1
+            return {'id': job_id, 'ok': False, 'error': str(e),
+                    'seconds': round(time.time() - start, 4)}
+
+        if cmd != 'health':
+            with self.counter_lock:
+                self.jobs_done += 1
+        return {'id': job_id, 'ok': True, 'result': result,
+                'seconds': round(time.time() - start, 4)}
+
+
+def read_lines(loop, lines):
+    """Feed stdin lines into an asyncio queue from a daemon thread (None marks EOF)."""
+    for line in sys.stdin:
+        loop.call_soon_threadsafe(lines.put_nowait, line)
+    loop.call_soon_threadsafe(lines.put_nowait, None)
+
+
+async def run_job(worker, queue, job):
+    """Run one job through the queue and send its response."""
+    job_id = job.get('id')
+    start = time.perf_counter()
+    try:
+        response, coalesced = await queue.submit(job, key=worker.coalescing_key(job), job_id=job_id,
+                                                 timeout=job.get('timeout'))
+        # Coalesced submissions share the first submission's response
+        response = dict(response, id=job_id)
+        if coalesced:
+            response['coalesced'] = True
+    except QueueFullError as e:
+        response = {'id': job_id, 'ok': False, 'error': str(e), 'status': 'rejected'}
+    except JobTimeoutError as e:
+        response = {'id': job_id, 'ok': False, 'error': str(e), 'status': 'timeout'}
+    except JobCancelledError as e:
+        response = {'id': job_id, 'ok': False, 'error': str(e), 'status': 'cancelled'}
+    response['total_seconds'] = round(time.perf_counter() - start, 4)
+    send_message(response)
+
+
+async def serve(worker, queue):
+    """Dispatch stdin jobs until EOF or a shutdown command, then wait for the running ones."""
+    loop = asyncio.get_running_loop()
+    lines = asyncio.Queue()
+    threading.Thread(target=read_lines, args=(loop, lines), daemon=True).start()
+
+    jobs = set()
+    shutdown = None
+    while True:
+        line = await lines.get()
+        if line is None:
+            break
+        line = line.strip()
+        if not line:
+            continue
+        try:
+            job = json.loads(line)
+        except json.JSONDecodeError as e:
+            send_message({'id': None, 'ok': False, 'error': f"Invalid JSON: {e}"})
+            continue
+
+        cmd = job.get('cmd')
+        if cmd == 'shutdown':
+            shutdown = job
+            break
+        if cmd == 'health':
+            # Answered right away, also while the queue is busy
+            send_message(worker.handle(job))
+        elif cmd == 'cancel':
+            cancelled = queue.cancel(job.get('target'))
+            send_message({'id': job.get('id'), 'ok': True, 'result': {'cancelled': cancelled}})
+        else:
+            task = asyncio.create_task(run_job(worker, queue, job))
+            jobs.add(task)
+            task.add_done_callback(jobs.discard)
+            # Let the job enter the queue before the next line (a cancel may follow right away)
+            await asyncio.sleep(0)
+
+    if jobs:
+        await asyncio.gather(*jobs)
+    await queue.drain()
+    if shutdown is not None:
+        send_message({'id': shutdown.get('id'), 'ok': True, 'result': worker.health()})
+
+
+def main(max_concurrency=DEFAULT_MAX_CONCURRENCY, max_queue=DEFAULT_MAX_QUEUE, job_timeout=DEFAULT_JOB_TIMEOUT):
+    """Serve jobs from stdin until EOF or a shutdown command."""
+    # The stages use paths relative to this directory, like run_umap_pipeline.run_script
+    os.chdir(os.path.dirname(os.path.abspath(__file__)))
+
+    # Jobs run in threads, so stage output is sent to stderr for the whole process
+    # instead of per job
+    sys.stdout = sys.stderr
+
+    try:
+        worker = EmbeddingWorker()
+    except Exception as e:
+        send_message({'event': 'failed', 'error': str(e)})
+        return False
+
+    queue = JobQueue(worker.handle, max_concurrency, max_queue, job_timeout)
+    worker.job_queue = queue
+    send_message({'event': 'ready', **worker.health()})
+
+    try:
+        asyncio.run(serve(worker, queue))
+    finally:
+        queue.shutdown()
+    return True
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description='Long-lived embedding worker (JSON lines on stdin/stdout)')
+    parser.add_argument('--max-concurrency', type=int, default=DEFAULT_MAX_CONCURRENCY,
+                        help='Jobs running at the same time')
+    parser.add_argument('--max-queue', type=int, default=DEFAULT_MAX_QUEUE,
+                        help='Waiting jobs before new ones are rejected')
+    parser.add_argument('--job-timeout', type=float, default=DEFAULT_JOB_TIMEOUT,
+                        help='Seconds a job may take before its caller gets a timeout')
+    args = parser.parse_args()
+
+    success = main(args.max_concurrency, args.max_queue, args.job_timeout)
+    if not success:
+        sys.exit(1)
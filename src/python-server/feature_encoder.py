@@ -0,0 +1,149 @@
+"""
+Single feature encoder shared by training, mapping and export.
+
+Every path that reads credit records (generate_umap_embeddings.py,
+create_joint_dataset.py, generate_umap_with_counterfactuals.py and
+map_to_umap_embeddings.py) normalizes them with FeatureEncoder so column names
+and category grouping are identical everywhere:
+
+- column names are lowercased and R-style dotted names are mapped to the
+  training names ('saving.accounts' -> 'saving accounts')
+- infrequent 'purpose' values are grouped into 'others' and 'quite rich'
+  savings into 'rich', matching the R model; lookups ignore case and already
+  grouped values map to themselves
+- grouped columns come back as pandas categoricals
+
+The grouping is applied to each column's distinct values through a lookup
+table, not per row. A fitted encoder (with the category levels of the training
+data) is saved as feature_encoder.joblib in the artifact bundle next to
+preprocessor.joblib (see artifact_store.py).
+"""
+
+import joblib
+import numpy as np
+import pandas as pd
+
+from artifact_store import artifact_path
+
+FEATURE_ENCODER_PATH = 'feature_encoder.joblib'
+
+COLUMN_RENAMES = {
+    'saving.accounts': 'saving accounts',
+    'checking.account': 'checking account',
+    'credit.amount': 'credit amount',
+}
+
+CATEGORICAL_COLUMNS = ['sex', 'housing', 'saving accounts', 'checking account', 'purpose']
+
+# Lowercased raw value -> group; values missing from a table fall back to its default
+PURPOSE_GROUPS = {
+    'radio/tv': 'radio/TV',
+    'car': 'car',
+    'furniture/equipment': 'furniture',
+    'furniture': 'furniture',
+}
+SAVING_GROUPS = {
+    'little': 'little',
+    'moderate': 'moderate',
+    'quite rich': 'rich',
+    'rich': 'rich',
+}
+
+# column -> (lookup table, default group or None to keep the raw value)
+CATEGORY_GROUPS = {
+    'purpose': (PURPOSE_GROUPS, 'others'),
+    'saving accounts': (SAVING_GROUPS, None),
+}
+
+
+def normalize_column_names(columns):
+    """Lowercase column names and map the R-style dotted names to the training names."""
+    names = [str(col).lower() for col in columns]
+    return [COLUMN_RENAMES.get(name, name) for name in names]
+
+
+def _group_values(series, groups, default):
+    """Apply a grouping table to the distinct values of a column, then broadcast back by code."""
+    categorical = pd.Categorical(series)
+    source = categorical.categories
+    lookup = np.array(
+        [groups.get(str(value).lower(), value if default is None else default) for value in source],
+        dtype=object,
+    )
+    codes = categorical.codes
+    grouped = np.full(len(codes), np.nan, dtype=object)
+    grouped[codes >= 0] = lookup[codes[codes >= 0]]
+    return grouped
+
+
+class FeatureEncoder:
+    """Normalizes credit records; fit() records the category levels of the training data."""
+
+    def __init__(self):
+        self.categories_ = {}
+
+    @property
+    def is_fitted(self):
+        return bool(self.categories_)
+
+    def normalize_columns(self, df):
+        """Return df with normalized column names (in place, like the old helpers)."""
+        df.columns = normalize_column_names(df.columns)
+        return df
+
+    def fit(self, df):
+        """Learn the category levels of the grouped training data."""
+        encoded = self._encode(df)
+        self.categories_ = {
+            col: sorted(encoded[col].dropna().unique().tolist())
+            for col in CATEGORICAL_COLUMNS if col in encoded.columns
+        }
+        return self
+
+    def transform(self, df):
+        """
+        Normalize column names and group categories.
+
+        Args:
+            df: Credit records with raw or already normalized column names
+
+        Returns:
+            New DataFrame; categorical columns use the fitted levels (plus any
+            unseen values, so no rows are silently lost)
+        """
+        encoded = self._encode(df)
+        for col in CATEGORICAL_COLUMNS:
+            if col not in encoded.columns:
+                continue
+            levels = list(self.categories_.get(col, []))
+            unseen = sorted(set(encoded[col].dropna().unique()) - set(levels))
+            encoded[col] = pd.Categorical(encoded[col], categories=levels + unseen)
+        return encoded
+
+    def fit_transform(self, df):
+        return self.fit(df).transform(df)
+
+    def _encode(self, df):
+        encoded = df.copy()
+        encoded.columns = normalize_column_names(encoded.columns)
+        for col, (groups, default) in CATEGORY_GROUPS.items():
+            if col in encoded.columns:
+                encoded[col] = _group_values(encoded[col], groups, default)
+        return encoded
+
+    def save(self, path=FEATURE_ENCODER_PATH):
+        joblib.dump(self, path)
+
+
+def load_feature_encoder(model_dir='.', version=None):
+    """
+    Load the fitted encoder saved by generate_umap_embeddings.py (from the
+    given or current artifact bundle, see artifact_store.artifact_path).
+
+    Falls back to an unfitted encoder, which applies the same normalization and
+    grouping but derives category levels from the data it sees.
+    """
+    try:
+        return joblib.load(artifact_path(FEATURE_ENCODER_PATH, model_dir, version))
+    except FileNotFoundError:
+        return FeatureEncoder()
@@ -1,126 +1,470 @@
 import pandas as pd
 import numpy as np
+import argparse
+import glob
+import hashlib
 import json
 import os
-import shutil
-# Removed: import umap
-
-# Load the joint data (original + counterfactuals)
-df = pd.read_csv('./joint_credit_data.csv')
-
-# Convert all column names to lowercase
-df.columns = [col.lower() for col in df.columns]
-
-# Define the columns we need for the JSON output
-required_columns = ['age', 'sex', 'job', 'housing', 'saving accounts', 'checking account', 
-                   'credit amount', 'duration', 'purpose', 'counterfactual']
-
-# Keep only rows that have all required feature columns
-df_features_clean = df[required_columns].dropna()
-valid_indices = df_features_clean.index
-df = df.loc[valid_indices].copy()
-
-# Group infrequent 'purpose' values (keeping logic consistent with previous version)
-purpose_mapping = {
-    'radio/TV': 'radio/TV',
-    'car': 'car',
-    'furniture/equipment': 'furniture'
-}
-df['purpose'] = df['purpose'].map(lambda x: purpose_mapping.get(x, 'others'))
-
-# Group 'saving accounts' levels
-saving_mapping = {
-    'little': 'little',
-    'moderate': 'moderate',
-    'quite rich': 'rich',
-    'rich': 'rich'
-}
-df['saving accounts'] = df['saving accounts'].map(lambda x: saving_mapping.get(x, x))
-
-# --- SKIPPING UMAP GENERATION ---
-print("Skipping UMAP calculation (generating random coordinates instead)...")
-
-# Generate random coordinates [0, 1] for x and y
-# This satisfies the frontend's need for x/y properties without running the heavy algorithm
-embedding = np.random.rand(len(df), 2)
-
-# Create DataFrame for merging
-umap_df = pd.DataFrame(embedding, columns=['UMAP1', 'UMAP2'])
-umap_df['counterfactual'] = df['counterfactual'].reset_index(drop=True)
-
-# Combine original data with the dummy embeddings
-# Reset index to ensure alignment
-df_reset = df.reset_index(drop=True)
-combined_df = pd.concat([df_reset, umap_df[['UMAP1', 'UMAP2']]], axis=1)
-
-# Handle risk column (fill missing with 'unknown')
-if 'risk' not in combined_df.columns:
-    combined_df['risk'] = 'unknown'
-else:
-    combined_df['risk'] = combined_df['risk'].fillna('unknown')
-
-# Create a list of dictionaries for JSON export
-json_data = []
-for idx, row in combined_df.iterrows():
-    # Determine data type based on counterfactual flag
-    data_type_map = {0: 'training', 1: 'counterfactual', 2: 'user'}
-    data_type = data_type_map.get(row['counterfactual'], 'unknown')
-    
-    point_data = {
-        'id': int(idx),
-        'x': float(row['UMAP1']), # Dummy coordinate
-        'y': float(row['UMAP2']), # Dummy coordinate
-        'risk': str(row['risk']),
-        'counterfactual': bool(row['counterfactual']),
-        'data_type': data_type,
-        'features': {
-            'age': float(row['age']),
-            'credit_amount': float(row['credit amount']),
-            'duration': float(row['duration']),
-            'job': int(row['job']),
-            'sex': str(row['sex']),
-            'housing': str(row['housing']),
-            'saving_accounts': str(row['saving accounts']),
-            'checking_account': str(row['checking account']),
-            'purpose': str(row['purpose'])
-        }
+import time
+
+from counterfactual_diff import add_counterfactual_diffs
+from feature_encoder import load_feature_encoder
+from json_export import build_point_columns, build_point_records, columns_to_records, write_points_json
+from artifact_store import current_version
+from map_to_umap_embeddings import load_original_model, load_training_embedding
+from pipeline_metrics import PipelineMetrics
+from credit_schema import FEATURE_COLUMNS, read_credit_csv
+from pipeline_runs import RUNS_DIR, atomic_copy
+from surrogate_projector import ENGINES
+
+SCRIPT_DIR = os.path.dirname(os.path.abspath(__file__))
+
+OUTPUT_NAME = 'german_credit_umap_with_counterfactuals'
+
+# Layered output: an immutable training layer named by its content hash, shared by
+# all requests, and a small per-request delta with the user and counterfactual points
+TRAINING_LAYER_NAME = 'german_credit_training'
+DELTA_FILENAME = 'german_credit_umap_delta.json'
+DELTA_VERSION = 1
+# Unreferenced training layers younger than this are kept (see prune_training_layers)
+TRAINING_LAYER_MIN_AGE_SECONDS = 10 * 60
+
+# Rows per projection batch (see project_incrementally)
+STREAM_BATCH_SIZE = 32
+
+def _projection_batches(df, positions, batch_size):
+    """Split the rows to project into the user rows, then batches of the others."""
+    is_user = df['counterfactual'].to_numpy()[positions] == 2
+    rest = positions[~is_user]
+    batches = [positions[is_user]] + [rest[i:i + batch_size] for i in range(0, len(rest), batch_size)]
+    return [batch for batch in batches if len(batch)]
+
+def load_projection_artifacts(reducer=None, preprocessor=None, training_embedding=None, feature_encoder=None,
+                              metrics=None, engine='umap'):
+    """
+    Load whichever of the projection artifacts were not passed in.
+
+    Model, feature encoder and cached coordinates must come from the same
+    artifact bundle, so they are all loaded from the current version; loading
+    is recorded as one 'artifact_load' stage.
+
+    Returns:
+        (reducer, preprocessor, training_embedding, feature_encoder); None for
+        artifacts that are missing
+    """
+    if reducer is None or preprocessor is None or training_embedding is None or feature_encoder is None:
+        with (metrics or PipelineMetrics()).stage('artifact_load') as record:
+            version = current_version()
+            record['artifact_version'] = version
+            if feature_encoder is None:
+                feature_encoder = load_feature_encoder(version=version)
+            if reducer is None or preprocessor is None:
+                reducer, preprocessor = load_original_model(version=version, engine=engine)
+            if reducer is not None and training_embedding is None:
+                training_embedding = load_training_embedding(version=version)
+    return reducer, preprocessor, training_embedding, feature_encoder
+
+def project_incrementally(df, reducer, preprocessor, training_embedding=None,
+                          projection_cache=None, metrics=None, on_batch=None,
+                          batch_size=STREAM_BATCH_SIZE):
+    """
+    Place the joint dataset in the saved UMAP space without refitting.
+
+    Training rows (counterfactual == 0) reuse their cached coordinates from
+    umap_embedding.npy if they are the rows the model was trained on (see
+    TrainingEmbedding.matches); only counterfactual and user rows go through
+    reducer.transform, in batches: the user rows first, then batch_size rows at
+    a time. UMAP.transform optimizes each call's rows together, so coordinates
+    depend on how the rows are batched; the batches are the same with and
+    without on_batch, so a streamed run places every point where a plain run
+    does. With on_batch each batch is handed over as soon as it is placed.
+
+    Args:
+        df: Joint dataset with grouped categories and a 'counterfactual' label column
+        reducer: Loaded UMAP model or surrogate projector (see load_projection_artifacts)
+        preprocessor: Loaded preprocessor
+        training_embedding: Cached TrainingEmbedding (None projects the training rows too)
+        projection_cache: Optional ProjectionCache; rows projected before are not
+            transformed again
+        metrics: PipelineMetrics of the run; projection is recorded as the 'project' stage
+        on_batch: Optional function called with (row positions in df, embedding) for
+            every projected batch of user and counterfactual rows; the embedding holds
+            the coordinates placed so far, which always include the user rows
+        batch_size: Counterfactual rows per batch
+
+    Returns:
+        Array of shape (len(df), 2) aligned with df
+    """
+    metrics = metrics or PipelineMetrics()
+
+    with metrics.stage('project', rows_in=len(df)) as record:
+        is_training = (df['counterfactual'] == 0).to_numpy()
+        embedding = np.empty((len(df), 2))
+
+        if training_embedding is not None and training_embedding.matches(df[is_training]):
+            embedding[is_training] = training_embedding.coordinates
+            to_project = ~is_training
+        else:
+            # Cached coordinates only line up with the rows the model was trained on
+            print("Warning: cached training embedding does not match the training rows, projecting them too "
+                  "(regenerate the artifacts with generate_umap_embeddings.py if the training data changed)")
+            to_project = np.ones(len(df), dtype=bool)
+
+        positions = np.flatnonzero(to_project)
+        for batch in _projection_batches(df, positions, batch_size):
+            rows = df.iloc[batch][FEATURE_COLUMNS]
+            if projection_cache is not None:
+                embedding[batch] = projection_cache.project(rows, preprocessor, reducer)
+            else:
+                embedding[batch] = reducer.transform(preprocessor.transform(rows))
+            if on_batch is not None:
+                new = batch[~is_training[batch]]
+                if len(new):
+                    on_batch(new, embedding)
+
+        record.rows(rows_out=len(embedding))
+        record['rows_reused'] = int(len(df) - to_project.sum())
+        record['rows_projected'] = int(to_project.sum())
+
+    print(f"Reused {len(df) - to_project.sum()} cached coordinates, projected {to_project.sum()} new rows")
+    return embedding
+
+def referenced_training_layers():
+    """Names of the training layers referenced by the kept run deltas (and the one in this directory)."""
+    delta_paths = glob.glob(os.path.join(RUNS_DIR, '*', DELTA_FILENAME)) + [os.path.join(SCRIPT_DIR, DELTA_FILENAME)]
+    referenced = set()
+    for path in delta_paths:
+        try:
+            with open(path) as f:
+                referenced.add(json.load(f)['training'])
+        except (OSError, ValueError, KeyError, TypeError):
+            # Removed by a concurrent cleanup, or not a layered delta
+            continue
+    return referenced
+
+def prune_training_layers(layer_dir=SCRIPT_DIR, min_age_seconds=TRAINING_LAYER_MIN_AGE_SECONDS):
+    """
+    Remove the training layers that no kept run delta refers to.
+
+    Run after cleanup_stale_runs, so a layer lives as long as the last run
+    that uses it. Layers written or reused within min_age_seconds are kept:
+    a run in progress may have written its layer but not its delta yet.
+
+    Returns:
+        List of removed file names
+    """
+    referenced = referenced_training_layers()
+    cutoff = time.time() - min_age_seconds
+    removed = []
+    for path in glob.glob(os.path.join(layer_dir, f'{TRAINING_LAYER_NAME}.*.json')):
+        name = os.path.basename(path)
+        try:
+            if name not in referenced and os.path.getmtime(path) < cutoff:
+                os.remove(path)
+                removed.append(name)
+        except FileNotFoundError:
+            # Removed by a concurrent run
+            continue
+    return removed
+
+def publish_outputs(output_paths):
+    """
+    Publish the outputs of a run as the current frontend data.
+
+    Files are copied into this directory (imported by the dashboard) and the
+    assets folder, each replaced with a single rename so concurrent runs never
+    leave a partially written file behind.
+    """
+    script_dir = SCRIPT_DIR
+
+    # Note: Using '../public/assets' based on your folder structure (src/python-server -> src/public/assets)
+    assets_dir = os.path.join(script_dir, '../public/assets')
+    if not os.path.exists(assets_dir):
+        try:
+            os.makedirs(assets_dir)
+        except OSError:
+            # Fallback if running from a different context
+            assets_dir = os.path.join(script_dir, '../../public/assets')
+
+    for target_dir in [script_dir, assets_dir]:
+        try:
+            for path in output_paths:
+                target = os.path.join(target_dir, os.path.basename(path))
+                if os.path.abspath(path) != os.path.abspath(target):
+                    atomic_copy(path, target)
+            print(f"Published data to {os.path.normpath(target_dir)} for frontend access")
+        except Exception as e:
+            print(f"Warning: Could not publish to {target_dir}: {e}")
+
+def embed_joint_dataset(df, incremental=True, reducer=None, preprocessor=None,
+                        training_embedding=None, feature_encoder=None, projection_cache=None,
+                        metrics=None, engine='umap', on_points=None):
+    """
+    Clean the joint dataset and attach UMAP coordinates, all in memory.
+
+    Args:
+        df: Joint dataset as built by create_joint_dataset.build_joint_dataset
+        incremental: Place rows with the saved UMAP model (see project_incrementally)
+            instead of writing random coordinates
+        reducer: Already loaded UMAP model, passed on to project_incrementally
+        preprocessor: Already loaded preprocessor, passed on to project_incrementally
+        training_embedding: Cached training coordinates, passed on to project_incrementally
+        feature_encoder: Fitted FeatureEncoder (loaded from disk if None)
+        projection_cache: Optional ProjectionCache, passed on to project_incrementally
+        metrics: PipelineMetrics of the run; cleaning is recorded as the 'clean' stage
+            (rows_dropped counts the rows removed by dropna)
+        engine: Projection engine, passed on to project_incrementally
+        on_points: Optional function called with the point records (as in the delta, see
+            write_delta) of the user and counterfactual rows as they are projected
+
+    Returns:
+        DataFrame of the kept rows with 'UMAP1'/'UMAP2' columns, 'risk' filled in and,
+        for the counterfactual rows, their diff against the user row (see counterfactual_diff.py)
+    """
+    metrics = metrics or PipelineMetrics()
+
+    if incremental:
+        # Loaded up front, since cleaning needs the feature encoder and the
+        # counterfactual diff the preprocessor
+        reducer, preprocessor, training_embedding, feature_encoder = load_projection_artifacts(
+            reducer, preprocessor, training_embedding, feature_encoder, metrics, engine)
+    elif feature_encoder is None:
+        with metrics.stage('artifact_load'):
+            feature_encoder = load_feature_encoder()
+
+    with metrics.stage('clean', rows_in=len(df)) as record:
+        # Normalize column names (lowercase)
+        df = feature_encoder.normalize_columns(df.copy())
+
+        # Keep only rows that have all feature columns and their source label
+        df = df.dropna(subset=FEATURE_COLUMNS + ['counterfactual'])
+
+        # Group infrequent 'purpose' values and 'saving accounts' levels
+        df = feature_encoder.transform(df)
+        record.rows(rows_out=len(df))
+
+    # One user row per run; the first one is the reference of every counterfactual diff
+    user_positions = np.flatnonzero((df['counterfactual'] == 2).to_numpy())
+    user_position = user_positions[0] if len(user_positions) else None
+    user = df.iloc[[user_position]] if user_position is not None else None
+
+    embedding = None
+    if incremental:
+        print("Projecting new rows into the saved UMAP space...")
+        on_batch = None
+        if on_points is not None:
+            def on_batch(positions, placed):
+                # Ids are positions in the cleaned frame, as in the final output
+                rows = fill_unknown_risk(df.iloc[positions])
+                coords = placed[positions]
+                if user is not None:
+                    # The user rows are placed before any counterfactual batch
+                    rows = add_counterfactual_diffs(rows, coords, preprocessor, user, placed[user_position])
+                on_points(build_point_records(rows, coords[:, 0], coords[:, 1], ids=positions,
+                                              include_counterfactual=True))
+        if reducer is not None and preprocessor is not None:
+            embedding = project_incrementally(df, reducer, preprocessor, training_embedding,
+                                              projection_cache, metrics, on_batch)
+
+    if embedding is None:
+        print("Skipping UMAP calculation (generating random coordinates instead)...")
+
+        # Generate random coordinates [0, 1] for x and y
+        # This satisfies the frontend's need for x/y properties without running the heavy algorithm
+        embedding = np.random.rand(len(df), 2)
+
+    # Create DataFrame for merging
+    umap_df = pd.DataFrame(embedding, columns=['UMAP1', 'UMAP2'])
+    umap_df['counterfactual'] = df['counterfactual'].reset_index(drop=True)
+
+    # Combine original data with the embeddings
+    # Reset index to ensure alignment
+    df_reset = df.reset_index(drop=True)
+    combined_df = pd.concat([df_reset, umap_df[['UMAP1', 'UMAP2']]], axis=1)
+
+    with metrics.stage('counterfactual_diff', rows_in=len(combined_df)) as record:
+        combined_df = fill_unknown_risk(combined_df)
+        if user is not None:
+            combined_df = add_counterfactual_diffs(combined_df, embedding, preprocessor, user,
+                                                   embedding[user_position])
+        record.rows(rows_out=len(combined_df))
+        record['rows_compared'] = int(combined_df['embedding_distance'].notna().sum()) \
+            if 'embedding_distance' in combined_df.columns else 0
+
+    return combined_df
+
+def fill_unknown_risk(df):
+    """Return df with missing (or absent) risk labels set to 'unknown'."""
+    df = df.copy()
+    if 'risk' not in df.columns:
+        df['risk'] = 'unknown'
+    else:
+        risk = df['risk']
+        if isinstance(risk.dtype, pd.CategoricalDtype) and 'unknown' not in risk.cat.categories:
+            risk = risk.cat.add_categories(['unknown'])
+        df['risk'] = risk.fillna('unknown')
+    return df
+
+def training_layer_hash(training_df):
+    """Content hash of the exported training rows (ids, features, labels and coordinates)."""
+    columns = [col for col in FEATURE_COLUMNS + ['risk', 'pred', 'UMAP1', 'UMAP2'] if col in training_df.columns]
+    hashed = pd.util.hash_pandas_object(training_df[columns], index=True)
+    return hashlib.sha256(hashed.to_numpy().tobytes()).hexdigest()[:16]
+
+def write_training_layer(training_df, output_dir=SCRIPT_DIR):
+    """
+    Save the training points as an immutable, content-hashed JSON file.
+
+    The file name contains the hash of its content, so it never changes once
+    written and can be cached forever; runs with the same model and training
+    data reuse the existing file without serializing it again.
+
+    Args:
+        training_df: Training rows of embed_joint_dataset's output (ids are its index)
+        output_dir: Directory of the training layer
+
+    Returns:
+        Path of the training layer
+    """
+    path = os.path.join(output_dir, f'{TRAINING_LAYER_NAME}.{training_layer_hash(training_df)}.json')
+    if not os.path.exists(path):
+        records = build_point_records(training_df, training_df['UMAP1'], training_df['UMAP2'],
+                                      ids=training_df.index, include_counterfactual=True)
+        write_points_json(records, path, compact=True)
+        print(f"Saved training layer to '{path}'")
+    else:
+        # Marks the layer as in use for prune_training_layers
+        os.utime(path)
+    return path
+
+def write_delta(new_df, training_path, training_count, output_path, compact=False):
+    """
+    Save the user and counterfactual points of a run together with a reference to its training layer.
+
+    Args:
+        new_df: Non-training rows of embed_joint_dataset's output (ids are its index)
+        training_path: Training layer the points belong to (see write_training_layer)
+        training_count: Number of points in the training layer
+        output_path: Delta JSON to write
+        compact: Write without indentation
+    """
+    delta = {
+        'version': DELTA_VERSION,
+        'training': os.path.basename(training_path),
+        'trainingCount': training_count,
+        'count': len(new_df),
+        'points': build_point_records(new_df, new_df['UMAP1'], new_df['UMAP2'],
+                                      ids=new_df.index, include_counterfactual=True),
     }
-    
-    # Add prediction probability if available
-    if 'pred' in row and pd.notna(row['pred']):
-        point_data['pred'] = float(row['pred'])
-    
-    json_data.append(point_data)
-
-# Save as JSON
-output_filename = 'german_credit_umap_with_counterfactuals.json'
-with open(output_filename, 'w') as f:
-    json.dump(json_data, f, indent=2)
-
-print(f"\nSaved data to '{output_filename}'")
-
-# Copy the JSON file to the assets directory for the frontend
-# Note: Using '../public/assets' based on your folder structure (src/python-server -> src/public/assets)
-assets_dir = '../public/assets' 
-if not os.path.exists(assets_dir):
-    try:
-        os.makedirs(assets_dir)
-    except OSError:
-        # Fallback if running from a different context
-        pass
-
-try:
-    shutil.copy2(output_filename, os.path.join(assets_dir, output_filename))
-    print(f"Copied data to {assets_dir} for frontend access")
-except Exception as e:
-    print(f"Warning: Could not copy to assets folder: {e}")
-    # Try one level deeper just in case the execution context is different
-    try:
-        alt_assets_dir = '../../public/assets'
-        if os.path.exists(os.path.dirname(alt_assets_dir)):
-             shutil.copy2(output_filename, os.path.join(alt_assets_dir, output_filename))
-             print(f"Copied data to {alt_assets_dir} instead")
-    except:
-        pass
-
-print(f"Total data points processed: {len(json_data)}")
\ No newline at end of file
+    write_points_json(delta, output_path, compact=compact)
+
+def write_outputs(combined_df, output_dir='.', compact=False, columnar=False, publish=True,
+                  metrics=None, layered=True):
+    """
+    Save the embedded joint dataset for the frontend.
+
+    By default (layered) the training points go to a content-hashed training
+    layer that is only written when its content changes, and the run's user
+    and counterfactual points to a small delta JSON (DELTA_FILENAME), so the
+    per-run output grows with the number of new points only. Published runs
+    share the training layer in this directory, which the dashboard loads by
+    the name in the delta; the delta itself stays in output_dir (the run
+    directory) and is not published. With layered=False all points are written as one JSON.
+
+    Args:
+        combined_df: Output of embed_joint_dataset
+        output_dir: Directory for this run's delta (or full JSON)
+        compact: Write the JSON without indentation
+        columnar: Write one array per field instead of one record per point (full output)
+        publish: Write the training layer to this directory, or replace the shared frontend
+            copies of the full output (see publish_outputs)
+        metrics: PipelineMetrics of the run; recorded as the 'write_outputs' stage
+        layered: Write the training layer and delta instead of the full output
+
+    Returns:
+        List of written file paths
+    """
+    metrics = metrics or PipelineMetrics()
+
+    if layered:
+        with metrics.stage('write_outputs', rows_in=len(combined_df)) as record:
+            is_training = (combined_df['counterfactual'] == 0).to_numpy()
+            # Published runs share one training layer next to this script
+            training_path = write_training_layer(combined_df[is_training], SCRIPT_DIR if publish else output_dir)
+            delta_path = os.path.join(output_dir, DELTA_FILENAME)
+            write_delta(combined_df[~is_training], training_path, int(is_training.sum()), delta_path, compact)
+            print(f"\nSaved {int((~is_training).sum())} new points to '{delta_path}' "
+                  f"(training layer '{os.path.basename(training_path)}')")
+            # Every row is written, to the training layer or the delta
+            record.rows(rows_out=len(combined_df))
+            record['rows_training'] = int(is_training.sum())
+            record['rows_new'] = int((~is_training).sum())
+        return [training_path, delta_path]
+
+    with metrics.stage('write_outputs', rows_in=len(combined_df)) as record:
+        # Build the point records from whole columns and save as JSON
+        point_columns = build_point_columns(combined_df, combined_df['UMAP1'], combined_df['UMAP2'],
+                                            include_counterfactual=True)
+        json_data = point_columns if columnar else columns_to_records(point_columns)
+        output_path = os.path.join(output_dir, f'{OUTPUT_NAME}.json')
+        write_points_json(json_data, output_path, compact=compact)
+        output_paths = [output_path]
+
+        print(f"\nSaved data to '{output_path}'")
+
+        if publish:
+            publish_outputs(output_paths)
+        record.rows(rows_out=len(combined_df))
+
+    return output_paths
+
+def generate_umap_with_counterfactuals(incremental=True, reducer=None, preprocessor=None,
+                                       training_embedding=None, compact=False, columnar=False,
+                                       input_path='./joint_credit_data.csv', output_dir='.',
+                                       publish=True, feature_encoder=None, layered=True, engine='umap'):
+    """
+    Build the frontend JSON for the joint dataset CSV (training, counterfactuals and user)
+    and publish it to the assets folder.
+
+    Takes the arguments of embed_joint_dataset and write_outputs, plus:
+        input_path: Joint dataset CSV written by create_joint_dataset
+
+    Returns:
+        Number of data points written
+    """
+    # Load the joint data (original + counterfactuals)
+    df, _ = read_credit_csv(input_path, required=FEATURE_COLUMNS + ['counterfactual'])
+
+    combined_df = embed_joint_dataset(df, incremental, reducer, preprocessor, training_embedding,
+                                      feature_encoder, engine=engine)
+    write_outputs(combined_df, output_dir, compact, columnar, publish, layered=layered)
+
+    print(f"Total data points processed: {len(combined_df)}")
+
+    return len(combined_df)
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description='Build the frontend data for the joint dataset')
+    parser.add_argument('--input', default='./joint_credit_data.csv', help='Joint dataset CSV')
+    parser.add_argument('--output-dir', default='.', help='Directory for the JSON output')
+    parser.add_argument('--no-publish', action='store_true', help='Do not replace the shared frontend copies')
+    parser.add_argument('--random', action='store_true', help='Write random coordinates instead of projecting')
+    parser.add_argument('--compact', action='store_true', help='Write JSON without indentation')
+    parser.add_argument('--columnar', action='store_true', help='Write one JSON array per field')
+    parser.add_argument('--full', action='store_true',
+                        help='Write all points as one JSON instead of '
+                             'the training layer and delta')
+    parser.add_argument('--engine', choices=ENGINES, default='umap',
+                        help='Projection engine: the UMAP model, or the fast kNN surrogate')
+    args = parser.parse_args()
+
+    generate_umap_with_counterfactuals(
+        incremental=not args.random,
+        compact=args.compact,
+        columnar=args.columnar,
+        input_path=args.input,
+        output_dir=args.output_dir,
+        publish=not args.no_publish,
+        layered=not args.full,
+        engine=args.engine,
+    )
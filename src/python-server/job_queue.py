@@ -0,0 +1,197 @@
+"""
+asyncio front end for pipeline jobs.
+
+JobQueue runs a synchronous job function on a bounded thread pool and puts
+these limits in front of it:
+
+- at most max_concurrency jobs run at a time; the rest wait in the queue
+- at most max_queue jobs wait; further submissions are rejected at once
+  with QueueFullError, so a burst of requests gets backpressure instead of
+  piling up work
+- every caller waits at most `timeout` seconds (JobTimeoutError)
+- a submission can be cancelled by its id (JobCancelledError)
+- submissions with the same coalescing key while one is in flight share
+  that single computation and all receive its result
+
+A computation that nobody waits for any more (all of its callers timed out
+or cancelled) is dropped if it has not started yet. A running computation
+cannot be interrupted from outside; instead its `abandoned` event is set,
+and a job function that checks it between steps can stop early by raising
+JobAbandonedError, which frees its slot. Otherwise it finishes in the
+background, keeps its slot until then, and its result is discarded.
+"""
+
+import asyncio
+import concurrent.futures
+import threading
+
+DEFAULT_MAX_CONCURRENCY = 1
+DEFAULT_MAX_QUEUE = 16
+
+
+class QueueFullError(RuntimeError):
+    """The queue holds max_queue waiting jobs already."""
+
+
+class JobTimeoutError(TimeoutError):
+    """The job did not finish within the timeout."""
+
+
+class JobCancelledError(RuntimeError):
+    """The job was cancelled by the caller."""
+
+
+class JobAbandonedError(RuntimeError):
+    """Raised by a job function that stopped because nobody waits for its result."""
+
+
+class _Computation:
+    """One execution of the job function, shared by all coalesced submissions."""
+
+    def __init__(self, key):
+        self.key = key
+        self.future = None            # concurrent.futures.Future of the thread pool
+        self.result = None            # asyncio view of future, shared by the waiters
+        self.waiters = 0
+        self.abandoned = threading.Event()
+
+
+class JobQueue:
+    """Bounded, coalescing job runner for use from an asyncio event loop."""
+
+    def __init__(self, run, max_concurrency=DEFAULT_MAX_CONCURRENCY, max_queue=DEFAULT_MAX_QUEUE,
+                 timeout=None):
+        """
+        Args:
+            run: Function (job, abandoned) -> result, called in a worker thread; abandoned
+                is a threading.Event set once no caller waits for the result any more
+            max_concurrency: Jobs running at the same time
+            max_queue: Jobs waiting for a free slot before submissions are rejected
+            timeout: Default seconds a caller waits for its result (None waits forever)
+        """
+        self.run = run
+        self.max_concurrency = max_concurrency
+        self.max_queue = max_queue
+        self.timeout = timeout
+        self.executor = concurrent.futures.ThreadPoolExecutor(max_workers=max_concurrency,
+                                                              thread_name_prefix='job')
+        self.computations = set()
+        self.by_key = {}
+        self.tasks = {}               # job id -> asyncio.Task of the waiting caller
+        self.counts = {'submitted': 0, 'coalesced': 0, 'rejected': 0, 'timed_out': 0,
+                       'cancelled': 0, 'failed': 0, 'done': 0}
+
+    @property
+    def running(self):
+        return sum(1 for computation in self.computations if computation.future.running())
+
+    @property
+    def queued(self):
+        return len(self.computations) - self.running
+
+    def stats(self):
+        return {'running': self.running, 'queued': self.queued, 'max_concurrency': self.max_concurrency,
+                'max_queue': self.max_queue, **self.counts}
+
+    def _start(self, job, key):
+        computation = _Computation(key)
+        computation.future = self.executor.submit(self.run, job, computation.abandoned)
+        computation.result = asyncio.wrap_future(computation.future)
+        # An abandoned computation's exception has no waiter left to retrieve it
+        computation.result.add_done_callback(lambda f: f.cancelled() or f.exception())
+        self.computations.add(computation)
+        if key is not None:
+            self.by_key[key] = computation
+
+        def finished(_):
+            self.computations.discard(computation)
+            if key is not None and self.by_key.get(key) is computation:
+                del self.by_key[key]
+
+        # Done callbacks run in the worker thread; hand the bookkeeping to the loop
+        loop = asyncio.get_running_loop()
+        computation.future.add_done_callback(lambda f: loop.call_soon_threadsafe(finished, f))
+        return computation
+
+    async def submit(self, job, key=None, job_id=None, timeout=None):
+        """
+        Run a job, or join the in-flight computation with the same key.
+
+        Args:
+            job: Argument of the job function
+            key: Coalescing key (None never coalesces)
+            job_id: Id under which the submission can be cancelled
+            timeout: Seconds to wait for the result (the queue's default if None)
+
+        Returns:
+            (result, coalesced) where coalesced tells whether another submission's
+            computation was joined
+
+        Raises:
+            QueueFullError, JobTimeoutError, JobCancelledError, or whatever the job raised
+        """
+        self.counts['submitted'] += 1
+        computation = self.by_key.get(key) if key is not None else None
+        if computation is not None and (computation.future.cancelled() or computation.abandoned.is_set()):
+            # Dropped or stopping; its bookkeeping has not caught up yet
+            computation = None
+        coalesced = computation is not None
+        if coalesced:
+            self.counts['coalesced'] += 1
+        else:
+            if self.queued >= self.max_queue:
+                self.counts['rejected'] += 1
+                raise QueueFullError(f"Job queue is full ({self.max_queue} jobs waiting)")
+            computation = self._start(job, key)
+
+        computation.waiters += 1
+        timeout = self.timeout if timeout is None else timeout
+        waiter = asyncio.ensure_future(
+            asyncio.wait_for(asyncio.shield(computation.result), timeout)
+        )
+        if job_id is not None:
+            self.tasks[job_id] = waiter
+        try:
+            result = await waiter
+        except asyncio.TimeoutError:
+            self.counts['timed_out'] += 1
+            raise JobTimeoutError(f"Job did not finish within {timeout} seconds") from None
+        except asyncio.CancelledError:
+            self.counts['cancelled'] += 1
+            raise JobCancelledError("Job was cancelled") from None
+        except Exception:
+            self.counts['failed'] += 1
+            raise
+        finally:
+            computation.waiters -= 1
+            if job_id is not None:
+                self.tasks.pop(job_id, None)
+            if computation.waiters == 0 and not computation.future.done():
+                # Nobody is interested any more; drop it if it has not started,
+                # otherwise ask it to stop
+                if not computation.future.cancel():
+                    computation.abandoned.set()
+
+        self.counts['done'] += 1
+        return result, coalesced
+
+    def cancel(self, job_id):
+        """Cancel a waiting submission by id; returns whether it was found."""
+        waiter = self.tasks.get(job_id)
+        if waiter is None:
+            return False
+        waiter.cancel()
+        return True
+
+    async def drain(self):
+        """Wait until all computations, including abandoned ones, have finished."""
+        while self.computations:
+            futures = [c.result for c in self.computations if not c.future.cancelled()]
+            if futures:
+                await asyncio.wait(futures)
+            # Let the done callbacks update the bookkeeping
+            await asyncio.sleep(0)
+
+    def shutdown(self):
+        self.executor.shutdown(wait=False, cancel_futures=True)
+
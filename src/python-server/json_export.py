@@ -0,0 +1,196 @@
+"""
+Shared, vectorized JSON export for UMAP point data.
+
+All exporters (generate_umap_embeddings.py, generate_umap_with_counterfactuals.py
+and map_to_umap_embeddings.py) build the same point records:
+
+    {'id', 'x', 'y', 'risk', ['counterfactual', 'data_type'], 'features': {...}, ['pred'], ['diff']}
+
+Counterfactual points of a run also carry a 'diff' against the user's
+profile, computed by counterfactual_diff.py:
+
+    {'changed': [feature keys], 'deltas': {numeric key: delta}, 'feature_distance', 'embedding_distance'}
+
+The records are assembled from whole columns at once instead of iterating over
+DataFrame rows, and can also be written in a columnar layout (one array per field) or streamed
+as NDJSON (one compact JSON document per line).
+"""
+
+import json
+
+import numpy as np
+import pandas as pd
+
+from pipeline_runs import atomic_write
+
+# (JSON feature key, DataFrame column, value type)
+FEATURE_FIELDS = [
+    ('age', 'age', float),
+    ('credit_amount', 'credit amount', float),
+    ('duration', 'duration', float),
+    ('job', 'job', int),
+    ('sex', 'sex', str),
+    ('housing', 'housing', str),
+    ('saving_accounts', 'saving accounts', str),
+    ('checking_account', 'checking account', str),
+    ('purpose', 'purpose', str),
+]
+
+DATA_TYPES = {0: 'training', 1: 'counterfactual', 2: 'user'}
+
+# Numeric features with a delta in the 'diff' of counterfactual points
+DELTA_FEATURES = [key for key, _, kind in FEATURE_FIELDS if kind in (int, float)]
+
+
+def _nullable_floats(series):
+    """Floats with None for NaN."""
+    values = series.to_numpy(dtype=float)
+    return np.where(np.isnan(values), None, values).tolist()
+
+
+def _column_values(series, kind):
+    """Convert a column to a list of plain Python values of the given type."""
+    if kind is float:
+        return series.to_numpy(dtype=float).tolist()
+    if kind is int:
+        return series.to_numpy(dtype=float).astype(np.int64).tolist()
+    if kind is bool:
+        return series.to_numpy(dtype=float).astype(bool).tolist()
+    # Match str(value), including 'nan' for missing values
+    values = series.to_numpy(dtype=object)
+    return np.where(pd.isna(values), 'nan', values).astype(str).tolist()
+
+
+def build_point_columns(df, x, y, ids=None, include_counterfactual=False):
+    """
+    Build the point fields as one list per field.
+
+    Args:
+        df: DataFrame with the original feature columns ('credit amount', ...),
+            optionally 'risk', 'counterfactual' and 'pred'
+        x: UMAP x coordinates, aligned with the rows of df by position
+        y: UMAP y coordinates, aligned with the rows of df by position
+        ids: Point ids (defaults to row positions)
+        include_counterfactual: Add the 'counterfactual' and 'data_type' fields, and the
+            'diff' fields if df has the counterfactual_diff.py columns
+
+    Returns:
+        Dict of field name -> list, with the features nested under 'features'.
+        'pred' holds None where no prediction is available. 'diff' holds the
+        changed-feature bitmask ('changed'), the deltas per numeric feature and
+        the distances, None where a point has no diff.
+    """
+    n = len(df)
+    columns = {
+        'id': list(range(n)) if ids is None else np.asarray(ids).astype(np.int64).tolist(),
+        'x': np.asarray(x, dtype=float).tolist(),
+        'y': np.asarray(y, dtype=float).tolist(),
+        'risk': _column_values(df['risk'], str) if 'risk' in df.columns else ['unknown'] * n,
+    }
+
+    if include_counterfactual:
+        columns['counterfactual'] = _column_values(df['counterfactual'], bool)
+        columns['data_type'] = (
+            df['counterfactual'].map(DATA_TYPES).fillna('unknown').astype(str).tolist()
+        )
+
+    columns['features'] = {
+        key: _column_values(df[col], kind) for key, col, kind in FEATURE_FIELDS
+    }
+
+    if 'pred' in df.columns:
+        columns['pred'] = _nullable_floats(df['pred'])
+
+    if include_counterfactual and 'embedding_distance' in df.columns and df['embedding_distance'].notna().any():
+        columns['diff'] = {
+            'changed': df['changed_mask'].to_numpy(dtype=np.int64).tolist(),
+            'deltas': {key: _nullable_floats(df[f'delta_{key}']) for key in DELTA_FEATURES},
+            'feature_distance': _nullable_floats(df['feature_distance']),
+            'embedding_distance': _nullable_floats(df['embedding_distance']),
+        }
+
+    return columns
+
+
+def _diff_records(diff):
+    """Turn the 'diff' columns into one diff object per point (None where a point has none)."""
+    # Few distinct change sets per run: build each feature list once
+    feature_keys = [key for key, _, _ in FEATURE_FIELDS]
+    changed_lists = {
+        mask: [key for bit, key in enumerate(feature_keys) if mask >> bit & 1]
+        for mask in set(diff['changed'])
+    }
+    records = []
+    for i, (mask, embedding_distance) in enumerate(zip(diff['changed'], diff['embedding_distance'])):
+        if embedding_distance is None:
+            records.append(None)
+            continue
+        changed = changed_lists[mask]
+        record = {
+            'changed': changed,
+            'deltas': {key: diff['deltas'][key][i] for key in DELTA_FEATURES if key in changed},
+            'embedding_distance': embedding_distance,
+        }
+        if diff['feature_distance'][i] is not None:
+            record['feature_distance'] = diff['feature_distance'][i]
+        records.append(record)
+    return records
+
+
+def columns_to_records(columns):
+    """Turn the output of build_point_columns into a list of point records."""
+    feature_keys = list(columns['features'])
+    features = [
+        dict(zip(feature_keys, values)) for values in zip(*columns['features'].values())
+    ]
+
+    top_keys = [key for key in columns if key not in ('features', 'pred', 'diff')]
+    records = [
+        {**dict(zip(top_keys, values)), 'features': point_features}
+        for values, point_features in zip(zip(*(columns[key] for key in top_keys)), features)
+    ]
+
+    # 'pred' is only added to points that have one
+    if 'pred' in columns:
+        for record, pred in zip(records, columns['pred']):
+            if pred is not None:
+                record['pred'] = pred
+
+    # 'diff' only on points compared with the user's profile
+    if 'diff' in columns:
+        for record, diff in zip(records, _diff_records(columns['diff'])):
+            if diff is not None:
+                record['diff'] = diff
+
+    return records
+
+
+def build_point_records(df, x, y, ids=None, include_counterfactual=False):
+    """
+    Build the list of point records exported to the frontend.
+
+    Takes the same arguments as build_point_columns.
+    """
+    return columns_to_records(build_point_columns(df, x, y, ids, include_counterfactual))
+
+
+def write_points_json(data, path, compact=False):
+    """
+    Save point records (or columns) as JSON, replacing path atomically.
+
+    Args:
+        data: Output of build_point_records or build_point_columns
+        path: Output file path
+        compact: Write without indentation and whitespace
+    """
+    with atomic_write(path) as f:
+        if compact:
+            json.dump(data, f, separators=(',', ':'))
+        else:
+            json.dump(data, f, indent=2)
+
+
+def to_ndjson(items):
+    """Serialize each item (a point record or a chunk of columns) as one compact JSON line."""
+    return ''.join(json.dumps(item, separators=(',', ':')) + '\n' for item in items)
+
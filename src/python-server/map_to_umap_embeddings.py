@@ -1,105 +1,355 @@
-import pandas as pd
+import argparse
+import collections
+import concurrent.futures
+import itertools
+import multiprocessing
+import os
+import sys
+import time
 import numpy as np
-from sklearn.preprocessing import StandardScaler, OneHotEncoder, OrdinalEncoder
-from sklearn.compose import ColumnTransformer
-from sklearn.pipeline import Pipeline
-import umap
 import joblib
-import json
 
-def load_original_model():
-    """Load the saved UMAP model and preprocessor"""
+from artifact_store import (
+    ArtifactVersionError, artifact_path, attach_umap_arrays, current_version, load_array, load_manifest
+)
+from cold_start import configure_numba_cache
+from credit_schema import IngestReport, SchemaError, iter_credit_csv, read_credit_csv
+from feature_encoder import load_feature_encoder
+from json_export import build_point_columns, build_point_records, to_ndjson, write_points_json
+from pipeline_runs import atomic_write
+from projection_cache import rows_hash
+from surrogate_projector import ENGINES, SURROGATE_PATH
+
+# umap (and numba) are only imported when the saved model is unpickled; point
+# numba at the persistent cache before that happens
+configure_numba_cache()
+
+# Rows per chunk in map_new_data_streaming
+DEFAULT_CHUNK_SIZE = 50_000
+
+# Artifacts of a projection worker process, loaded once by _init_projection_worker
+_worker_artifacts = None
+
+def load_original_model(model_dir='.', mmap_mode=None, version=None, engine='umap', verify=False):
+    """
+    Load the saved UMAP model and preprocessor
+
+    Both come from the same artifact bundle (the current one, or `version`; see
+    artifact_store.py); a missing or mismatched bundle raises
+    ArtifactVersionError. With verify=True so does a file whose sha256 differs
+    from the manifest. With mmap_mode='r' the model's arrays are memory-mapped from the
+    file, so several processes share one copy through the page cache; the
+    training matrix and kNN graph are always memory-mapped from the bundle's
+    .npy files (see artifact_store.attach_umap_arrays).
+
+    engine='surrogate' returns the bundle's SurrogateProjector (see
+    surrogate_projector.py) in place of the UMAP model; it has the same
+    transform method and is much faster for a few points.
+    """
+    if engine not in ENGINES:
+        raise ValueError(f"Unknown projection engine {engine!r}, expected one of {ENGINES}")
+    version = version or current_version(model_dir)
     try:
-        reducer = joblib.load('umap_model.joblib')
-        preprocessor = joblib.load('preprocessor.joblib')
+        model_path = SURROGATE_PATH if engine == 'surrogate' else 'umap_model.joblib'
+        reducer = joblib.load(artifact_path(model_path, model_dir, version, verify), mmap_mode=mmap_mode)
+        if engine == 'umap':
+            reducer = attach_umap_arrays(reducer, model_dir, version, verify)
+        preprocessor = joblib.load(artifact_path('preprocessor.joblib', model_dir, version, verify))
         return reducer, preprocessor
     except FileNotFoundError:
         print("Error: Could not find saved model files. Please run generate_umap_embeddings.py first.")
         return None, None
 
-def map_new_data(input_csv_path, output_json_path):
+def warm_up_transform(reducer, model_dir='.', version=None):
     """
-    Map new data points to the existing UMAP embedding space
+    Project one stored training row so numba compiles the transform kernels.
 
-    Args:
-        input_csv_path: Path to the new CSV file with data to map
-        output_json_path: Path where to save the mapped data as JSON
+    The row is the first one of the bundle's processed_training.npy, so the
+    model's private training matrix is not touched.
+
+    Returns:
+        True if the transform ran, False if the bundle has no stored rows
     """
-    # Load the saved model and preprocessor
-    reducer, preprocessor = load_original_model()
-    if reducer is None or preprocessor is None:
-        return
+    try:
+        sample = load_array('processed_training.npy', model_dir, version)[:1]
+    except (FileNotFoundError, ArtifactVersionError):
+        print("Warning: Could not find processed_training.npy, skipping the transform warm-up")
+        return False
+    reducer.transform(np.array(sample))
+    return True
+
+class TrainingEmbedding:
+    """Cached UMAP coordinates of the training rows, with the hash of the rows they belong to."""
+
+    def __init__(self, coordinates, training_rows_hash=None):
+        self.coordinates = coordinates
+        self.training_rows_hash = training_rows_hash
 
-    # Load and clean the new data
+    def __len__(self):
+        return len(self.coordinates)
+
+    def matches(self, rows):
+        """
+        Whether the coordinates belong to these rows, row for row.
+
+        Args:
+            rows: Encoded training rows in the order they will be placed
+
+        Returns:
+            False if the bundle has no training-rows hash (generated before it was
+            stored) or the rows differ in content or order
+        """
+        return (self.training_rows_hash is not None and len(rows) == len(self.coordinates)
+                and rows_hash(rows) == self.training_rows_hash)
+
+def load_training_embedding(model_dir='.', version=None):
+    """Memory-map the cached UMAP coordinates of the training rows as a TrainingEmbedding, or None if missing"""
     try:
-        new_df = pd.read_csv(input_csv_path)
+        coordinates = np.load(artifact_path('umap_embedding.npy', model_dir, version), mmap_mode='r')
     except FileNotFoundError:
-        print(f"Error: Could not find input file at {input_csv_path}")
-        return
+        print("Warning: Could not find umap_embedding.npy. Please run generate_umap_embeddings.py first.")
+        return None
+    try:
+        metadata = load_manifest(model_dir, version).get('metadata', {})
+    except ArtifactVersionError:
+        # Legacy flat files have no manifest
+        metadata = {}
+    return TrainingEmbedding(coordinates, metadata.get('training_rows_sha256'))
 
-    # Lowercase column names to match training preprocessing
-    new_df.columns = [col.lower() for col in new_df.columns]
+def project_frame(new_df, reducer, preprocessor, feature_encoder, projection_cache=None):
+    """
+    Group categories, preprocess and project already cleaned rows.
 
-    print(f"Original number of rows: {len(new_df)}")
-    new_df = new_df.dropna()
-    print(f"Number of rows after removing NA: {len(new_df)}")
+    With a projection_cache (see projection_cache.py) only rows that are not
+    cached yet are preprocessed and transformed.
 
+    Returns:
+        (grouped DataFrame, embedding array aligned with it by position)
+    """
     # Group categories to match training preprocessing
-    if 'purpose' in new_df.columns:
-        purpose_mapping = {
-            'radio/tv': 'radio/TV',
-            'car': 'car',
-            'furniture/equipment': 'furniture'
-        }
-        new_df['purpose'] = new_df['purpose'].map(lambda x: purpose_mapping.get(x, 'others'))
-
-    if 'saving accounts' in new_df.columns:
-        saving_mapping = {
-            'little': 'little',
-            'moderate': 'moderate',
-            'quite rich': 'rich',
-            'rich': 'rich'
-        }
-        new_df['saving accounts'] = new_df['saving accounts'].map(lambda x: saving_mapping.get(x, x))
+    new_df = feature_encoder.transform(new_df)
+
+    if projection_cache is not None:
+        return new_df, projection_cache.project(new_df, preprocessor, reducer)
 
     # Preprocess new data
     X_new = new_df.drop('risk', axis=1, errors='ignore')
     X_new_processed = preprocessor.transform(X_new)
 
     # Transform to UMAP space
-    new_embedding = reducer.transform(X_new_processed)
-
-    # Build JSON data
-    json_data = []
-    for idx, row in new_df.iterrows():
-        point_data = {
-            'id': int(idx),
-            'x': float(new_embedding[idx][0]),
-            'y': float(new_embedding[idx][1]),
-            'risk': str(row['risk']) if 'risk' in row else 'unknown',
-            'features': {
-                'age': float(row['age']),
-                'credit_amount': float(row['credit amount']),
-                'duration': float(row['duration']),
-                'job': int(row['job']),
-                'sex': str(row['sex']),
-                'housing': str(row['housing']),
-                'saving_accounts': str(row['saving accounts']),
-                'checking_account': str(row['checking account']),
-                'purpose': str(row['purpose'])
-            }
-        }
-        json_data.append(point_data)
+    return new_df, reducer.transform(X_new_processed)
+
+def map_new_data(input_csv_path, output_json_path, reducer=None, preprocessor=None,
+                 compact=False, columnar=False, feature_encoder=None, projection_cache=None,
+                 engine='umap'):
+    """
+    Map new data points to the existing UMAP embedding space
+
+    Args:
+        input_csv_path: Path to the new CSV file with data to map
+        output_json_path: Path where to save the mapped data as JSON
+        reducer: Already loaded UMAP model (loaded from disk if None)
+        preprocessor: Already loaded preprocessor (loaded from disk if None)
+        compact: Write the JSON without indentation
+        columnar: Write one array per field instead of one record per point
+        feature_encoder: Fitted FeatureEncoder (loaded from disk if None)
+        projection_cache: Optional ProjectionCache in front of the transforms
+        engine: 'umap' or 'surrogate', the projection engine loaded when no reducer is passed
+
+    Returns:
+        Number of mapped data points, or None on failure
+    """
+    # Load the saved model and preprocessor unless a warm copy was passed in
+    if reducer is None or preprocessor is None:
+        reducer, preprocessor = load_original_model(engine=engine)
+    if reducer is None or preprocessor is None:
+        return
+
+    # Load the new data against the declared schema (malformed rows are rejected)
+    try:
+        new_df, report = read_credit_csv(input_csv_path)
+    except (FileNotFoundError, SchemaError) as e:
+        print(f"Error: Could not read input file {input_csv_path}: {e}")
+        return
+
+    if feature_encoder is None:
+        feature_encoder = load_feature_encoder()
+
+    print(f"Original number of rows: {report.rows_read}")
+    print(f"Number of valid rows: {len(new_df)}")
+
+    new_df, new_embedding = project_frame(new_df, reducer, preprocessor, feature_encoder, projection_cache)
+
+    # Build JSON data (coordinates follow row positions, ids keep the input row labels)
+    if columnar:
+        json_data = build_point_columns(new_df, new_embedding[:, 0], new_embedding[:, 1], ids=new_df.index)
+    else:
+        json_data = build_point_records(new_df, new_embedding[:, 0], new_embedding[:, 1], ids=new_df.index)
 
     # Save JSON
-    with open(output_json_path, 'w') as f:
-        json.dump(json_data, f, indent=2)
+    write_points_json(json_data, output_json_path, compact=compact)
 
     print(f"\nSaved mapped UMAP data to '{output_json_path}'")
     print(f"Mapped data shape: {new_embedding.shape}")
 
+    return len(new_df)
+
+def _chunk_to_ndjson(chunk, reducer, preprocessor, feature_encoder, columnar, projection_cache=None):
+    """Project one cleaned chunk; returns (points, NDJSON text)."""
+    chunk, embedding = project_frame(chunk, reducer, preprocessor, feature_encoder, projection_cache)
+    # read_csv keeps counting the index across chunks, so it is the input row position
+    if columnar:
+        items = [build_point_columns(chunk, embedding[:, 0], embedding[:, 1], ids=chunk.index)]
+    else:
+        items = build_point_records(chunk, embedding[:, 0], embedding[:, 1], ids=chunk.index)
+    return len(chunk), to_ndjson(items)
+
+def _init_projection_worker(model_dir, version, engine='umap'):
+    global _worker_artifacts
+    # Pool processes inherit fd 1, which is the embedding worker's protocol pipe when
+    # a map job runs there; their prints and native library output go to stderr
+    sys.stdout.flush()
+    os.dup2(sys.stderr.fileno(), 1)
+    sys.stdout = sys.stderr
+    reducer, preprocessor = load_original_model(model_dir, mmap_mode='r', version=version, engine=engine)
+    feature_encoder = load_feature_encoder(model_dir, version)
+    if engine == 'umap':
+        # Compile the numba functions before the first real chunk arrives
+        warm_up_transform(reducer, model_dir, version)
+    _worker_artifacts = (reducer, preprocessor, feature_encoder)
+
+def _map_chunk_in_worker(chunk, columnar):
+    return _chunk_to_ndjson(chunk, *_worker_artifacts, columnar)
+
+def map_new_data_streaming(input_csv_path, output_path, chunk_size=DEFAULT_CHUNK_SIZE,
+                           columnar=False, reducer=None, preprocessor=None, feature_encoder=None,
+                           workers=1, model_dir='.', projection_cache=None, engine='umap'):
+    """
+    Map a CSV of any size chunk by chunk with bounded memory.
+
+    Each chunk is read against the schema (see credit_schema.py; malformed rows
+    are rejected and counted), projected and appended to output_path as NDJSON: one
+    point record per line, or with columnar=True one line of columns (the
+    build_point_columns layout) per chunk. Ids are the row positions in the
+    input file. The file is renamed into place once all chunks are written.
+
+    reducer.transform optimizes each batch stochastically, so coordinates can
+    differ slightly from a single map_new_data call over the whole file; they
+    are reproducible for the same chunk_size, whatever the number of workers.
+
+    With workers > 1 the chunks are projected and serialized by a process pool.
+    Each worker loads the artifacts from model_dir once, with the model arrays
+    memory-mapped, and the chunks are written in input order. All workers use
+    the artifact bundle that was current when the job started.
+
+    Args:
+        input_csv_path: Path to the CSV file with data to map
+        output_path: Path of the NDJSON file to write
+        chunk_size: Rows read, projected and written at a time
+        columnar: Write one line of columns per chunk instead of one line per point
+        reducer, preprocessor, feature_encoder: Already loaded artifacts (loaded
+            from disk if None; only used with a single worker)
+        workers: Number of projection processes
+        model_dir: Directory of the saved artifacts
+        projection_cache: Optional ProjectionCache (only used with a single worker)
+        engine: 'umap' or 'surrogate', the projection engine loaded from disk
+
+    Returns:
+        Number of mapped data points, or None on failure
+    """
+    executor = None
+    if workers > 1:
+        version = current_version(model_dir)
+        model_path = SURROGATE_PATH if engine == 'surrogate' else 'umap_model.joblib'
+        if not os.path.exists(artifact_path(model_path, model_dir, version)):
+            print("Error: Could not find saved model files. Please run generate_umap_embeddings.py first.")
+            return
+        # Fresh interpreters: forking a process that already ran numba code (the
+        # embedding worker, a benchmark) can deadlock
+        executor = concurrent.futures.ProcessPoolExecutor(
+            max_workers=workers, mp_context=multiprocessing.get_context('spawn'),
+            initializer=_init_projection_worker, initargs=(model_dir, version, engine)
+        )
+    else:
+        if reducer is None or preprocessor is None:
+            reducer, preprocessor = load_original_model(model_dir, engine=engine)
+        if reducer is None or preprocessor is None:
+            return
+        if feature_encoder is None:
+            feature_encoder = load_feature_encoder(model_dir)
+
+    ingest = IngestReport(input_csv_path)
+    try:
+        # Read the header now so a missing file or column fails before any output is written
+        chunks = iter_credit_csv(input_csv_path, chunksize=chunk_size, report=ingest)
+        first = next(chunks, None)
+    except (FileNotFoundError, SchemaError) as e:
+        print(f"Error: Could not read input file {input_csv_path}: {e}")
+        if executor:
+            executor.shutdown(cancel_futures=True)
+        return
+
+    rows_mapped = 0
+    start = time.perf_counter()
+
+    def report(points, text):
+        nonlocal rows_mapped
+        f.write(text)
+        rows_mapped += points
+        elapsed = time.perf_counter() - start
+        print(f"Mapped {rows_mapped:,} rows, {ingest.rows_read:,} read so far ({rows_mapped / elapsed:,.0f} rows/s)")
+
+    with atomic_write(output_path) as f:
+        # Keep a bounded number of chunks in flight and write them back in input order
+        pending = collections.deque()
+        try:
+            for chunk, _ in itertools.chain([first] if first else [], chunks):
+                if chunk.empty:
+                    continue
+
+                if executor is None:
+                    report(*_chunk_to_ndjson(chunk, reducer, preprocessor, feature_encoder, columnar,
+                                             projection_cache))
+                    continue
+
+                pending.append(executor.submit(_map_chunk_in_worker, chunk, columnar))
+                if len(pending) >= 2 * workers:
+                    report(*pending.popleft().result())
+
+            while pending:
+                report(*pending.popleft().result())
+        finally:
+            if executor:
+                executor.shutdown(cancel_futures=True)
+
+    print(f"\nSaved {rows_mapped:,} mapped points to '{output_path}'")
+    print(ingest.summary())
+    return rows_mapped
+
 if __name__ == "__main__":
-    # Example usage
-    input_csv = "new_german_credit_data.csv"  # Replace with your input CSV path
-    output_json = "new_german_credit_umap.json"  # Replace with your desired output path
-    map_new_data(input_csv, output_json)
+    parser = argparse.ArgumentParser(description='Map new data points to the existing UMAP embedding space')
+    parser.add_argument('input', nargs='?', default='new_german_credit_data.csv', help='CSV with data to map')
+    parser.add_argument('output', nargs='?', default='new_german_credit_umap.json', help='JSON to write')
+    parser.add_argument('--compact', action='store_true', help='Write JSON without indentation')
+    parser.add_argument('--columnar', action='store_true', help='Write one JSON array per field')
+    parser.add_argument('--stream', action='store_true',
+                        help='Map chunk by chunk and write NDJSON (bounded memory for large inputs)')
+    parser.add_argument('--chunk-size', type=int, default=DEFAULT_CHUNK_SIZE, help='Rows per chunk with --stream')
+    parser.add_argument('--workers', type=int, default=1,
+                        help='Projection processes for --stream (memory-mapped model, output order kept)')
+    parser.add_argument('--engine', choices=ENGINES, default='umap',
+                        help='Projection engine: the UMAP model, or the fast kNN surrogate '
+                             '(see surrogate_projector.py)')
+    parser.add_argument('--profile-startup', action='store_true',
+                        help='Report import and first-call times instead of writing output')
+    args = parser.parse_args()
+
+    if args.profile_startup:
+        from cold_start import print_startup_report
+        print_startup_report(args.input)
+    elif args.stream:
+        map_new_data_streaming(args.input, args.output, args.chunk_size, columnar=args.columnar,
+                               workers=args.workers, engine=args.engine)
+    else:
+        map_new_data(args.input, args.output, compact=args.compact, columnar=args.columnar,
+                     engine=args.engine)
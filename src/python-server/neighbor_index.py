@@ -0,0 +1,118 @@
+"""
+Nearest-neighbour index over the training applicants.
+
+generate_umap_embeddings.py builds a NeighborIndex over the preprocessed
+feature space and the 2D UMAP space of the training rows and saves it as
+neighbor_index.joblib in the artifact bundle. Consumers load it once (the
+embedding worker keeps it for its whole lifetime) and ask for the k most
+similar training applicants of a user or counterfactual:
+
+    index = load_neighbor_index()
+    ids, distances, labels = index.query(preprocessor.transform(rows), k=5)
+    ids, distances, labels = index.query(coordinates, k=5, space='umap')
+
+Ids are the training point ids of german_credit_umap.json. Small training
+sets use exact sklearn BallTree/KDTree indexes; above
+APPROXIMATE_THRESHOLD rows an approximate pynndescent index is built instead.
+"""
+
+import joblib
+import numpy as np
+from sklearn.neighbors import BallTree, KDTree
+
+from artifact_store import artifact_path
+
+NEIGHBOR_INDEX_PATH = 'neighbor_index.joblib'
+
+# Training rows above which the approximate index is used
+APPROXIMATE_THRESHOLD = 100_000
+
+SPACES = ('features', 'umap')
+
+
+class _ApproximateTree:
+    """pynndescent index with the query interface of the sklearn trees."""
+
+    def __init__(self, data):
+        from pynndescent import NNDescent
+        self.index = NNDescent(data, random_state=42)
+        self.index.prepare()
+
+    def query(self, points, k):
+        indices, distances = self.index.query(points, k=k)
+        return distances, indices
+
+
+def _build_tree(data, approximate):
+    if approximate:
+        return _ApproximateTree(data)
+    # KD-trees work best in few dimensions; the one-hot feature space is wider
+    return KDTree(data) if data.shape[1] <= 3 else BallTree(data)
+
+
+class NeighborIndex:
+    """k-nearest-neighbour lookups over the training rows in feature and UMAP space."""
+
+    def __init__(self, X_processed, embedding, labels, ids=None, approximate=None):
+        """
+        Args:
+            X_processed: Preprocessed training matrix (output of the fitted preprocessor)
+            embedding: UMAP coordinates of the same rows
+            labels: Risk label of each row
+            ids: Point ids of the rows (defaults to row positions, as in german_credit_umap.json)
+            approximate: Force the approximate (True) or exact (False) index; by default
+                decided by APPROXIMATE_THRESHOLD
+        """
+        n_rows = len(X_processed)
+        if approximate is None:
+            approximate = n_rows > APPROXIMATE_THRESHOLD
+
+        self.ids = np.arange(n_rows) if ids is None else np.asarray(ids)
+        self.labels = np.asarray(labels, dtype=object)
+        self.approximate = approximate
+        self.trees = {
+            'features': _build_tree(np.asarray(X_processed, dtype=float), approximate),
+            'umap': _build_tree(np.asarray(embedding, dtype=float), approximate),
+        }
+
+    def __len__(self):
+        return len(self.ids)
+
+    def query(self, points, k=5, space='features'):
+        """
+        Find the k nearest training rows of each query point.
+
+        Args:
+            points: Query points in the given space, shape (n, dims)
+            k: Number of neighbours per point
+            space: 'features' for preprocessed rows, 'umap' for 2D coordinates
+
+        Returns:
+            (ids, distances, labels), each of shape (n, k) and sorted by distance
+        """
+        if space not in self.trees:
+            raise ValueError(f"Unknown space {space!r}, expected one of {SPACES}")
+        k = min(k, len(self))
+        distances, positions = self.trees[space].query(np.atleast_2d(np.asarray(points, dtype=float)), k)
+        return self.ids[positions], distances, self.labels[positions]
+
+    def query_records(self, points, k=5, space='features'):
+        """Like query, but returns one list of {'id', 'distance', 'risk'} dicts per point."""
+        ids, distances, labels = self.query(points, k, space)
+        return [
+            [{'id': int(i), 'distance': float(d), 'risk': str(label)}
+             for i, d, label in zip(row_ids, row_distances, row_labels)]
+            for row_ids, row_distances, row_labels in zip(ids, distances, labels)
+        ]
+
+    def save(self, path=NEIGHBOR_INDEX_PATH):
+        joblib.dump(self, path)
+
+
+def load_neighbor_index(model_dir='.', version=None):
+    """Load the index saved by generate_umap_embeddings.py, or None if it is missing."""
+    try:
+        return joblib.load(artifact_path(NEIGHBOR_INDEX_PATH, model_dir, version))
+    except FileNotFoundError:
+        print("Warning: Could not find neighbor_index.joblib. Please run generate_umap_embeddings.py first.")
+        return None
@@ -0,0 +1,66 @@
+"""
+Progress events of a streaming pipeline run.
+
+run_umap_pipeline.py --stream and run_pipeline jobs of the embedding worker
+with "stream": true report the run as it happens instead of only at the end,
+one JSON object per event (NDJSON on stdout for the script, protocol
+messages carrying the job id for the worker):
+
+    {"event": "stage_started", "run_id", "stage"}
+    {"event": "stage_finished", "run_id", "stage", "seconds", ...}   (the stage record, see pipeline_metrics.py)
+    {"event": "points", "points": [...], "seconds"}
+    {"event": "done", "run_id", "points", "seconds", ...}
+    {"event": "error", "run_id", "error", "seconds"}
+
+"points" events carry point records exactly as they appear in the run's
+delta (see generate_umap_with_counterfactuals.write_delta). The first one
+holds only the user point, so it arrives after the cost of projecting a
+single row; the counterfactuals follow in batches as they are projected.
+"seconds" counts from the start of the run, so the time to the first point
+can be read off the stream.
+"""
+
+import json
+import time
+
+
+def ndjson_writer(stream):
+    """Function writing each event to stream as one JSON line, flushed immediately."""
+    def write(event):
+        stream.write(json.dumps(event, separators=(',', ':')) + '\n')
+        stream.flush()
+    return write
+
+
+class EventStream:
+    """Builds the events of one run and hands them to a send function."""
+
+    def __init__(self, send, run_id=None):
+        """
+        Args:
+            send: Function called with each event dict
+            run_id: Run identifier added to the events that do not carry one
+        """
+        self.send = send
+        self.run_id = run_id
+        self.points_sent = 0
+        self.start = time.perf_counter()
+
+    def elapsed(self):
+        return time.perf_counter() - self.start
+
+    def stage(self, event):
+        """Forward a stage event (pass as the PipelineMetrics listener)."""
+        self.send(event)
+
+    def points(self, records):
+        """Send a batch of projected points (pass as embed_joint_dataset's on_points)."""
+        self.points_sent += len(records)
+        self.send({'event': 'points', 'points': records, 'seconds': self.elapsed()})
+
+    def done(self, **fields):
+        self.send({'event': 'done', 'run_id': self.run_id, 'points': self.points_sent,
+                   'seconds': self.elapsed(), **fields})
+
+    def error(self, message):
+        self.send({'event': 'error', 'run_id': self.run_id, 'error': message, 'seconds': self.elapsed()})
@@ -0,0 +1,233 @@
+"""
+Structured per-stage metrics of the UMAP pipeline.
+
+Every stage of a run is wrapped in PipelineMetrics.stage(), which records
+
+    rows_in / rows_out / rows_dropped   set by the stage
+    seconds                             wall time
+    cpu_seconds                         CPU time of this process
+    peak_rss_mb                         process high-water mark after the stage
+    peak_rss_growth_mb                  how much the stage raised that mark
+
+Artifact loading is a stage of its own ('artifact_load'). Each finished stage
+is one JSON object:
+
+    {"event": "stage", "run_id": "abc", "stage": "clean", "rows_in": 1043,
+     "rows_out": 1041, "rows_dropped": 2, "seconds": 0.004, ...}
+
+and finish() adds an {"event": "run", ...} line with the totals. The lines
+are appended to a metrics file (--metrics-file or PIPELINE_METRICS_FILE), a
+channel separate from the human-readable print() output, so p50/p99
+latencies per stage can be computed from it directly. The embedding worker
+also returns them with each run_pipeline result.
+
+A listener (see PipelineMetrics) is told when each stage starts and
+finishes; run_umap_pipeline.py --stream forwards these as progress events.
+
+Optionally the counters are written as a Prometheus text-format file
+(--prometheus-file or PIPELINE_PROMETHEUS_FILE) for the node_exporter
+textfile collector. Counters and the duration histogram accumulate over the
+lifetime of the process, so a long-lived worker exports proper histograms;
+a one-shot run exports the numbers of that run only.
+"""
+
+import contextlib
+import json
+import os
+import resource
+import sys
+import threading
+import time
+
+from pipeline_runs import atomic_write
+
+METRICS_FILE_ENV = 'PIPELINE_METRICS_FILE'
+PROMETHEUS_FILE_ENV = 'PIPELINE_PROMETHEUS_FILE'
+
+# Upper bounds of the stage duration histogram in seconds
+DURATION_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0, 60.0)
+
+
+def peak_rss_mb():
+    # ru_maxrss is in kilobytes on Linux and bytes on macOS
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    return peak / (1024 * 1024) if sys.platform == 'darwin' else peak / 1024
+
+
+class StageRecord(dict):
+    """Metrics of one stage; the stage sets the row counts it knows."""
+
+    def rows(self, rows_in=None, rows_out=None):
+        if rows_in is not None:
+            self['rows_in'] = int(rows_in)
+        if rows_out is not None:
+            self['rows_out'] = int(rows_out)
+        if 'rows_in' in self and 'rows_out' in self:
+            self['rows_dropped'] = self['rows_in'] - self['rows_out']
+
+
+class _PrometheusRegistry:
+    """Process-wide counters behind the Prometheus text file."""
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.durations = {}      # stage -> [bucket counts..., count, sum]
+        self.counters = {}       # (name, stage) -> value
+        self.peak_rss_bytes = 0
+        self.runs = {'ok': 0, 'failed': 0}
+
+    def observe(self, record):
+        with self.lock:
+            stage = record['stage']
+            buckets = self.durations.setdefault(stage, [0] * len(DURATION_BUCKETS) + [0, 0.0])
+            for i, bound in enumerate(DURATION_BUCKETS):
+                if record['seconds'] <= bound:
+                    buckets[i] += 1
+            buckets[-2] += 1
+            buckets[-1] += record['seconds']
+            for name in ['cpu_seconds', 'rows_in', 'rows_out', 'rows_dropped']:
+                if name in record:
+                    key = (name, stage)
+                    self.counters[key] = self.counters.get(key, 0) + record[name]
+            self.peak_rss_bytes = max(self.peak_rss_bytes, int(record['peak_rss_mb'] * 1024 * 1024))
+
+    def observe_run(self, ok):
+        with self.lock:
+            self.runs['ok' if ok else 'failed'] += 1
+
+    def render(self):
+        with self.lock:
+            lines = [
+                '# HELP umap_pipeline_stage_duration_seconds Wall time of a pipeline stage.',
+                '# TYPE umap_pipeline_stage_duration_seconds histogram',
+            ]
+            for stage, buckets in sorted(self.durations.items()):
+                for bound, count in zip(DURATION_BUCKETS, buckets):
+                    lines.append(f'umap_pipeline_stage_duration_seconds_bucket{{stage="{stage}",le="{bound}"}} {count}')
+                lines.append(f'umap_pipeline_stage_duration_seconds_bucket{{stage="{stage}",le="+Inf"}} {buckets[-2]}')
+                lines.append(f'umap_pipeline_stage_duration_seconds_sum{{stage="{stage}"}} {buckets[-1]:.6f}')
+                lines.append(f'umap_pipeline_stage_duration_seconds_count{{stage="{stage}"}} {buckets[-2]}')
+
+            descriptions = {
+                'cpu_seconds': 'CPU time spent in a pipeline stage.',
+                'rows_in': 'Rows entering a pipeline stage.',
+                'rows_out': 'Rows leaving a pipeline stage.',
+                'rows_dropped': 'Rows dropped by a pipeline stage (e.g. dropna).',
+            }
+            for name, description in descriptions.items():
+                metric = f'umap_pipeline_stage_{name}_total'
+                values = sorted((stage, value) for (key, stage), value in self.counters.items() if key == name)
+                if not values:
+                    continue
+                lines.append(f'# HELP {metric} {description}')
+                lines.append(f'# TYPE {metric} counter')
+                lines.extend(f'{metric}{{stage="{stage}"}} {value:g}' for stage, value in values)
+
+            lines.append('# HELP umap_pipeline_runs_total Finished pipeline runs.')
+            lines.append('# TYPE umap_pipeline_runs_total counter')
+            lines.extend(f'umap_pipeline_runs_total{{status="{status}"}} {count}'
+                         for status, count in self.runs.items())
+            lines.append('# HELP umap_pipeline_peak_rss_bytes Peak resident set size of the pipeline process.')
+            lines.append('# TYPE umap_pipeline_peak_rss_bytes gauge')
+            lines.append(f'umap_pipeline_peak_rss_bytes {self.peak_rss_bytes}')
+            return '\n'.join(lines) + '\n'
+
+
+_registry = _PrometheusRegistry()
+
+
+class PipelineMetrics:
+    """Collects the stage records of one pipeline run and writes them to the metrics sinks."""
+
+    def __init__(self, run_id=None, metrics_file=None, prometheus_file=None, listener=None):
+        """
+        Args:
+            run_id: Run identifier added to every record
+            metrics_file: JSON lines file to append to (PIPELINE_METRICS_FILE if None)
+            prometheus_file: Prometheus text file to rewrite (PIPELINE_PROMETHEUS_FILE if None)
+            listener: Optional function called with a {'event': 'stage_started', ...} dict
+                when a stage starts and the stage record (as 'stage_finished') when it ends
+        """
+        self.run_id = run_id
+        self.listener = listener
+        self.metrics_file = metrics_file or os.environ.get(METRICS_FILE_ENV)
+        self.prometheus_file = prometheus_file or os.environ.get(PROMETHEUS_FILE_ENV)
+        self.records = []
+        self.started_at = time.time()
+        self._start = time.perf_counter()
+        self._cpu_start = time.process_time()
+
+    @contextlib.contextmanager
+    def stage(self, name, rows_in=None):
+        """
+        Time a stage; the yielded StageRecord takes its row counts.
+
+        The record is kept and emitted even if the stage raises, with
+        'ok': false.
+        """
+        record = StageRecord(event='stage', run_id=self.run_id, stage=name)
+        record.rows(rows_in=rows_in)
+        if self.listener:
+            self.listener({'event': 'stage_started', 'run_id': self.run_id, 'stage': name})
+        rss_before = peak_rss_mb()
+        start = time.perf_counter()
+        cpu_start = time.process_time()
+        ok = False
+        try:
+            yield record
+            ok = True
+        finally:
+            record['seconds'] = round(time.perf_counter() - start, 6)
+            record['cpu_seconds'] = round(time.process_time() - cpu_start, 6)
+            record['peak_rss_mb'] = round(peak_rss_mb(), 1)
+            record['peak_rss_growth_mb'] = round(max(0.0, peak_rss_mb() - rss_before), 1)
+            record['ok'] = ok
+            self.records.append(record)
+            _registry.observe(record)
+            self._emit([record])
+            if self.listener:
+                self.listener({**record, 'event': 'stage_finished'})
+
+    def add_stage(self, name, seconds, **fields):
+        """Record a stage that was timed elsewhere (e.g. artifact loading at worker start-up)."""
+        record = StageRecord(event='stage', run_id=self.run_id, stage=name, seconds=round(seconds, 6),
+                             peak_rss_mb=round(peak_rss_mb(), 1), ok=True, **fields)
+        self.records.append(record)
+        _registry.observe(record)
+        self._emit([record])
+
+    def finish(self, ok=True):
+        """Emit the run summary, rewrite the Prometheus file and return the summary."""
+        # A stage can run more than once per run (e.g. several artifact loads)
+        stage_seconds = {}
+        for record in self.records:
+            stage_seconds[record['stage']] = round(stage_seconds.get(record['stage'], 0) + record['seconds'], 6)
+        summary = {
+            'event': 'run',
+            'run_id': self.run_id,
+            'started_at': time.strftime('%Y-%m-%dT%H:%M:%S%z', time.localtime(self.started_at)),
+            'ok': ok,
+            'seconds': round(time.perf_counter() - self._start, 6),
+            'cpu_seconds': round(time.process_time() - self._cpu_start, 6),
+            'peak_rss_mb': round(peak_rss_mb(), 1),
+            'stages': stage_seconds,
+        }
+        _registry.observe_run(ok)
+        self._emit([summary])
+        if self.prometheus_file:
+            try:
+                with atomic_write(self.prometheus_file) as f:
+                    f.write(_registry.render())
+            except OSError as e:
+                print(f"Warning: Could not write Prometheus metrics to {self.prometheus_file}: {e}")
+        return summary
+
+    def _emit(self, records):
+        if not self.metrics_file:
+            return
+        try:
+            # One write per batch of lines, so concurrent writers do not interleave records
+            with open(self.metrics_file, 'a') as f:
+                f.write(''.join(json.dumps(record) + '\n' for record in records))
+        except OSError as e:
+            print(f"Warning: Could not write pipeline metrics to {self.metrics_file}: {e}")
@@ -0,0 +1,100 @@
+"""
+Request-scoped run directories and atomic file publishing for the UMAP pipeline.
+
+Every pipeline run can get its own directory under runs/<run_id>/ so concurrent
+requests never read or overwrite each other's intermediate files. Outputs are
+written to a temporary file in the target directory and then renamed into
+place, so readers only ever see complete files.
+"""
+
+import contextlib
+import os
+import re
+import shutil
+import tempfile
+import time
+
+SCRIPT_DIR = os.path.dirname(os.path.abspath(__file__))
+RUNS_DIR = os.path.join(SCRIPT_DIR, 'runs')
+
+# Run directories older than this are removed by cleanup_stale_runs
+DEFAULT_MAX_RUN_AGE_SECONDS = 24 * 60 * 60
+
+_RUN_ID_PATTERN = re.compile(r'^[A-Za-z0-9_-]{1,64}$')
+
+
+def get_run_dir(run_id, create=True):
+    """
+    Directory holding the inputs and outputs of one pipeline run.
+
+    Args:
+        run_id: Run/session identifier (letters, digits, '-' and '_' only)
+        create: Create the directory if it does not exist yet
+
+    Returns:
+        Absolute path of runs/<run_id>
+    """
+    if not _RUN_ID_PATTERN.match(run_id):
+        raise ValueError(f"Invalid run id: {run_id!r}")
+    run_dir = os.path.join(RUNS_DIR, run_id)
+    if create:
+        os.makedirs(run_dir, exist_ok=True)
+    return run_dir
+
+
+@contextlib.contextmanager
+def atomic_write(path, mode='w'):
+    """
+    Open a temporary file next to path and rename it over path on success.
+
+    The temporary file is removed if the block raises, leaving any previous
+    version of path untouched.
+    """
+    directory = os.path.dirname(os.path.abspath(path))
+    fd, tmp_path = tempfile.mkstemp(dir=directory, prefix=f'.{os.path.basename(path)}.', suffix='.tmp')
+    try:
+        with os.fdopen(fd, mode) as f:
+            yield f
+        # mkstemp creates private files; published outputs must stay readable
+        os.chmod(tmp_path, 0o644)
+        os.replace(tmp_path, path)
+    except BaseException:
+        with contextlib.suppress(FileNotFoundError):
+            os.remove(tmp_path)
+        raise
+
+
+def atomic_copy(src, dst):
+    """Copy src to dst so that dst is replaced in a single rename."""
+    with atomic_write(dst, 'wb') as out, open(src, 'rb') as f:
+        shutil.copyfileobj(f, out)
+
+
+def cleanup_stale_runs(max_age_seconds=DEFAULT_MAX_RUN_AGE_SECONDS, keep=()):
+    """
+    Remove run directories that have not been modified for max_age_seconds.
+
+    Args:
+        max_age_seconds: Age after which a run directory counts as stale
+        keep: Run ids that must not be removed (e.g. the current run)
+
+    Returns:
+        List of removed run ids
+    """
+    if not os.path.isdir(RUNS_DIR):
+        return []
+
+    removed = []
+    cutoff = time.time() - max_age_seconds
+    for run_id in os.listdir(RUNS_DIR):
+        run_dir = os.path.join(RUNS_DIR, run_id)
+        if run_id in keep or not os.path.isdir(run_dir):
+            continue
+        try:
+            if os.path.getmtime(run_dir) < cutoff:
+                shutil.rmtree(run_dir)
+                removed.append(run_id)
+        except FileNotFoundError:
+            # Removed concurrently by another run's cleanup
+            continue
+    return removed
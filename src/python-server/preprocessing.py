@@ -0,0 +1,75 @@
+"""
+Preprocessing of credit records into the space the UMAP model is fitted in.
+
+build_preprocessor returns the ColumnTransformer (one-hot categories, ordinal
+job, scaled numbers) and load_training_matrix reads the training CSV and fits
+the feature encoder and preprocessor on it. Neither needs umap, so code that
+only preprocesses (benchmark_pipeline.py, the sweep's data loading) does not
+pay for importing it.
+"""
+
+from sklearn.compose import ColumnTransformer
+from sklearn.pipeline import Pipeline
+from sklearn.preprocessing import OneHotEncoder, OrdinalEncoder, StandardScaler
+
+from credit_schema import FEATURE_COLUMNS, read_credit_csv
+from feature_encoder import FeatureEncoder
+
+# Categorical and numerical columns of the preprocessed feature space
+categorical_cols = ['sex', 'housing', 'saving accounts', 'checking account', 'purpose']
+ordinal_cols = ['job']  # Job has a natural order (0, 1, 2, 3)
+numerical_cols = ['age', 'credit amount', 'duration']
+
+TRAINING_DATA_PATH = './german_credit_data.csv'
+
+def build_preprocessor():
+    """Unfitted ColumnTransformer mapping grouped credit records to the UMAP input space"""
+    # Create preprocessing pipelines
+    categorical_transformer = Pipeline(steps=[
+        ('onehot', OneHotEncoder(sparse_output=False, handle_unknown='ignore'))
+    ])
+
+    ordinal_transformer = Pipeline(steps=[
+        ('ordinal', OrdinalEncoder())
+    ])
+
+    numerical_transformer = Pipeline(steps=[
+        ('scaler', StandardScaler())
+    ])
+
+    # Combine preprocessing steps
+    return ColumnTransformer(
+        transformers=[
+            ('cat', categorical_transformer, categorical_cols),
+            ('ord', ordinal_transformer, ordinal_cols),
+            ('num', numerical_transformer, numerical_cols)
+        ])
+
+def load_training_matrix(training_data_path=TRAINING_DATA_PATH):
+    """
+    Read, clean and preprocess the training data.
+
+    Returns:
+        (X, y, X_processed, preprocessor, feature_encoder) with the fitted
+        preprocessor and feature encoder
+    """
+    # Load the data against the declared schema; rows with missing or malformed
+    # values are rejected (see credit_schema.py)
+    df, report = read_credit_csv(training_data_path, required=FEATURE_COLUMNS + ['risk'])
+    feature_encoder = FeatureEncoder()
+
+    print(f"Original number of rows: {report.rows_read}")
+    print(f"Number of valid rows: {len(df)}")
+
+    # Group infrequent 'purpose' values and 'saving accounts' levels
+    df = feature_encoder.fit_transform(df)
+
+    preprocessor = build_preprocessor()
+
+    # Preprocess the data
+    y = df['risk'].reset_index(drop=True)
+    X = df.drop('risk', axis=1).reset_index(drop=True)
+
+    # Fit and transform the data
+    X_processed = preprocessor.fit_transform(X)
+    return X, y, X_processed, preprocessor, feature_encoder
@@ -0,0 +1,220 @@
+"""
+Content-addressed cache of projected points.
+
+Users toggle locked features in the UI and resubmit, so the same user row and
+many identical counterfactuals are projected again and again. ProjectionCache
+sits in front of preprocessor.transform and reducer.transform:
+
+- the key of a row is a hash of its normalized feature values (after the
+  feature encoder has grouped them) plus the version of the model artifacts
+  (artifact_store.resolve_version), so a retrained model never serves stale
+  coordinates
+- an in-memory LRU tier holds the most recent entries
+- an optional on-disk tier (a SQLite file) survives restarts and is shared by
+  processes; it is trimmed to max_disk_bytes, least recently used first
+- hit/miss counters are exposed through stats(); they count rows, so a batch
+  repeating the same key counts each repetition
+
+A cached row always gets the same coordinates back, whereas reducer.transform
+itself optimizes every batch stochastically.
+"""
+
+import collections
+import hashlib
+import os
+import sqlite3
+import threading
+import time
+
+import numpy as np
+
+from feature_encoder import CATEGORICAL_COLUMNS
+
+# Columns that determine a row's position: the preprocessor inputs
+NUMERIC_KEY_COLUMNS = ['age', 'job', 'credit amount', 'duration']
+KEY_COLUMNS = NUMERIC_KEY_COLUMNS + CATEGORICAL_COLUMNS
+
+DEFAULT_MAX_ENTRIES = 100_000
+DEFAULT_MAX_DISK_BYTES = 256 * 1024 * 1024
+
+# Fraction of the disk entries removed when the file grows past its limit
+_DISK_EVICT_FRACTION = 0.1
+
+
+def row_keys(df, version):
+    """
+    Stable cache keys for the rows of an encoded DataFrame.
+
+    Numbers are compared by value (30 and 30.0 give the same key), categories by
+    their grouped label.
+    """
+    parts = []
+    for col in KEY_COLUMNS:
+        if col in NUMERIC_KEY_COLUMNS:
+            parts.append([repr(v) for v in df[col].to_numpy(dtype=float)])
+        else:
+            parts.append(df[col].astype(object).astype(str).tolist())
+    return [
+        hashlib.blake2b('\x1f'.join((version,) + values).encode(), digest_size=16).hexdigest()
+        for values in zip(*parts)
+    ]
+
+
+def rows_hash(df):
+    """Hash of an encoded DataFrame's rows in order, compared by the same values as row_keys."""
+    return hashlib.sha256(''.join(row_keys(df, '')).encode()).hexdigest()
+
+
+class _DiskTier:
+    """SQLite table key -> (x, y) with last-use times for LRU trimming."""
+
+    def __init__(self, path, max_bytes):
+        self.path = path
+        self.max_bytes = max_bytes
+        os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+        self.connection = sqlite3.connect(path, timeout=30, check_same_thread=False)
+        self.connection.execute(
+            'CREATE TABLE IF NOT EXISTS points (key TEXT PRIMARY KEY, x REAL, y REAL, used REAL)'
+        )
+        self.connection.commit()
+
+    def get_many(self, keys):
+        found = {}
+        for start in range(0, len(keys), 500):
+            batch = keys[start:start + 500]
+            placeholders = ','.join('?' * len(batch))
+            for key, x, y in self.connection.execute(
+                    f'SELECT key, x, y FROM points WHERE key IN ({placeholders})', batch):
+                found[key] = (x, y)
+        if found:
+            now = time.time()
+            self.connection.executemany('UPDATE points SET used = ? WHERE key = ?',
+                                        [(now, key) for key in found])
+            self.connection.commit()
+        return found
+
+    def put_many(self, entries):
+        now = time.time()
+        self.connection.executemany('INSERT OR REPLACE INTO points VALUES (?, ?, ?, ?)',
+                                    [(key, x, y, now) for key, (x, y) in entries.items()])
+        self.connection.commit()
+        self._trim()
+
+    def size_bytes(self):
+        page_size, = self.connection.execute('PRAGMA page_size').fetchone()
+        page_count, = self.connection.execute('PRAGMA page_count').fetchone()
+        free_pages, = self.connection.execute('PRAGMA freelist_count').fetchone()
+        return (page_count - free_pages) * page_size
+
+    def _trim(self):
+        while self.size_bytes() > self.max_bytes:
+            count, = self.connection.execute('SELECT COUNT(*) FROM points').fetchone()
+            if not count:
+                return
+            self.connection.execute(
+                'DELETE FROM points WHERE key IN (SELECT key FROM points ORDER BY used LIMIT ?)',
+                (max(1, int(count * _DISK_EVICT_FRACTION)),)
+            )
+            self.connection.commit()
+
+
+class ProjectionCache:
+    """Two-tier cache of UMAP coordinates keyed by row content and artifact version."""
+
+    def __init__(self, version, max_entries=DEFAULT_MAX_ENTRIES, disk_path=None,
+                 max_disk_bytes=DEFAULT_MAX_DISK_BYTES):
+        """
+        Args:
+            version: Artifact version (see artifact_store.resolve_version)
+            max_entries: Size of the in-memory LRU tier
+            disk_path: SQLite file of the on-disk tier (no disk tier if None)
+            max_disk_bytes: Size limit of the on-disk tier
+        """
+        self.version = version
+        self.max_entries = max_entries
+        self.memory = collections.OrderedDict()
+        self.disk = _DiskTier(disk_path, max_disk_bytes) if disk_path else None
+        self.lock = threading.Lock()
+        self.memory_hits = 0
+        self.disk_hits = 0
+        self.misses = 0
+
+    def _remember(self, key, point):
+        self.memory[key] = point
+        self.memory.move_to_end(key)
+        while len(self.memory) > self.max_entries:
+            self.memory.popitem(last=False)
+
+    def lookup(self, keys):
+        """Return {key: (x, y)} for the cached keys and count hits and misses per row."""
+        rows_per_key = collections.Counter(keys)
+        with self.lock:
+            found = {}
+            for key in rows_per_key:
+                if key in self.memory:
+                    self.memory.move_to_end(key)
+                    found[key] = self.memory[key]
+            self.memory_hits += sum(rows_per_key[key] for key in found)
+
+            missing = [key for key in rows_per_key if key not in found]
+            if self.disk and missing:
+                from_disk = self.disk.get_many(missing)
+                self.disk_hits += sum(rows_per_key[key] for key in from_disk)
+                for key, point in from_disk.items():
+                    self._remember(key, point)
+                found.update(from_disk)
+
+            self.misses += sum(count for key, count in rows_per_key.items() if key not in found)
+            return found
+
+    def store(self, entries):
+        """Add {key: (x, y)} to both tiers."""
+        with self.lock:
+            for key, point in entries.items():
+                self._remember(key, point)
+            if self.disk and entries:
+                self.disk.put_many(entries)
+
+    def project(self, df, preprocessor, reducer):
+        """
+        Project encoded rows, transforming only rows that are not cached yet.
+
+        Args:
+            df: Rows after FeatureEncoder.transform
+            preprocessor: Fitted preprocessor
+            reducer: Fitted UMAP model
+
+        Returns:
+            Array of shape (len(df), 2) aligned with df by position
+        """
+        keys = row_keys(df, self.version)
+        found = self.lookup(keys)
+
+        # Identical rows in one batch are only transformed once
+        first_position = {}
+        for position, key in enumerate(keys):
+            if key not in found:
+                first_position.setdefault(key, position)
+
+        if first_position:
+            positions = list(first_position.values())
+            projected = reducer.transform(preprocessor.transform(df.iloc[positions]))
+            new_entries = {key: (float(x), float(y)) for key, (x, y) in zip(first_position, projected)}
+            self.store(new_entries)
+            found.update(new_entries)
+
+        return np.array([found[key] for key in keys], dtype=float).reshape(len(keys), 2)
+
+    def stats(self):
+        # The lock keeps the counters consistent and the SQLite connection to one thread
+        with self.lock:
+            lookups = self.memory_hits + self.disk_hits + self.misses
+            return {
+                'version': self.version,
+                'memory_entries': len(self.memory),
+                'memory_hits': self.memory_hits,
+                'disk_hits': self.disk_hits,
+                'misses': self.misses,
+                'hit_rate': round((self.memory_hits + self.disk_hits) / lookups, 4) if lookups else None,
+                'disk_bytes': self.disk.size_bytes() if self.disk else None,
+            }
@@ -4,80 +4,198 @@ Orchestration script that runs after counterfactuals are generated.
 This script:
 1. Creates a joint dataset of training data, counterfactuals, and user data
 2. Generates UMAP embeddings for all data
-3. Copies the results to the assets folder for frontend access
+3. Writes the run's user and counterfactual points as a delta (in
+   runs/<run_id>/ with --run-id) and the shared training layer it refers
+   to; the dashboard loads them through /api/runs/<run_id> and
+   /api/training/<layer>
+
+The training points are written once to a content-hashed training layer; each
+run only writes a small delta with its user and counterfactual points (see
+generate_umap_with_counterfactuals.write_outputs). --full writes all points
+as one JSON instead.
+
+The stages run in this process and hand DataFrames to each other directly
+(see run_pipeline); only the final outputs are written to disk.
+
+--engine surrogate places the new rows with the kNN surrogate saved next to
+the UMAP model instead of UMAP.transform (see surrogate_projector.py); it is
+much faster but only approximates the true placement.
+
+Every stage records row counts, wall/CPU time and peak memory (see
+pipeline_metrics.py); --metrics-file appends them as JSON lines and
+--prometheus-file writes them in the Prometheus text format.
+
+--stream reports the run as NDJSON events on stdout while it happens: stage
+starts and ends, then the user point and the counterfactual points as they
+are projected, then a final done or error event (see pipeline_events.py).
+The log output goes to stderr in that mode. The points are projected in the
+same batches either way, so they get the same coordinates as without --stream.
+
+With --run-id, all output files of the run live in runs/<run_id>/ so
+concurrent requests do not overwrite each other; the dashboard loads a run's
+delta from there by its id (src/app/api/runs/[runId]/route.ts). The shared
+copies are still replaced atomically at the end.
 """
 
-import subprocess
-import sys
+import argparse
+import contextlib
 import os
+import sys
 
-def run_script(script_path, description):
-    """Run a Python script and handle errors."""
+from create_joint_dataset import (
+    DEFAULT_COUNTERFACTUALS_PATH, DEFAULT_USER_PATH, build_joint_dataset, load_r_output, load_training_data
+)
+from generate_umap_with_counterfactuals import embed_joint_dataset, prune_training_layers, write_outputs
+from pipeline_events import EventStream, ndjson_writer
+from pipeline_metrics import PipelineMetrics
+from credit_schema import SchemaError
+from pipeline_runs import DEFAULT_MAX_RUN_AGE_SECONDS, cleanup_stale_runs, get_run_dir
+from surrogate_projector import ENGINES
+
+def print_stage(description):
     print(f"\n{'='*60}")
     print(f"Running: {description}")
-    print(f"Script: {script_path}")
     print('='*60)
-    
-    try:
-        # Get the script directory
-        script_dir = os.path.dirname(os.path.abspath(script_path))
-        script_name = os.path.basename(script_path)
-        
-        result = subprocess.run([sys.executable, script_name], 
-                              capture_output=True, 
-                              text=True, 
-                              cwd=script_dir)
-        
-        if result.stdout:
-            print("STDOUT:")
-            print(result.stdout)
-        
-        if result.stderr:
-            print("STDERR:")
-            print(result.stderr)
-        
-        if result.returncode == 0:
-            print(f"✅ {description} completed successfully")
-            return True
-        else:
-            print(f"❌ {description} failed with return code {result.returncode}")
-            return False
-            
-    except Exception as e:
-        print(f"❌ Error running {description}: {e}")
-        return False
 
-def main():
-    """Main orchestration function."""
+def run_pipeline(training, counterfactuals, user, incremental=True, reducer=None,
+                 preprocessor=None, training_embedding=None, feature_encoder=None,
+                 projection_cache=None, metrics=None, engine='umap', on_points=None):
+    """
+    Run all pipeline stages in memory.
+
+    Args:
+        training: Training data DataFrame (see create_joint_dataset.load_training_data)
+        counterfactuals: Counterfactuals DataFrame as written by the R script
+        user: User data DataFrame as written by the R script
+        incremental, reducer, preprocessor, training_embedding, feature_encoder,
+        projection_cache, metrics, engine, on_points:
+            Passed on to generate_umap_with_counterfactuals.embed_joint_dataset
+
+    Returns:
+        DataFrame of all points with their features, 'counterfactual' label and
+        'UMAP1'/'UMAP2' coordinates, ready for write_outputs
+    """
+    metrics = metrics or PipelineMetrics()
+
+    print_stage('Joint dataset creation')
+    with metrics.stage('joint_dataset', rows_in=len(training) + len(counterfactuals) + len(user)) as record:
+        joint_df = build_joint_dataset(training, counterfactuals, user)
+        record.rows(rows_out=len(joint_df))
+
+    print_stage('UMAP embedding generation')
+    return embed_joint_dataset(joint_df, incremental, reducer, preprocessor, training_embedding,
+                               feature_encoder, projection_cache, metrics, engine, on_points)
+
+def main(run_id=None, counterfactuals_path=None, user_path=None,
+         max_run_age_seconds=DEFAULT_MAX_RUN_AGE_SECONDS, metrics_file=None, prometheus_file=None,
+         full=False, engine='umap', events=None):
+    """
+    Main orchestration function.
+
+    Args:
+        run_id: Run/session identifier; keeps this run's files in runs/<run_id>/
+        counterfactuals_path: Counterfactuals CSV of this run (R results.csv by default)
+        user_path: User data CSV of this run (R user.csv by default)
+        max_run_age_seconds: Run directories older than this are cleaned up
+        metrics_file: JSON lines file for the stage metrics (see pipeline_metrics.py)
+        prometheus_file: Prometheus text file for the stage metrics
+        full: Write the full output instead of the training layer and delta
+        engine: 'umap' or 'surrogate', the projection engine (see surrogate_projector.py)
+        events: Optional EventStream that receives the progress events (see pipeline_events.py)
+    """
     print("🚀 Starting UMAP data generation pipeline...")
-    
-    # Get the script directory
-    script_dir = os.path.dirname(os.path.abspath(__file__))
-    
-    # Step 1: Create joint dataset
-    create_joint_script = os.path.join(script_dir, 'create_joint_dataset.py')
-    success1 = run_script(create_joint_script, 'Joint dataset creation')
-    
-    if not success1:
-        print("❌ Pipeline failed at joint dataset creation step")
-        return False
-    
-    # Step 2: Generate UMAP embeddings
-    umap_script = os.path.join(script_dir, 'generate_umap_with_counterfactuals.py')
-    success2 = run_script(umap_script, 'UMAP embedding generation')
-    
-    if not success2:
-        print("❌ Pipeline failed at UMAP generation step")
+    metrics = PipelineMetrics(run_id, metrics_file, prometheus_file, listener=events and events.stage)
+
+    def failed(message):
+        print(f"❌ {message}")
+        metrics.finish(ok=False)
+        if events:
+            events.error(message)
         return False
-    
+
+    # Get the script directory; model artifacts are looked up relative to it
+    script_dir = os.path.dirname(os.path.abspath(__file__))
+    os.chdir(script_dir)
+
+    output_dir = script_dir
+    if run_id:
+        output_dir = get_run_dir(run_id)
+        print(f"Run directory: {output_dir}")
+
+        removed = cleanup_stale_runs(max_run_age_seconds, keep={run_id})
+        if removed:
+            print(f"Removed {len(removed)} stale run directories")
+        # Training layers live as long as a kept run refers to them
+        for name in prune_training_layers():
+            print(f"Removed unreferenced training layer '{name}'")
+
+    try:
+        with metrics.stage('load_inputs') as record:
+            training = load_training_data()
+            counterfactuals, counterfactuals_report = load_r_output(counterfactuals_path or DEFAULT_COUNTERFACTUALS_PATH)
+            user, user_report = load_r_output(user_path or DEFAULT_USER_PATH)
+            record.rows(rows_out=len(training) + len(counterfactuals) + len(user))
+            record['rows_rejected'] = counterfactuals_report.rows_rejected + user_report.rows_rejected
+    except (FileNotFoundError, SchemaError) as e:
+        return failed(f"Pipeline failed loading its inputs: {e}")
+
+    try:
+        combined_df = run_pipeline(training, counterfactuals, user, metrics=metrics, engine=engine,
+                                   on_points=events and events.points)
+    except Exception as e:
+        return failed(f"Pipeline failed: {e}")
+
+    try:
+        output_paths = write_outputs(combined_df, output_dir, metrics=metrics, layered=not full)
+    except Exception as e:
+        return failed(f"Pipeline failed writing its outputs: {e}")
+
+    summary = metrics.finish()
+    if events:
+        events.done(outputs=[os.path.basename(path) for path in output_paths], stages=summary['stages'])
+    print(f"Pipeline took {summary['seconds']:.2f}s "
+          f"({', '.join(f'{stage} {seconds:.2f}s' for stage, seconds in summary['stages'].items())})")
+
     print("\n🎉 Pipeline completed successfully!")
     print("✅ Joint dataset created")
     print("✅ UMAP embeddings generated")
-    print("✅ Data copied to assets folder for frontend access")
-    
+    print(f"✅ Wrote {', '.join(os.path.basename(path) for path in output_paths)}")
+
     return True
 
 if __name__ == "__main__":
-    success = main()
+    parser = argparse.ArgumentParser(description='Run the UMAP data generation pipeline')
+    parser.add_argument('--run-id', help='Run/session id; isolates this run in runs/<run_id>/')
+    parser.add_argument('--counterfactuals', help='Counterfactuals CSV of this run')
+    parser.add_argument('--user', help='User data CSV of this run')
+    parser.add_argument('--max-run-age-hours', type=float, default=DEFAULT_MAX_RUN_AGE_SECONDS / 3600,
+                        help='Remove run directories older than this')
+    parser.add_argument('--metrics-file', help='Append per-stage metrics as JSON lines to this file')
+    parser.add_argument('--prometheus-file', help='Write per-stage metrics in Prometheus text format')
+    parser.add_argument('--full', action='store_true',
+                        help='Write all points as one JSON')
+    parser.add_argument('--engine', choices=ENGINES, default='umap',
+                        help='Projection engine: the UMAP model, or the fast kNN surrogate')
+    parser.add_argument('--stream', action='store_true',
+                        help='Write progress events and points as NDJSON to stdout (logs go to stderr); '
+                             'points get the same coordinates as without --stream')
+    args = parser.parse_args()
+
+    # Resolve input paths before main() switches to the script directory
+    counterfactuals_path = args.counterfactuals and os.path.abspath(args.counterfactuals)
+    user_path = args.user and os.path.abspath(args.user)
+    metrics_file = args.metrics_file and os.path.abspath(args.metrics_file)
+    prometheus_file = args.prometheus_file and os.path.abspath(args.prometheus_file)
+
+    events = None
+    log_output = contextlib.nullcontext()
+    if args.stream:
+        # stdout carries only the events
+        events = EventStream(ndjson_writer(sys.stdout), args.run_id)
+        log_output = contextlib.redirect_stdout(sys.stderr)
+
+    with log_output:
+        success = main(args.run_id, counterfactuals_path, user_path, args.max_run_age_hours * 3600,
+                       metrics_file, prometheus_file, args.full, args.engine, events)
     if not success:
         sys.exit(1)
@@ -0,0 +1,146 @@
+"""
+Fast surrogate for UMAP.transform.
+
+UMAP.transform runs a nearest-neighbour search and an optimization loop on
+every call, which dominates the latency of placing a handful of points.
+SurrogateProjector learns the mapping processed features -> UMAP coordinates
+from the training rows instead: a new point is placed at the
+inverse-distance weighted mean of the coordinates of its k nearest training
+rows (a point that equals a training row gets that row's coordinates).
+
+It has the same transform(X_processed) interface as the fitted UMAP model, so
+it can be passed wherever a reducer is expected. generate_umap_embeddings.py
+saves it as surrogate_projector.joblib in the artifact bundle, and the
+projection engine is picked with engine='surrogate' / --engine surrogate in
+map_to_umap_embeddings.py and the counterfactual pipeline.
+
+measure_placement_error compares it with the real UMAP.transform on
+perturbed training rows (stand-ins for new applicants) and reports the
+distance between the two placements, also relative to the size of the
+embedding, and the time per point of both engines. The numbers are stored in
+the bundle manifest and on the projector (placement_error).
+"""
+
+import time
+
+import numpy as np
+from sklearn.neighbors import BallTree
+
+SURROGATE_PATH = 'surrogate_projector.joblib'
+
+ENGINES = ('umap', 'surrogate')
+
+DEFAULT_K = 8
+
+# Rows and numeric noise (in standard deviations) of the placement error evaluation
+DEFAULT_EVAL_ROWS = 500
+DEFAULT_EVAL_NOISE = 0.25
+
+_EXACT_DISTANCE = 1e-9
+
+
+class SurrogateProjector:
+    """k-nearest-neighbour interpolation of the training embedding."""
+
+    def __init__(self, X_processed, embedding, k=DEFAULT_K):
+        """
+        Args:
+            X_processed: Preprocessed training matrix
+            embedding: UMAP coordinates of the same rows
+            k: Neighbours averaged per point
+        """
+        self.tree = BallTree(np.asarray(X_processed, dtype=float))
+        self.embedding = np.asarray(embedding, dtype=float)
+        self.k = min(k, len(self.embedding))
+        self.placement_error = None
+
+    def transform(self, X_processed):
+        """Place preprocessed rows in the UMAP space; returns an array of shape (n, 2)."""
+        X = np.atleast_2d(np.asarray(X_processed, dtype=float))
+        distances, indices = self.tree.query(X, k=self.k)
+
+        weights = 1.0 / np.maximum(distances, _EXACT_DISTANCE)
+        # A point on top of a training row takes that row's coordinates
+        exact = distances[:, 0] < _EXACT_DISTANCE
+        weights[exact] = 0.0
+        weights[exact, 0] = 1.0
+
+        weights /= weights.sum(axis=1, keepdims=True)
+        return np.einsum('nk,nkd->nd', weights, self.embedding[indices])
+
+
+def measure_placement_error(projector, reducer, X_processed, noise_columns, n_rows=DEFAULT_EVAL_ROWS,
+                            noise=DEFAULT_EVAL_NOISE, seed=42):
+    """
+    Compare surrogate and UMAP placements of perturbed training rows.
+
+    Args:
+        projector: Fitted SurrogateProjector
+        reducer: Fitted UMAP model (the reference)
+        X_processed: Preprocessed training matrix
+        noise_columns: Columns of X_processed that get Gaussian noise (the scaled numeric
+            features); the other columns are kept, so rows stay valid one-hot records
+        n_rows: Rows to evaluate
+        noise: Standard deviation of the noise
+        seed: Seed of the row sample and the noise
+
+    Returns:
+        Dict with the placement error (mean, median, p95, max, and mean relative to the
+        diagonal of the training embedding) and the milliseconds per point of both engines
+    """
+    rng = np.random.default_rng(seed)
+    X = np.asarray(X_processed, dtype=float)
+    rows = rng.choice(len(X), size=min(n_rows, len(X)), replace=False)
+    X_new = X[rows].copy()
+    X_new[:, noise_columns] += rng.normal(0.0, noise, size=X_new[:, noise_columns].shape)
+
+    start = time.perf_counter()
+    expected = reducer.transform(X_new)
+    umap_seconds = time.perf_counter() - start
+
+    start = time.perf_counter()
+    placed = projector.transform(X_new)
+    surrogate_seconds = time.perf_counter() - start
+
+    # Single-point latency, the case the surrogate is for
+    start = time.perf_counter()
+    for row in X_new[:50]:
+        projector.transform(row[None, :])
+    single_point_seconds = (time.perf_counter() - start) / min(50, len(X_new))
+
+    errors = np.linalg.norm(placed - expected, axis=1)
+    diagonal = float(np.linalg.norm(np.ptp(projector.embedding, axis=0)))
+    return {
+        'rows': len(X_new),
+        'noise': noise,
+        'mean': float(errors.mean()),
+        'median': float(np.median(errors)),
+        'p95': float(np.percentile(errors, 95)),
+        'max': float(errors.max()),
+        'relative_mean': float(errors.mean() / diagonal) if diagonal else None,
+        'umap_ms_per_point': umap_seconds / len(X_new) * 1000,
+        'surrogate_ms_per_point': surrogate_seconds / len(X_new) * 1000,
+        'surrogate_single_point_ms': single_point_seconds * 1000,
+    }
+
+
+def fit_surrogate(X_processed, embedding, reducer, noise_columns, k=DEFAULT_K):
+    """
+    Fit the surrogate on the training rows and measure its placement error.
+
+    Returns:
+        SurrogateProjector with placement_error filled in
+    """
+    projector = SurrogateProjector(X_processed, embedding, k)
+    projector.placement_error = measure_placement_error(projector, reducer, X_processed, noise_columns)
+    return projector
+
+
+def format_placement_error(error):
+    """One-line summary of measure_placement_error's result."""
+    # relative_mean is None when all training points share one coordinate
+    relative = 'n/a' if error['relative_mean'] is None else f"{error['relative_mean']:.1%}"
+    return (f"placement error vs UMAP.transform: mean {error['mean']:.3f} "
+            f"({relative} of the embedding diagonal), p95 {error['p95']:.3f}; "
+            f"{error['surrogate_single_point_ms']:.3f} ms per single point, "
+            f"{error['surrogate_ms_per_point']:.4f} vs {error['umap_ms_per_point']:.3f} ms per point in batch")
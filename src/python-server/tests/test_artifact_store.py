@@ -0,0 +1,86 @@
+import os
+
+import joblib
+import numpy as np
+import pytest
+
+import artifact_store
+from artifact_store import (
+    ArtifactVersionError, artifact_path, current_version, load_array, load_manifest, prune_bundles,
+    save_bundle, verify_bundle,
+)
+
+
+def _save(model_dir, value=1):
+    training = os.path.join(model_dir, 'training.csv')
+    with open(training, 'w') as f:
+        f.write('age\n30\n')
+    return save_bundle({'model.joblib': {'value': value}}, {'matrix.npy': np.arange(6.0).reshape(3, 2) * value},
+                       training, {'n_neighbors': 15}, model_dir=str(model_dir), metadata={'note': value})
+
+
+def test_saved_bundle_round_trips_and_becomes_current(tmp_path):
+    version = _save(tmp_path)
+
+    assert current_version(str(tmp_path)) == version
+    assert joblib.load(artifact_path('model.joblib', str(tmp_path))) == {'value': 1}
+    np.testing.assert_array_equal(load_array('matrix.npy', str(tmp_path)), np.arange(6.0).reshape(3, 2))
+    manifest = load_manifest(str(tmp_path))
+    assert manifest['metadata'] == {'note': 1}
+    assert manifest['arrays']['matrix.npy'] == {'shape': [3, 2], 'dtype': 'float64'}
+    assert verify_bundle(str(tmp_path)) == version
+
+    # Same content, same version; other content becomes the new current bundle
+    assert _save(tmp_path) == version
+    assert _save(tmp_path, value=2) != version
+    assert joblib.load(artifact_path('model.joblib', str(tmp_path), version)) == {'value': 1}
+
+
+def test_without_a_store_the_flat_files_are_used(tmp_path):
+    assert current_version(str(tmp_path)) is None
+    assert artifact_path('model.joblib', str(tmp_path)) == os.path.join(str(tmp_path), 'model.joblib')
+
+
+def test_files_outside_the_bundle_or_of_another_size_are_rejected(tmp_path):
+    version = _save(tmp_path)
+
+    with pytest.raises(ArtifactVersionError):
+        artifact_path('model.joblib', str(tmp_path), 'f' * 16)
+    with pytest.raises(ArtifactVersionError):
+        artifact_path('other.joblib', str(tmp_path), version)
+
+    with open(os.path.join(artifact_store.store_dir(str(tmp_path)), version, 'model.joblib'), 'ab') as f:
+        f.write(b'\0')
+    with pytest.raises(ArtifactVersionError):
+        artifact_path('model.joblib', str(tmp_path), version)
+
+
+def test_changed_content_is_only_hashed_on_request(tmp_path):
+    version = _save(tmp_path)
+    path = os.path.join(artifact_store.store_dir(str(tmp_path)), version, 'matrix.npy')
+    with open(path, 'r+b') as f:
+        f.seek(-1, os.SEEK_END)
+        f.write(b'\xff')
+
+    assert artifact_path('matrix.npy', str(tmp_path), version) == path
+    with pytest.raises(ArtifactVersionError):
+        artifact_path('matrix.npy', str(tmp_path), version, verify=True)
+    with pytest.raises(ArtifactVersionError):
+        verify_bundle(str(tmp_path), version)
+
+
+def test_prune_keeps_the_current_and_the_most_recent_bundles(tmp_path):
+    versions = []
+    for value in range(1, 6):
+        versions.append(_save(tmp_path, value))
+        bundle_dir = os.path.join(artifact_store.store_dir(str(tmp_path)), versions[-1])
+        os.utime(bundle_dir, (1000 * value, 1000 * value))
+
+    # The current bundle is the oldest after moving CURRENT back
+    with open(os.path.join(artifact_store.store_dir(str(tmp_path)), 'CURRENT'), 'w') as f:
+        f.write(versions[0] + '\n')
+
+    assert prune_bundles(str(tmp_path), keep=3) == [versions[1]]
+    remaining = [entry for entry in os.listdir(artifact_store.store_dir(str(tmp_path)))
+                 if entry != 'CURRENT']
+    assert sorted(remaining) == sorted([versions[0]] + versions[2:])
@@ -0,0 +1,65 @@
+import numpy as np
+import pandas as pd
+
+from counterfactual_diff import DIFF_COLUMNS, FEATURE_KEYS, add_counterfactual_diffs
+
+
+class NumericPreprocessor:
+    """Stands in for the fitted preprocessor: the numeric features as they are."""
+
+    def transform(self, df):
+        return df[['age', 'credit amount', 'duration', 'job']].to_numpy(dtype=float)
+
+
+def _frame():
+    return pd.DataFrame({
+        'age': [50, 30, 30, 33],
+        'sex': ['female', 'male', 'male', 'male'],
+        'job': [1, 2, 2, 2],
+        'housing': ['rent', 'own', 'own', 'own'],
+        'saving accounts': ['rich', 'little', 'moderate', 'little'],
+        'checking account': ['little', 'little', 'little', 'little'],
+        'credit amount': [9000, 1000, 1000, 1000],
+        'duration': [6, 12, 12, 16],
+        'purpose': ['car', 'car', 'car', 'car'],
+        'counterfactual': [0, 2, 1, 1],
+    })
+
+
+def _bit(key):
+    return 1 << FEATURE_KEYS.index(key)
+
+
+def test_counterfactuals_are_compared_with_the_user_row():
+    coords = np.array([[9.0, 9.0], [0.0, 0.0], [3.0, 4.0], [0.0, 1.0]])
+    df = add_counterfactual_diffs(_frame(), coords, NumericPreprocessor())
+
+    assert set(DIFF_COLUMNS) <= set(df.columns)
+    assert df['changed_mask'].tolist() == [0, 0, _bit('saving_accounts'), _bit('age') | _bit('duration')]
+    assert df['delta_age'].tolist()[2:] == [0.0, 3.0]
+    assert df['delta_duration'].tolist()[2:] == [0.0, 4.0]
+    np.testing.assert_allclose(df['embedding_distance'][2:], [5.0, 1.0])
+    np.testing.assert_allclose(df['feature_distance'][2:], [0.0, 5.0])
+    # Training and user rows carry no diff
+    assert df[['delta_age', 'feature_distance', 'embedding_distance']].iloc[:2].isna().all().all()
+
+
+def test_explicit_user_reference():
+    df = _frame()
+    counterfactuals = df[df['counterfactual'] == 1].reset_index(drop=True)
+    # A batch without the user row, compared with the user passed in
+    result = add_counterfactual_diffs(counterfactuals, [[3.0, 4.0], [0.0, 1.0]],
+                                      user=df.iloc[[1]], user_coords=[0.0, 0.0])
+
+    np.testing.assert_allclose(result['embedding_distance'], [5.0, 1.0])
+    assert result['delta_duration'].tolist() == [0.0, 4.0]
+    # Without a preprocessor there is no feature distance
+    assert result['feature_distance'].isna().all()
+
+
+def test_no_user_row_leaves_the_frame_unchanged():
+    df = _frame()
+    df = df[df['counterfactual'] != 2]
+    result = add_counterfactual_diffs(df, np.zeros((len(df), 2)))
+
+    assert not set(DIFF_COLUMNS) & set(result.columns)
@@ -0,0 +1,79 @@
+import pandas as pd
+import pytest
+
+from credit_schema import IngestReport, SchemaError, iter_credit_csv, read_credit_csv
+
+HEADER = 'Age,Sex,Job,Housing,Saving.accounts,Checking.account,Credit.amount,Duration,Purpose,Risk'
+VALID = '30,male,2,own,little,moderate,1000,12,car,good'
+
+
+def _write(tmp_path, lines, header=HEADER):
+    path = tmp_path / 'credit.csv'
+    path.write_text('\n'.join([header] + lines) + '\n')
+    return str(path)
+
+
+def test_valid_rows_are_typed_and_renamed(tmp_path):
+    df, report = read_credit_csv(_write(tmp_path, [VALID, '45,female,0,rent,rich,little,2500,24,radio/TV,bad']))
+
+    assert list(df.columns[:3]) == ['age', 'sex', 'job']
+    assert 'saving accounts' in df.columns and 'credit amount' in df.columns
+    assert str(df['age'].dtype) == 'int16' and str(df['job'].dtype) == 'int8'
+    assert isinstance(df['purpose'].dtype, pd.CategoricalDtype)
+    assert report.rows_read == 2 and report.rows_rejected == 0
+
+
+def test_r_row_names_are_skipped(tmp_path):
+    df, report = read_credit_csv(_write(tmp_path, ['"1",' + VALID], header='"",' + HEADER))
+
+    assert 'age' == df.columns[0] and len(df) == 1
+
+
+def test_invalid_rows_are_rejected_with_reasons(tmp_path):
+    df, report = read_credit_csv(_write(tmp_path, [
+        VALID,
+        '200,male,2,own,little,moderate,1000,12,car,good',   # age out of range
+        '30,male,7,own,little,moderate,1000,12,car,good',    # job out of range
+        '30,male,2,own,little,moderate,-5,12,car,good',      # negative amount
+        '30,,2,own,little,moderate,1000,12,car,good',        # missing sex
+    ]))
+
+    assert df.index.tolist() == [0]
+    assert report.rows_read == 5 and report.rows_rejected == 4 and report.rows_kept == 1
+    assert report.reasons == {
+        'age: outside 0-150': 1,
+        'job: outside 0-3': 1,
+        'credit amount: outside 0-2147483647': 1,
+        'sex: missing': 1,
+    }
+    # Line numbers count the header as line 1
+    assert [example['line'] for example in report.examples] == [3, 4, 5, 6]
+
+
+def test_fractions_fall_back_to_float_parsing(tmp_path):
+    df, report = read_credit_csv(_write(tmp_path, [VALID, '30.5,male,2,own,little,moderate,1000,12,car,good']))
+
+    assert len(df) == 1 and str(df['age'].dtype) == 'int16'
+    assert report.reasons == {'age: not an integer': 1}
+
+
+def test_text_falls_back_to_checking_cells(tmp_path):
+    df, report = read_credit_csv(_write(tmp_path, [VALID, 'thirty,male,2,own,little,moderate,1000,12,car,good']))
+
+    assert len(df) == 1
+    assert report.rows_read == 2 and report.reasons == {'age: not a number': 1}
+
+
+def test_chunked_fallback_counts_every_row_once(tmp_path):
+    lines = [VALID] * 5 + ['thirty,male,2,own,little,moderate,1000,12,car,good'] + [VALID] * 3
+    report = IngestReport()
+    chunks = [chunk for chunk, _ in iter_credit_csv(_write(tmp_path, lines), chunksize=2, report=report)]
+
+    positions = [position for chunk in chunks for position in chunk.index]
+    assert positions == [0, 1, 2, 3, 4, 6, 7, 8]
+    assert report.rows_read == 9 and report.rows_rejected == 1
+
+
+def test_missing_required_column_raises(tmp_path):
+    with pytest.raises(SchemaError):
+        read_credit_csv(_write(tmp_path, ['30,male'], header='Age,Sex'))
@@ -0,0 +1,91 @@
+import pandas as pd
+import pytest
+
+import artifact_store
+import create_joint_dataset
+from embedding_worker import EmbeddingWorker, WorkerArtifacts
+
+
+class FakeNeighborIndex:
+    """Answers every query with the bundle version it was loaded from."""
+
+    def __init__(self, version):
+        self.version = version
+
+    def query_records(self, X, k, space='features'):
+        return [{'version': self.version, 'space': space, 'k': k}]
+
+
+class FakeWorker(EmbeddingWorker):
+    """EmbeddingWorker whose 'bundles' are fakes named by their version."""
+
+    def load_artifacts(self, bundle_version):
+        self.loaded.append(bundle_version)
+        if bundle_version == 'broken':
+            raise OSError("manifest.json is missing")
+        artifacts = WorkerArtifacts(bundle_version)
+        artifacts.version = bundle_version
+        artifacts.reducer = artifacts.preprocessor = object()
+        artifacts.neighbor_index = FakeNeighborIndex(bundle_version)
+        return artifacts
+
+
+@pytest.fixture
+def bundle(monkeypatch):
+    """Mutable CURRENT of the artifact store; set bundle['current'] to publish a new bundle."""
+    state = {'current': 'v1'}
+    monkeypatch.setattr(artifact_store, 'current_version', lambda model_dir='.': state['current'])
+    monkeypatch.setattr(create_joint_dataset, 'load_training_data', lambda path=None: pd.DataFrame())
+    monkeypatch.setattr(FakeWorker, 'loaded', [], raising=False)
+    return state
+
+
+def _neighbors(worker):
+    response = worker.handle({'id': '1', 'cmd': 'neighbors', 'points': [[0.0, 0.0]], 'k': 3})
+    assert response['ok'], response
+    return response['result']['neighbors'][0]['version']
+
+
+def test_jobs_use_the_new_bundle_once_current_moves(bundle):
+    worker = FakeWorker()
+    assert _neighbors(worker) == 'v1'
+    assert _neighbors(worker) == 'v1'
+    assert worker.loaded == ['v1']
+
+    bundle['current'] = 'v2'
+    assert _neighbors(worker) == 'v2'
+    assert worker.health()['artifact_version'] == 'v2'
+    assert worker.loaded == ['v1', 'v2']
+
+
+def test_failed_reload_keeps_the_loaded_bundle_and_retries(bundle):
+    worker = FakeWorker()
+    bundle['current'] = 'broken'
+    assert _neighbors(worker) == 'v1'
+    assert _neighbors(worker) == 'v1'
+    assert worker.loaded == ['v1', 'broken', 'broken']
+
+
+def test_unknown_commands_and_engines_fail_the_job_only(bundle):
+    worker = FakeWorker()
+    response = worker.handle({'id': '7', 'cmd': 'explode'})
+    assert response == {'id': '7', 'ok': False, 'error': 'Unknown command: explode'}
+
+    response = worker.handle({'id': '8', 'cmd': 'map', 'input': 'a.csv', 'output': 'b.json', 'engine': 'tsne'})
+    assert not response['ok'] and 'tsne' in response['error']
+    assert worker.health()['jobs_failed'] == 1
+
+
+def test_streaming_runs_are_not_coalesced(bundle, tmp_path):
+    worker = FakeWorker()
+    counterfactuals, user = tmp_path / 'cf.csv', tmp_path / 'user.csv'
+    counterfactuals.write_text('age\n30\n')
+    user.write_text('age\n31\n')
+    job = {'cmd': 'run_pipeline', 'counterfactuals': str(counterfactuals), 'user': str(user)}
+
+    key = worker.coalescing_key(job)
+    assert key is not None and key == worker.coalescing_key(dict(job))
+    assert worker.coalescing_key({**job, 'engine': 'surrogate'}) != key
+    assert worker.coalescing_key({**job, 'stream': True}) is None
+    assert worker.coalescing_key({**job, 'key': 'abc'}) == 'run_pipeline:umap:abc'
+
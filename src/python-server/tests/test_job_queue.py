@@ -0,0 +1,128 @@
+import asyncio
+import threading
+
+import pytest
+
+from job_queue import JobAbandonedError, JobCancelledError, JobQueue, JobTimeoutError, QueueFullError
+
+
+class BlockingRun:
+    """Job function that counts its calls and waits until released."""
+
+    def __init__(self):
+        self.calls = []
+        self.release = threading.Event()
+
+    def __call__(self, job, abandoned):
+        self.calls.append(job)
+        self.release.wait(5)
+        return job['value'] * 2
+
+
+def test_same_key_shares_one_computation():
+    run = BlockingRun()
+
+    async def main():
+        queue = JobQueue(run)
+        first = asyncio.ensure_future(queue.submit({'value': 1}, key='a'))
+        await asyncio.sleep(0.05)
+        second = asyncio.ensure_future(queue.submit({'value': 1}, key='a'))
+        other = asyncio.ensure_future(queue.submit({'value': 3}, key='b'))
+        await asyncio.sleep(0.05)
+        run.release.set()
+        results = await asyncio.gather(first, second, other)
+        queue.shutdown()
+        return results, queue.stats()
+
+    results, stats = asyncio.run(main())
+    assert results == [(2, False), (2, True), (6, False)]
+    assert len(run.calls) == 2
+    assert stats['coalesced'] == 1 and stats['done'] == 3
+
+
+def test_timeout_leaves_the_computation_to_other_waiters():
+    run = BlockingRun()
+
+    async def main():
+        queue = JobQueue(run)
+        patient = asyncio.ensure_future(queue.submit({'value': 2}, key='a'))
+        await asyncio.sleep(0.05)
+        with pytest.raises(JobTimeoutError):
+            await queue.submit({'value': 2}, key='a', timeout=0.05)
+        run.release.set()
+        result = await patient
+        await queue.drain()
+        queue.shutdown()
+        return result, queue.stats()
+
+    result, stats = asyncio.run(main())
+    assert result == (4, False)
+    assert len(run.calls) == 1
+    assert stats['timed_out'] == 1 and stats['running'] == 0
+
+
+def test_abandoned_job_is_dropped_before_it_starts():
+    run = BlockingRun()
+
+    async def main():
+        queue = JobQueue(run, max_concurrency=1)
+        running = asyncio.ensure_future(queue.submit({'value': 1}))
+        await asyncio.sleep(0.05)
+        with pytest.raises(JobTimeoutError):
+            await queue.submit({'value': 5}, timeout=0.05)
+        run.release.set()
+        await running
+        await queue.drain()
+        queue.shutdown()
+
+    asyncio.run(main())
+    # The timed-out job was still waiting for the slot and never ran
+    assert run.calls == [{'value': 1}]
+
+
+def test_full_queue_rejects_and_cancel_by_id():
+    run = BlockingRun()
+
+    async def main():
+        queue = JobQueue(run, max_concurrency=1, max_queue=1)
+        running = asyncio.ensure_future(queue.submit({'value': 1}))
+        await asyncio.sleep(0.05)
+        waiting = asyncio.ensure_future(queue.submit({'value': 2}, job_id='waiting'))
+        await asyncio.sleep(0.05)
+        with pytest.raises(QueueFullError):
+            await queue.submit({'value': 3})
+        assert queue.cancel('waiting') and not queue.cancel('unknown')
+        with pytest.raises(JobCancelledError):
+            await waiting
+        run.release.set()
+        await running
+        queue.shutdown()
+        return queue.stats()
+
+    stats = asyncio.run(main())
+    assert stats['rejected'] == 1 and stats['cancelled'] == 1
+
+
+def test_abandoned_running_job_can_stop_and_free_its_slot():
+    calls = []
+
+    def run(job, abandoned):
+        calls.append(job)
+        if job.get('stoppable'):
+            # Checks between its steps whether anybody still waits for it
+            if abandoned.wait(5):
+                raise JobAbandonedError("Nobody waits for this job")
+        return job['value']
+
+    async def main():
+        queue = JobQueue(run, max_concurrency=1)
+        with pytest.raises(JobTimeoutError):
+            await queue.submit({'value': 1, 'stoppable': True}, key='a', timeout=0.05)
+        # Neither waits for the abandoned job nor joins it
+        result = await queue.submit({'value': 2}, key='a', timeout=1)
+        await queue.drain()
+        queue.shutdown()
+        return result
+
+    assert asyncio.run(main()) == (2, False)
+    assert [job['value'] for job in calls] == [1, 2]
@@ -0,0 +1,82 @@
+import json
+import os
+
+import joblib
+import numpy as np
+import pytest
+
+from benchmark_json_export import make_synthetic_frame
+from feature_encoder import FeatureEncoder
+from map_to_umap_embeddings import load_original_model, map_new_data_streaming
+from preprocessing import build_preprocessor
+from surrogate_projector import SURROGATE_PATH, SurrogateProjector
+
+FEATURES = ['age', 'sex', 'job', 'housing', 'saving accounts', 'checking account',
+            'credit amount', 'duration', 'purpose']
+
+
+@pytest.fixture
+def model_dir(tmp_path):
+    """Legacy flat-file artifacts with a surrogate projector over a fake embedding."""
+    training = make_synthetic_frame(60, seed=0)[FEATURES]
+    feature_encoder = FeatureEncoder().fit(training)
+    grouped = feature_encoder.transform(training)
+    preprocessor = build_preprocessor().fit(grouped)
+    X = preprocessor.transform(grouped)
+    embedding = np.random.default_rng(0).normal(size=(len(X), 2))
+
+    feature_encoder.save(str(tmp_path / 'feature_encoder.joblib'))
+    joblib.dump(preprocessor, tmp_path / 'preprocessor.joblib')
+    joblib.dump(SurrogateProjector(X, embedding), tmp_path / SURROGATE_PATH)
+    return tmp_path
+
+
+@pytest.fixture
+def input_csv(tmp_path):
+    path = tmp_path / 'input.csv'
+    make_synthetic_frame(45, seed=1)[FEATURES].to_csv(path, index=False)
+    return path
+
+
+def _map(model_dir, input_csv, output, workers):
+    return map_new_data_streaming(str(input_csv), str(output), chunk_size=7, workers=workers,
+                                  model_dir=str(model_dir), engine='surrogate')
+
+
+def test_output_is_in_input_order_and_independent_of_the_worker_count(model_dir, input_csv, tmp_path):
+    single, pooled = tmp_path / 'single.ndjson', tmp_path / 'pooled.ndjson'
+    assert _map(model_dir, input_csv, single, workers=1) == 45
+    assert _map(model_dir, input_csv, pooled, workers=2) == 45
+
+    assert single.read_bytes() == pooled.read_bytes()
+    ids = [json.loads(line)['id'] for line in single.read_text().splitlines()]
+    assert ids == list(range(45))
+    assert not [name for name in os.listdir(tmp_path) if name.endswith('.tmp')]
+
+
+class FailingReducer:
+    """Projects the first chunk, then fails."""
+
+    def __init__(self, reducer):
+        self.reducer = reducer
+        self.calls = 0
+
+    def transform(self, X):
+        self.calls += 1
+        if self.calls > 1:
+            raise RuntimeError("chunk failed")
+        return self.reducer.transform(X)
+
+
+def test_a_failed_chunk_leaves_the_previous_output_in_place(model_dir, input_csv, tmp_path):
+    output = tmp_path / 'output.ndjson'
+    output.write_text('previous\n')
+    reducer, preprocessor = load_original_model(str(model_dir), engine='surrogate')
+
+    with pytest.raises(RuntimeError, match='chunk failed'):
+        map_new_data_streaming(str(input_csv), str(output), chunk_size=7,
+                               reducer=FailingReducer(reducer), preprocessor=preprocessor,
+                               model_dir=str(model_dir))
+
+    assert output.read_text() == 'previous\n'
+    assert not [name for name in os.listdir(tmp_path) if name.endswith('.tmp')]
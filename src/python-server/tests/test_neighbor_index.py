@@ -0,0 +1,59 @@
+import numpy as np
+import pytest
+from sklearn.neighbors import BallTree, KDTree
+
+import neighbor_index
+from neighbor_index import NeighborIndex
+
+
+def _index(n_rows=200, **kwargs):
+    rng = np.random.default_rng(0)
+    X = rng.normal(size=(n_rows, 12))
+    embedding = rng.normal(size=(n_rows, 2))
+    labels = rng.choice(['good', 'bad'], n_rows)
+    return NeighborIndex(X, embedding, labels, ids=np.arange(n_rows) + 1000, **kwargs), X, embedding, labels
+
+
+@pytest.mark.parametrize('space', ['features', 'umap'])
+def test_exact_index_matches_brute_force(space):
+    index, X, embedding, labels = _index()
+    data = X if space == 'features' else embedding
+    points = data[:5] + 0.01
+
+    ids, distances, found_labels = index.query(points, k=4, space=space)
+
+    all_distances = np.linalg.norm(points[:, None, :] - data[None, :, :], axis=2)
+    expected = np.argsort(all_distances, axis=1)[:, :4]
+    np.testing.assert_array_equal(ids, expected + 1000)
+    np.testing.assert_allclose(distances, np.take_along_axis(all_distances, expected, axis=1))
+    np.testing.assert_array_equal(found_labels, labels[expected])
+
+
+def test_kd_tree_for_the_umap_plane_and_ball_tree_for_the_feature_space():
+    index, *_ = _index()
+    assert not index.approximate
+    assert isinstance(index.trees['umap'], KDTree)
+    assert isinstance(index.trees['features'], BallTree)
+
+
+class FakeApproximateTree:
+    def __init__(self, data):
+        self.data = data
+
+
+def test_approximate_index_above_the_threshold(monkeypatch):
+    monkeypatch.setattr(neighbor_index, '_ApproximateTree', FakeApproximateTree)
+    monkeypatch.setattr(neighbor_index, 'APPROXIMATE_THRESHOLD', 100)
+
+    assert _index(n_rows=100)[0].approximate is False
+    index = _index(n_rows=101)[0]
+    assert index.approximate
+    assert all(isinstance(tree, FakeApproximateTree) for tree in index.trees.values())
+    assert _index(n_rows=101, approximate=False)[0].approximate is False
+
+
+def test_k_is_capped_and_unknown_spaces_are_rejected():
+    index, X, *_ = _index(n_rows=3)
+    assert index.query(X[:1], k=10)[0].shape == (1, 3)
+    with pytest.raises(ValueError):
+        index.query(X[:1], space='pca')
@@ -0,0 +1,52 @@
+import numpy as np
+
+from benchmark_json_export import make_synthetic_frame
+from feature_encoder import FeatureEncoder
+from generate_umap_with_counterfactuals import project_incrementally
+from map_to_umap_embeddings import TrainingEmbedding
+from projection_cache import rows_hash
+
+
+class FakePreprocessor:
+    def transform(self, df):
+        return df[['age', 'duration']].to_numpy(dtype=float)
+
+
+class BatchDependentReducer:
+    """Like UMAP.transform, places a row differently depending on the rest of its batch."""
+
+    def __init__(self):
+        self.batches = []
+
+    def transform(self, X):
+        self.batches.append(X.copy())
+        return X + len(X)
+
+
+def _joint_dataset():
+    df = make_synthetic_frame(90, seed=3)
+    df['counterfactual'] = [0] * 10 + [1] * 40 + [2] + [1] * 39
+    return FeatureEncoder().fit_transform(df)
+
+
+def _training_embedding(df):
+    training = df[df['counterfactual'] == 0]
+    return TrainingEmbedding(np.zeros((len(training), 2)), rows_hash(training))
+
+
+def test_streamed_and_plain_runs_place_every_point_alike():
+    df = _joint_dataset()
+    plain = project_incrementally(df, BatchDependentReducer(), FakePreprocessor(), _training_embedding(df),
+                                  batch_size=16)
+
+    reducer, streamed_batches = BatchDependentReducer(), []
+    streamed = project_incrementally(df, reducer, FakePreprocessor(), _training_embedding(df),
+                                     on_batch=lambda positions, placed: streamed_batches.append(positions),
+                                     batch_size=16)
+
+    np.testing.assert_array_equal(streamed, plain)
+    # The user row is placed first and on its own, then the counterfactuals 16 at a time
+    assert [len(batch) for batch in reducer.batches] == [1, 16, 16, 16, 16, 15]
+    assert list(streamed_batches[0]) == [50]
+    assert sorted(np.concatenate(streamed_batches)) == list(range(10, 90))
+    np.testing.assert_array_equal(streamed[:10], np.zeros((10, 2)))
@@ -0,0 +1,86 @@
+import numpy as np
+
+from benchmark_json_export import make_synthetic_frame
+from feature_encoder import FeatureEncoder
+from projection_cache import ProjectionCache
+
+
+class FakePreprocessor:
+    def transform(self, df):
+        return df[['age', 'duration']].to_numpy(dtype=float)
+
+
+class CountingReducer:
+    """Places a row at (age, duration) and counts the rows it transformed."""
+
+    def __init__(self):
+        self.rows = 0
+
+    def transform(self, X):
+        self.rows += len(X)
+        return np.asarray(X, dtype=float)
+
+
+def _rows(n_rows=10, seed=0):
+    return FeatureEncoder().fit_transform(make_synthetic_frame(n_rows, seed)).reset_index(drop=True)
+
+
+def test_repeated_rows_are_served_from_memory():
+    cache, reducer, rows = ProjectionCache('v1'), CountingReducer(), _rows()
+
+    first = cache.project(rows, FakePreprocessor(), reducer)
+    assert reducer.rows == 10
+    second = cache.project(rows.iloc[::-1], FakePreprocessor(), reducer)
+
+    assert reducer.rows == 10
+    np.testing.assert_array_equal(second, first[::-1])
+    assert cache.stats()['memory_hits'] == 10 and cache.stats()['misses'] == 10
+
+
+def test_identical_rows_in_one_batch_are_transformed_once():
+    cache, reducer = ProjectionCache('v1'), CountingReducer()
+    rows = _rows(3)
+    cache.project(rows.iloc[[0, 1, 0, 0, 2]], FakePreprocessor(), reducer)
+    assert reducer.rows == 3
+    assert cache.stats()['misses'] == 5
+
+
+def test_a_new_version_misses():
+    reducer, rows = CountingReducer(), _rows()
+    ProjectionCache('v1').project(rows, FakePreprocessor(), reducer)
+    cache = ProjectionCache('v2')
+    cache.project(rows, FakePreprocessor(), reducer)
+    assert reducer.rows == 20
+    assert cache.stats()['misses'] == 10
+
+
+def test_the_disk_tier_survives_a_new_instance(tmp_path):
+    path = str(tmp_path / 'cache' / 'projections.sqlite')
+    reducer, rows = CountingReducer(), _rows()
+    expected = ProjectionCache('v1', disk_path=path).project(rows, FakePreprocessor(), reducer)
+
+    cache = ProjectionCache('v1', disk_path=path)
+    np.testing.assert_array_equal(cache.project(rows, FakePreprocessor(), reducer), expected)
+    assert reducer.rows == 10
+    assert cache.stats()['disk_hits'] == 10
+    assert cache.stats()['memory_entries'] == 10
+
+    other_version = ProjectionCache('v2', disk_path=path)
+    other_version.project(rows, FakePreprocessor(), reducer)
+    assert other_version.stats()['disk_hits'] == 0
+
+
+def test_memory_tier_evicts_the_least_recently_used_rows():
+    cache, reducer, rows = ProjectionCache('v1', max_entries=3), CountingReducer(), _rows(5)
+
+    cache.project(rows.iloc[[0, 1, 2]], FakePreprocessor(), reducer)
+    cache.project(rows.iloc[[0]], FakePreprocessor(), reducer)
+    cache.project(rows.iloc[[3]], FakePreprocessor(), reducer)
+    assert cache.stats()['memory_entries'] == 3
+    assert reducer.rows == 4
+
+    # Row 1 was least recently used and is gone; rows 0, 2 and 3 are kept
+    cache.project(rows.iloc[[0, 2, 3]], FakePreprocessor(), reducer)
+    assert reducer.rows == 4
+    cache.project(rows.iloc[[1]], FakePreprocessor(), reducer)
+    assert reducer.rows == 5
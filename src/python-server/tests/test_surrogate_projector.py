@@ -0,0 +1,33 @@
+import numpy as np
+import pytest
+
+from surrogate_projector import SurrogateProjector, format_placement_error
+
+X = np.array([[0.0, 0.0], [1.0, 0.0], [3.0, 0.0], [10.0, 0.0]])
+EMBEDDING = np.array([[0.0, 0.0], [4.0, 8.0], [-2.0, 1.0], [50.0, 50.0]])
+
+
+def test_a_point_on_a_training_row_takes_its_coordinates():
+    projector = SurrogateProjector(X, EMBEDDING, k=3)
+    np.testing.assert_allclose(projector.transform(X), EMBEDDING)
+
+
+def test_other_points_take_the_inverse_distance_weighted_mean_of_their_neighbours():
+    projector = SurrogateProjector(X, EMBEDDING, k=2)
+
+    # Distances 0.25 and 0.75 to the rows at 0 and 1: weights 4 and 4/3, i.e. 3/4 and 1/4
+    np.testing.assert_allclose(projector.transform([[0.25, 0.0]]), [[1.0, 2.0]])
+    # Distances 1 and 3 to the rows at 3 and 1: weights 1 and 1/3, i.e. 3/4 and 1/4
+    np.testing.assert_allclose(projector.transform([[4.0, 0.0]]), [[-0.5, 2.75]])
+
+
+def test_k_is_capped_at_the_training_rows():
+    projector = SurrogateProjector(X[:2], EMBEDDING[:2], k=8)
+    assert projector.transform([[0.5, 0.0]]).shape == (1, 2)
+
+
+@pytest.mark.parametrize('relative_mean, expected', [(0.0123, '1.2%'), (None, 'n/a')])
+def test_placement_error_summary(relative_mean, expected):
+    error = {'mean': 0.5, 'relative_mean': relative_mean, 'p95': 1.0, 'surrogate_single_point_ms': 0.1,
+             'surrogate_ms_per_point': 0.01, 'umap_ms_per_point': 2.0}
+    assert f"({expected} of the embedding diagonal)" in format_placement_error(error)
@@ -0,0 +1,36 @@
+import numpy as np
+import pandas as pd
+
+from map_to_umap_embeddings import TrainingEmbedding
+from projection_cache import rows_hash
+
+
+def _rows():
+    return pd.DataFrame({
+        'age': [30, 45, 52],
+        'sex': ['male', 'female', 'male'],
+        'job': [2, 1, 3],
+        'housing': ['own', 'rent', 'free'],
+        'saving accounts': ['little', 'moderate', 'little'],
+        'checking account': ['little', 'moderate', 'rich'],
+        'credit amount': [1000, 2500, 9000],
+        'duration': [12, 24, 36],
+        'purpose': ['car', 'business', 'other'],
+    })
+
+
+def test_coordinates_are_only_reused_for_the_same_rows_in_the_same_order():
+    rows = _rows()
+    embedding = TrainingEmbedding(np.zeros((3, 2)), rows_hash(rows))
+
+    # Same values with other dtypes (as read by another path) still match
+    assert embedding.matches(rows.astype({'age': float, 'sex': 'category'}))
+    assert not embedding.matches(rows.iloc[[1, 0, 2]])
+    changed = rows.copy()
+    changed.loc[1, 'credit amount'] = 2600
+    assert not embedding.matches(changed)
+    assert not embedding.matches(rows.iloc[:2])
+
+
+def test_bundles_without_a_rows_hash_are_never_reused():
+    assert not TrainingEmbedding(np.zeros((3, 2))).matches(_rows())
@@ -0,0 +1,44 @@
+import json
+import os
+import time
+
+import generate_umap_with_counterfactuals as layers
+
+
+def _touch(path, age_seconds=0):
+    with open(path, 'w') as f:
+        f.write('[]')
+    mtime = time.time() - age_seconds
+    os.utime(path, (mtime, mtime))
+
+
+def _write_delta(run_dir, training):
+    os.makedirs(run_dir, exist_ok=True)
+    with open(os.path.join(run_dir, layers.DELTA_FILENAME), 'w') as f:
+        json.dump({'version': layers.DELTA_VERSION, 'training': training, 'points': []}, f)
+
+
+def test_layers_referenced_by_a_kept_run_survive(tmp_path, monkeypatch):
+    runs_dir = tmp_path / 'runs'
+    monkeypatch.setattr(layers, 'RUNS_DIR', str(runs_dir))
+    monkeypatch.setattr(layers, 'SCRIPT_DIR', str(tmp_path))
+
+    old, current, unused = (f'{layers.TRAINING_LAYER_NAME}.{digit * 16}.json' for digit in '012')
+    for name in (old, current, unused):
+        _touch(tmp_path / name, age_seconds=3600)
+    _write_delta(runs_dir / 'older-run', old)
+    _write_delta(runs_dir / 'newer-run', current)
+
+    assert layers.prune_training_layers(str(tmp_path)) == [unused]
+    assert sorted(os.listdir(tmp_path)) == sorted([old, current, 'runs'])
+
+
+def test_recent_layers_survive_until_their_run_writes_its_delta(tmp_path, monkeypatch):
+    monkeypatch.setattr(layers, 'RUNS_DIR', str(tmp_path / 'runs'))
+    monkeypatch.setattr(layers, 'SCRIPT_DIR', str(tmp_path))
+
+    name = f'{layers.TRAINING_LAYER_NAME}.{"a" * 16}.json'
+    _touch(tmp_path / name)
+
+    assert layers.prune_training_layers(str(tmp_path)) == []
+    assert layers.prune_training_layers(str(tmp_path), min_age_seconds=-1) == [name]
@@ -0,0 +1,312 @@
+#!/usr/bin/env python3
+"""
+UMAP hyperparameter sweep.
+
+generate_umap_embeddings.py fits one fixed configuration (UMAP_PARAMS). This
+script fits a grid of configurations and measures, for each one:
+
+- trustworthiness and neighbourhood preservation of the embedding: how well
+  the k nearest neighbours in the preprocessed feature space survive in 2D
+  (sklearn.manifold.trustworthiness, and the mean overlap of the two
+  k-nearest-neighbour sets), on a sample of at most --score-rows rows
+- fit time
+- transform latency: ms per point for a batch of probe rows and for a single
+  row, after a warm-up call so numba compilation is not counted
+- model size: bytes of the pickled model
+
+The training data is preprocessed once and saved as a temporary .npy file;
+the configurations are fitted by a process pool whose workers memory-map
+that matrix, so it is shared instead of copied per process. Each worker
+compiles the numba functions on a small warm-up fit first, so fit times are
+comparable whichever worker runs a configuration.
+
+The results are ranked by quality (the mean of trustworthiness and
+neighbourhood preservation, rounded to --quality-tolerance so that
+configurations of practically equal quality are ordered by fit time) and
+written to umap_sweep_report.json. --promote refits the winner through
+generate_umap_embeddings.main, which saves it as the new artifact bundle and
+rewrites the frontend data; --promote-from promotes the winner of an earlier
+report without sweeping again.
+
+    python3 umap_sweep.py --n-neighbors 5 15 30 50 --min-dist 0.0 0.1 0.5 --workers 4
+    python3 umap_sweep.py --promote-from umap_sweep_report.json
+"""
+
+import argparse
+import concurrent.futures
+import itertools
+import json
+import multiprocessing
+import os
+import pickle
+import tempfile
+import time
+import warnings
+
+import numpy as np
+
+from generate_umap_embeddings import UMAP_PARAMS, fit_umap
+from pipeline_runs import atomic_write
+from preprocessing import load_training_matrix
+
+DEFAULT_REPORT_PATH = 'umap_sweep_report.json'
+
+DEFAULT_N_NEIGHBORS = [5, 15, 30, 50]
+DEFAULT_MIN_DIST = [0.0, 0.1, 0.25, 0.5]
+
+# Neighbours compared by the quality scores, and rows they are computed on
+DEFAULT_SCORE_K = 10
+DEFAULT_SCORE_ROWS = 5_000
+
+# Rows transformed to measure latency
+DEFAULT_PROBE_ROWS = 200
+
+# Quality differences below this count as ties, broken by fit time
+DEFAULT_QUALITY_TOLERANCE = 0.005
+
+# Preprocessed matrix of a sweep worker process, memory-mapped by _init_sweep_worker
+_worker_matrix = None
+
+
+def neighborhood_preservation(X, embedding, k=DEFAULT_SCORE_K):
+    """Mean fraction of each row's k nearest neighbours in X that are also its neighbours in the embedding."""
+    from sklearn.neighbors import NearestNeighbors
+
+    # The first neighbour of every row is the row itself
+    high = NearestNeighbors(n_neighbors=k + 1).fit(X).kneighbors(X, return_distance=False)[:, 1:]
+    low = NearestNeighbors(n_neighbors=k + 1).fit(embedding).kneighbors(embedding, return_distance=False)[:, 1:]
+    overlap = [len(np.intersect1d(a, b, assume_unique=True)) for a, b in zip(high, low)]
+    return float(np.mean(overlap) / k)
+
+
+def score_embedding(X, embedding, k=DEFAULT_SCORE_K, score_rows=DEFAULT_SCORE_ROWS, seed=42):
+    """
+    Quality scores of an embedding of X.
+
+    Both scores compare neighbourhoods among a sample of at most score_rows rows
+    (trustworthiness needs all pairwise distances of the sample).
+
+    Returns:
+        Dict with 'trustworthiness', 'neighborhood_preservation' and their mean 'quality'
+    """
+    from sklearn.manifold import trustworthiness
+
+    rows = np.arange(len(X))
+    if len(rows) > score_rows:
+        rows = np.sort(np.random.default_rng(seed).choice(rows, size=score_rows, replace=False))
+    X_sample = np.asarray(X[rows])
+    embedding_sample = np.asarray(embedding[rows])
+
+    trust = float(trustworthiness(X_sample, embedding_sample, n_neighbors=k))
+    preservation = neighborhood_preservation(X_sample, embedding_sample, k)
+    return {
+        'trustworthiness': trust,
+        'neighborhood_preservation': preservation,
+        'quality': (trust + preservation) / 2,
+    }
+
+
+def measure_transform(reducer, X, probe_rows=DEFAULT_PROBE_ROWS):
+    """Milliseconds per point of reducer.transform, for a batch of rows and for a single row."""
+    probe = np.asarray(X[:probe_rows])
+    # Compile (or load from the cache) the numba functions first
+    reducer.transform(probe[:1])
+
+    start = time.perf_counter()
+    reducer.transform(probe)
+    batch_seconds = time.perf_counter() - start
+
+    single = probe[:5]
+    start = time.perf_counter()
+    for row in single:
+        reducer.transform(row[None, :])
+    single_seconds = (time.perf_counter() - start) / len(single)
+
+    return {
+        'transform_ms_per_point': batch_seconds / len(probe) * 1000,
+        'transform_single_ms': single_seconds * 1000,
+    }
+
+
+def evaluate_config(X, params, k=DEFAULT_SCORE_K, score_rows=DEFAULT_SCORE_ROWS, probe_rows=DEFAULT_PROBE_ROWS):
+    """
+    Fit one configuration and measure it.
+
+    Args:
+        X: Preprocessed training matrix
+        params: Overrides for UMAP_PARAMS
+
+    Returns:
+        Dict with the full UMAP parameters, the quality scores, 'fit_seconds',
+        the transform latencies and 'model_bytes'
+    """
+    start = time.perf_counter()
+    reducer, embedding = fit_umap(X, **params)
+    fit_seconds = time.perf_counter() - start
+
+    return {
+        'params': {**UMAP_PARAMS, **params},
+        **score_embedding(X, embedding, k, score_rows),
+        'fit_seconds': fit_seconds,
+        **measure_transform(reducer, X, probe_rows),
+        'model_bytes': len(pickle.dumps(reducer, protocol=pickle.HIGHEST_PROTOCOL)),
+    }
+
+
+def _init_sweep_worker(matrix_path):
+    global _worker_matrix
+    # Every fit with a random_state warns that it disables parallelism
+    warnings.filterwarnings('ignore', message='n_jobs value', category=UserWarning)
+    _worker_matrix = np.load(matrix_path, mmap_mode='r')
+
+    # Compile the numba functions on a small fit so they do not count as fit time
+    warm_rows = np.array(_worker_matrix[:200])
+    reducer, _ = fit_umap(warm_rows, n_neighbors=5, n_epochs=10)
+    reducer.transform(warm_rows[:1])
+
+
+def _evaluate_in_worker(params, k, score_rows, probe_rows):
+    # UMAP and its nearest-neighbour search want a writable, in-memory array
+    return evaluate_config(np.array(_worker_matrix), params, k, score_rows, probe_rows)
+
+
+def parameter_grid(n_neighbors, min_dist, random_state):
+    """All combinations of the swept parameters as UMAP_PARAMS overrides."""
+    return [
+        {'n_neighbors': n, 'min_dist': d, 'random_state': seed}
+        for n, d, seed in itertools.product(n_neighbors, min_dist, random_state)
+    ]
+
+
+def rank_results(results, quality_tolerance=DEFAULT_QUALITY_TOLERANCE):
+    """Sort by quality (best first, within quality_tolerance) then by fit time, and number them."""
+    def sort_key(result):
+        quality = result['quality']
+        if quality_tolerance:
+            quality = round(quality / quality_tolerance)
+        return (-quality, result['fit_seconds'])
+
+    ranked = sorted(results, key=sort_key)
+    for rank, result in enumerate(ranked, start=1):
+        result['rank'] = rank
+    return ranked
+
+
+def run_sweep(grid, workers=None, k=DEFAULT_SCORE_K, score_rows=DEFAULT_SCORE_ROWS,
+              probe_rows=DEFAULT_PROBE_ROWS, quality_tolerance=DEFAULT_QUALITY_TOLERANCE):
+    """
+    Fit and score every configuration of the grid on the training data.
+
+    Args:
+        grid: List of UMAP_PARAMS overrides (see parameter_grid)
+        workers: Processes fitting configurations in parallel (all CPUs if None)
+        k, score_rows: Neighbours and sample size of the quality scores
+        probe_rows: Rows transformed to measure latency
+        quality_tolerance: Quality differences treated as ties when ranking
+
+    Returns:
+        Report dict with the training matrix shape and the ranked results
+    """
+    _, _, X_processed, _, _ = load_training_matrix()
+    workers = workers or os.cpu_count() or 1
+    print(f"Sweeping {len(grid)} UMAP configurations on {X_processed.shape[0]:,} rows with {workers} workers")
+
+    start = time.perf_counter()
+    results = []
+    with tempfile.TemporaryDirectory(prefix='umap-sweep-') as tmp:
+        matrix_path = os.path.join(tmp, 'processed_training.npy')
+        np.save(matrix_path, np.ascontiguousarray(X_processed))
+
+        # Fresh interpreters: numba and forked processes do not mix (see map_to_umap_embeddings.py)
+        with concurrent.futures.ProcessPoolExecutor(
+            max_workers=workers, mp_context=multiprocessing.get_context('spawn'),
+            initializer=_init_sweep_worker, initargs=(matrix_path,)
+        ) as executor:
+            futures = {executor.submit(_evaluate_in_worker, params, k, score_rows, probe_rows): params
+                       for params in grid}
+            for future in concurrent.futures.as_completed(futures):
+                params = futures[future]
+                try:
+                    result = future.result()
+                except Exception as e:
+                    print(f"Configuration {params} failed: {e}")
+                    continue
+                results.append(result)
+                print(f"  {_describe(result['params'])}: quality {result['quality']:.4f}, "
+                      f"fit {result['fit_seconds']:.1f}s, transform {result['transform_ms_per_point']:.2f} ms/point")
+
+    return {
+        'created': time.strftime('%Y-%m-%dT%H:%M:%S%z'),
+        'rows': int(X_processed.shape[0]),
+        'features': int(X_processed.shape[1]),
+        'score_k': k,
+        'score_rows': min(score_rows, int(X_processed.shape[0])),
+        'probe_rows': min(probe_rows, int(X_processed.shape[0])),
+        'quality_tolerance': quality_tolerance,
+        'seconds': time.perf_counter() - start,
+        'results': rank_results(results, quality_tolerance),
+    }
+
+
+def _describe(params):
+    return f"n_neighbors={params['n_neighbors']}, min_dist={params['min_dist']}, random_state={params['random_state']}"
+
+
+def print_report(report, top=10):
+    """Print the best configurations of a sweep report as a table."""
+    print(f"\n{'rank':>4}  {'n_neighbors':>11}  {'min_dist':>8}  {'seed':>5}  {'quality':>7}  {'trust':>6}  "
+          f"{'preserv':>7}  {'fit s':>7}  {'ms/pt':>7}  {'1 pt ms':>7}  {'MB':>6}")
+    for result in report['results'][:top]:
+        params = result['params']
+        print(f"{result['rank']:>4}  {params['n_neighbors']:>11}  {params['min_dist']:>8}  "
+              f"{str(params['random_state']):>5}  {result['quality']:>7.4f}  {result['trustworthiness']:>6.4f}  "
+              f"{result['neighborhood_preservation']:>7.4f}  {result['fit_seconds']:>7.2f}  "
+              f"{result['transform_ms_per_point']:>7.3f}  {result['transform_single_ms']:>7.2f}  "
+              f"{result['model_bytes'] / 1e6:>6.2f}")
+
+
+def promote(report):
+    """Refit the report's winner and save it as the current artifact bundle."""
+    if not report['results']:
+        raise ValueError("The sweep report has no results to promote")
+    winner = report['results'][0]
+    print(f"\nPromoting {_describe(winner['params'])}")
+
+    import generate_umap_embeddings
+    generate_umap_embeddings.main(umap_params=winner['params'])
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description='Fit and rank a grid of UMAP configurations')
+    parser.add_argument('--n-neighbors', type=int, nargs='+', default=DEFAULT_N_NEIGHBORS)
+    parser.add_argument('--min-dist', type=float, nargs='+', default=DEFAULT_MIN_DIST)
+    parser.add_argument('--random-state', type=int, nargs='+', default=[UMAP_PARAMS['random_state']])
+    parser.add_argument('--workers', type=int, help='Parallel fits (all CPUs by default)')
+    parser.add_argument('--score-k', type=int, default=DEFAULT_SCORE_K, help='Neighbours compared by the scores')
+    parser.add_argument('--score-rows', type=int, default=DEFAULT_SCORE_ROWS,
+                        help='Rows sampled for the quality scores')
+    parser.add_argument('--probe-rows', type=int, default=DEFAULT_PROBE_ROWS,
+                        help='Rows transformed to measure latency')
+    parser.add_argument('--quality-tolerance', type=float, default=DEFAULT_QUALITY_TOLERANCE,
+                        help='Quality differences treated as ties, broken by fit time')
+    parser.add_argument('--report', default=DEFAULT_REPORT_PATH, help='JSON report to write')
+    parser.add_argument('--promote', action='store_true',
+                        help='Save the winner as the current artifact bundle')
+    parser.add_argument('--promote-from', metavar='REPORT',
+                        help='Promote the winner of an existing report instead of sweeping')
+    args = parser.parse_args()
+
+    if args.promote_from:
+        with open(args.promote_from) as f:
+            report = json.load(f)
+    else:
+        grid = parameter_grid(args.n_neighbors, args.min_dist, args.random_state)
+        report = run_sweep(grid, args.workers, args.score_k, args.score_rows, args.probe_rows,
+                           args.quality_tolerance)
+        with atomic_write(args.report) as f:
+            json.dump(report, f, indent=2)
+        print(f"\nSaved sweep report to '{args.report}' ({report['seconds']:.1f}s)")
+
+    print_report(report)
+    if args.promote or args.promote_from:
+        promote(report)
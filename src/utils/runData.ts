@@ -0,0 +1,39 @@
+import { CreditData } from '@/app/[locale]/(main)/dashboard/types';
+
+// Per-run output of the UMAP pipeline (src/python-server/runs/<runId>/german_credit_umap_delta.json)
+export type RunDelta = {
+	version: number;
+	training: string;
+	trainingCount: number;
+	count: number;
+	points: CreditData[];
+};
+
+// Loads the user and counterfactual points of a run (served by /api/runs/<runId>)
+export async function fetchRunDelta(runId: string): Promise<RunDelta> {
+	const response = await fetch(`/api/runs/${encodeURIComponent(runId)}`);
+	if (!response.ok) {
+		throw new Error(`Failed to load run ${runId}: ${response.status}`);
+	}
+	return response.json();
+}
+
+// Training layers are content-hashed and never change, so each one is only fetched once
+const trainingLayers = new Map<string, Promise<CreditData[]>>();
+
+// Loads the training points a run delta refers to (served by /api/training/<name>)
+export function fetchTrainingLayer(name: string): Promise<CreditData[]> {
+	let layer = trainingLayers.get(name);
+	if (!layer) {
+		layer = fetch(`/api/training/${encodeURIComponent(name)}`).then((response) => {
+			if (!response.ok) {
+				throw new Error(`Failed to load training layer ${name}: ${response.status}`);
+			}
+			return response.json();
+		});
+		// A failed request is not cached, so the next dashboard load retries it
+		layer.catch(() => trainingLayers.delete(name));
+		trainingLayers.set(name, layer);
+	}
+	return layer;
+}